@@ -1,20 +1,96 @@
-from typing import Tuple, Optional, Union
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Tuple, Optional, Union
 
 from crewai import Agent, Task, Crew, Process, LLM
 from tools.wiki_tool import search_tool as wikipedia_search_tool
-from tools.serpapi_tool import search_online
-from tools.vector_tool import search_history_vector
+from tools.serpapi_tool import TokenBucket, search_online
+from tools.vector_tool import search_history_vector, get_knowledge_base_version
+from tools.answer_cache import get_answer_cache
+from tools.semantic_cache import get_semantic_cache
+from tools.research_fanout import FANOUT_ENABLED, default_sources, fan_out
+from history import ConversationHistory, HistoryUsage, history_contexts
+from tools.chunker import approx_token_count
+from tools.telemetry import annotate, count_cache, install_crewai_hooks, span
+from tools.tenants import use_tenant
+from tools.memory_store import (
+    MEMORY_PREFETCH_ENABLED,
+    SessionMemory,
+    get_memory_storage,
+    prefetch_recall,
+    use_memory_session,
+    use_prefetched_recall,
+)
+from router import (
+    ROUTER_ENABLED,
+    ROUTE_ANSWER_CACHE,
+    ROUTE_LOCAL,
+    ROUTE_RESEARCH,
+    ROUTE_SEMANTIC_ANSWER,
+    ROUTE_SEMANTIC_RESEARCH,
+    route_question,
+    route_stats,
+)
 
+# LLM requests per minute for the whole process (all crews, sessions and workers)
+CREW_MAX_RPM = int(os.getenv("CREW_MAX_RPM", "10"))
+# Agent sets (and modes) whose idle crew templates are kept; the oldest are dropped
+CREW_TEMPLATE_MAX = int(os.getenv("CREW_TEMPLATE_MAX", "64"))
+# Threads that run streamed answers; more concurrent streams wait for a free one
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "32"))
 
-def build_llm() -> LLM:
+
+class _SharedRpmLimiter:
+    """
+    Process-wide RPM limit, plugged into CrewAI agents in place of their RPMController.
+
+    CrewAI's max_rpm counts per Crew instance, and several crew templates run
+    at once with several workers, so it would allow max_rpm per crew.
+    """
+
+    def __init__(self, max_rpm: int):
+        self.bucket = TokenBucket(max_rpm / 60.0, max_rpm)
+
+    def check_or_wait(self) -> bool:
+        self.bucket.acquire(timeout=float("inf"))
+        return True
+
+    def stop_rpm_counter(self) -> None:
+        pass
+
+
+_rpm_limiter = None
+_rpm_limiter_lock = threading.Lock()
+
+
+def get_rpm_limiter() -> Optional[_SharedRpmLimiter]:
+    global _rpm_limiter
+    if CREW_MAX_RPM <= 0:
+        return None
+    with _rpm_limiter_lock:
+        if _rpm_limiter is None:
+            _rpm_limiter = _SharedRpmLimiter(CREW_MAX_RPM)
+        return _rpm_limiter
+
+
+def build_llm(stream: bool = True) -> LLM:
     """
     Create an OpenAI-backed LLM for all agents.
 
     Make sure OPENAI_API_KEY is set in your .env file.
+    stream: request token streaming, so stream_answer() can forward tokens as
+        they arrive (kickoff still returns the full answer either way).
     """
     llm = LLM(
         model="openai/gpt-4o-mini",  # or another OpenAI model, e.g. "openai/gpt-4.1-mini"
         temperature=0.3,
+        stream=stream,
     )
     return llm
 
@@ -75,42 +151,87 @@ def build_agents(llm: LLM) -> Tuple[Agent, Agent, Agent]:
         max_iter=2,  # Limit iterations for efficiency
     )
 
+    limiter = get_rpm_limiter()
+    if limiter is not None:
+        for agent in (tutor_agent, research_agent, quiz_agent):
+            agent.set_rpm_controller(limiter)
+
     return tutor_agent, research_agent, quiz_agent
 
 
-def answer_question(
-    question: str,
+# ---- Reusable crew templates ----
+# Tasks are written as templates ({question}, {context}, ...) and filled in per
+# question through crew.kickoff(inputs=...), so Task/Crew objects and the
+# memory backend are built once instead of on every question.
+
+RESEARCH_DESCRIPTION = (
+    "{research_context}{evidence}"
+    "Research the question efficiently: '{question}'. "
+    "{research_instructions}"
+    "Summarize findings in 5-6 concise bullet points (max 20 words each)."
+)
+
+QUIZ_DESCRIPTION = (
+    "{context}{research}"
+    "Using the researcher's summary, create an educational quiz about the topic. "
+    "Generate 5 multiple-choice questions with 4 options each (A, B, C, D). "
+    "Ensure questions are clear and test understanding. "
+    "Topic: '{question}'. "
+    "Format: List questions 1-5, then provide answers separately at the end."
+)
+
+TUTOR_GOALS = {
+    "Summary": (
+        "Using the researcher's summary, provide a concise summary. "
+        "Highlight 4-5 key points in bullet format."
+    ),
+    "Explanation": (
+        "Using the researcher's summary, explain the topic clearly for beginners. "
+        "Use simple language and define difficult terms."
+    ),
+    "Regular answer": (
+        "Using the researcher's summary, answer the question directly and clearly. "
+        "Keep it concise but informative."
+    ),
+}
+
+_shared_memory = None
+_shared_memory_lock = threading.Lock()
+# (mode, with_research, agent ids) -> idle crews, least recently used first
+_crew_templates: "OrderedDict[tuple, List[Crew]]" = OrderedDict()
+_crew_templates_lock = threading.Lock()
+
+
+def get_shared_memory(llm):
+    """
+    Return the process-wide CrewAI memory, shared by every crew template.
+
+    Equivalent to Crew(memory=True), but the storage and embedder are
+    initialized once per process instead of once per question, and memories
+    go to the bounded, session-scoped store in tools/memory_store.py.
+    """
+    global _shared_memory
+    with _shared_memory_lock:
+        if _shared_memory is None:
+            _shared_memory = SessionMemory(llm=llm, root_scope="/crew/ww2-tutor", storage=get_memory_storage())
+        return _shared_memory
+
+
+def build_crew(
+    mode: str,
     tutor_agent: Agent,
     research_agent: Agent,
     quiz_agent: Agent,
-    history: Optional[str] = None,
-    mode: str = "Regular answer",
-) -> str:
+    with_research: bool = True,
+) -> Crew:
     """
-    Run an efficient crew to answer a single user question.
-
-    - ResearchAgent uses tools efficiently (Vector DB + Wikipedia + Online)
-    - TutorAgent or QuizAgent produces the final output based on mode
+    Build the crew for one mode from the task templates.
 
-    history: a short text representation of the recent conversation.
-    mode: one of ["Regular answer", "Summary", "Explanation", "Quiz"].
+    with_research=False builds only the tutor/quiz task, used when the research
+    summary is already known (semantic cache or local-notes route).
     """
-
-    # Optional conversation context prefix
-    context_part = ""
-    if history:
-        context_part = f"Conversation so far:\n{history}\n\n"
-
-    # ---- Research task (optimized) ----
     research_task = Task(
-        description=(
-            context_part +
-            "Research the question efficiently: "
-            f"'{question}'. "
-            "First check the 'search_history_vector' tool for local notes. "
-            "If insufficient, use Wikipedia or online search. "
-            "Summarize findings in 5-6 concise bullet points (max 20 words each)."
-        ),
+        description=RESEARCH_DESCRIPTION,
         expected_output=(
             "A concise bullet-point summary (5-6 points) with the most relevant facts."
         ),
@@ -121,59 +242,477 @@ def answer_question(
     if mode == "Quiz":
         # Use dedicated QuizAgent
         output_task = Task(
-            description=(
-                context_part +
-                "Using the researcher's summary, create an educational quiz about the topic. "
-                "Generate 5 multiple-choice questions with 4 options each (A, B, C, D). "
-                "Ensure questions are clear and test understanding. "
-                f"Topic: '{question}'. "
-                "Format: List questions 1-5, then provide answers separately at the end."
-            ),
+            description=QUIZ_DESCRIPTION,
             expected_output=(
                 "5 multiple-choice questions with 4 options each, followed by correct answers."
             ),
             agent=quiz_agent,
         )
-        agents_list = [research_agent, quiz_agent]
+        output_agent = quiz_agent
     else:
         # Use TutorAgent for other modes
-        if mode == "Summary":
-            tutor_goal = (
-                "Using the researcher's summary, provide a concise summary. "
-                "Highlight 4-5 key points in bullet format."
-            )
-        elif mode == "Explanation":
-            tutor_goal = (
-                "Using the researcher's summary, explain the topic clearly for beginners. "
-                "Use simple language and define difficult terms."
-            )
-        else:  # "Regular answer"
-            tutor_goal = (
-                "Using the researcher's summary, answer the question directly and clearly. "
-                "Keep it concise but informative."
-            )
-
+        tutor_goal = TUTOR_GOALS.get(mode, TUTOR_GOALS["Regular answer"])
         output_task = Task(
-            description=(
-                context_part +
-                tutor_goal +
-                f" Question: '{question}'. "
-            ),
+            description="{context}{research}" + tutor_goal + " Question: '{question}'. ",
             expected_output=(
                 "Clear, concise response matching the selected mode."
             ),
             agent=tutor_agent,
         )
-        agents_list = [research_agent, tutor_agent]
+        output_agent = tutor_agent
+
+    if with_research:
+        agents_list = [research_agent, output_agent]
+        tasks_list = [research_task, output_task]
+    else:
+        agents_list = [output_agent]
+        tasks_list = [output_task]
 
-    crew = Crew(
+    return Crew(
         agents=agents_list,
-        tasks=[research_task, output_task],
+        tasks=tasks_list,
         process=Process.sequential,
         verbose=True,
-        max_rpm=10,  # Limit requests per minute
-        memory=True,  # Required for NLP challenge: enables Long Term Memory / Short Term Memory
+        # Requests per minute are limited process-wide by the agents' shared limiter (CREW_MAX_RPM)
+        memory=get_shared_memory(output_agent.llm),  # Required for NLP challenge: Long Term / Short Term Memory
     )
 
-    result = crew.kickoff()
-    return str(result)
\ No newline at end of file
+
+@contextmanager
+def crew_template(
+    mode: str,
+    tutor_agent: Agent,
+    research_agent: Agent,
+    quiz_agent: Agent,
+    with_research: bool = True,
+) -> Iterator[Crew]:
+    """
+    Check out an idle crew for this mode, building one when none is free.
+
+    Crews keep per-run state during kickoff, so a template is used by one
+    question at a time and returned to the pool afterwards, whichever thread
+    runs the question. Idle templates keep their agents alive, so the agent
+    ids in the key cannot be reused by other agents.
+    """
+    key = (mode, with_research, id(tutor_agent), id(research_agent), id(quiz_agent))
+    with _crew_templates_lock:
+        idle = _crew_templates.get(key)
+        crew = idle.pop() if idle else None
+    if crew is None:
+        crew = build_crew(mode, tutor_agent, research_agent, quiz_agent, with_research)
+    try:
+        yield crew
+    finally:
+        with _crew_templates_lock:
+            _crew_templates.setdefault(key, []).append(crew)
+            _crew_templates.move_to_end(key)
+            while len(_crew_templates) > CREW_TEMPLATE_MAX:
+                _crew_templates.popitem(last=False)
+
+
+USAGE_FIELDS = ("llm_calls", "prompt_tokens", "completion_tokens", "total_tokens")
+
+
+def llm_usage(agents) -> dict:
+    """
+    Cumulative token usage of the distinct LLMs behind agents.
+
+    CrewOutput.token_usage adds up each agent's LLM totals since the LLM was
+    created, counting a shared LLM once per agent; diffing this before and
+    after a kickoff gives the usage of that run instead. When several threads
+    share one LLM the difference also includes their overlapping calls.
+    """
+    totals = dict.fromkeys(USAGE_FIELDS, 0)
+    seen = set()
+    for agent in agents:
+        llm = agent.llm
+        if id(llm) in seen or not hasattr(llm, "get_token_usage_summary"):
+            continue
+        seen.add(id(llm))
+        summary = llm.get_token_usage_summary()
+        totals["llm_calls"] += summary.successful_requests
+        totals["prompt_tokens"] += summary.prompt_tokens
+        totals["completion_tokens"] += summary.completion_tokens
+        totals["total_tokens"] += summary.total_tokens
+    return totals
+
+
+def usage_delta(before: dict, after: dict) -> dict:
+    return {name: after[name] - before[name] for name in USAGE_FIELDS}
+
+
+def answer_question(
+    question: str,
+    tutor_agent: Agent,
+    research_agent: Agent,
+    quiz_agent: Agent,
+    history: Optional[Union[str, ConversationHistory]] = None,
+    mode: str = "Regular answer",
+    use_cache: bool = True,
+    use_router: bool = ROUTER_ENABLED,
+    on_event: Optional[Callable[[dict], None]] = None,
+    tenant: Optional[str] = None,
+    session_id: Optional[str] = None,
+) -> str:
+    """
+    Run an efficient crew to answer a single user question.
+
+    - ResearchAgent uses tools efficiently (Vector DB + Wikipedia + Online)
+    - TutorAgent or QuizAgent produces the final output based on mode
+
+    history: the conversation so far, as a ConversationHistory (token-budgeted,
+        older turns summarized) or as plain text (only the most recent lines
+        that fit the budget are used).
+    mode: one of ["Regular answer", "Summary", "Explanation", "Quiz"].
+    use_cache: return a previously generated answer for the same question, mode
+        and knowledge-base version without calling the LLM (only for questions
+        asked without conversation history). Near-duplicate
+        questions reuse a cached answer or research summary (semantic cache,
+        also skipped when there is history).
+    use_router: search the local notes first and skip the ResearchAgent when
+        they are confident enough (see router.py).
+    on_event: optional callback receiving {"type": "progress", "stage", "message"}
+        dicts as the request moves through its stages (used by stream_answer),
+        one {"type": "history", "sent_tokens", "baseline_tokens",
+        "saved_tokens"} dict with the prompt tokens spent on history, and a
+        final {"type": "usage", "route", "llm_calls", "prompt_tokens",
+        "completion_tokens", "total_tokens"} dict.
+    tenant: class or teacher whose uploaded documents are searched alongside
+        the shared base corpus (see tools/tenants.py). Cached answers are
+        never shared between tenants.
+    session_id: chat session (or student) whose crew memories are saved and
+        recalled; memories of other sessions are never searched.
+
+    Each call is traced as a request span (see tools/telemetry.py).
+    """
+    install_crewai_hooks()
+    with use_tenant(tenant), use_memory_session(session_id), \
+            span("answer_question", "request", mode=mode, tenant=tenant):
+        return _answer_question(
+            question,
+            tutor_agent,
+            research_agent,
+            quiz_agent,
+            history=history,
+            mode=mode,
+            use_cache=use_cache,
+            use_router=use_router,
+            on_event=on_event,
+        )
+
+
+def _answer_question(
+    question: str,
+    tutor_agent: Agent,
+    research_agent: Agent,
+    quiz_agent: Agent,
+    history: Optional[Union[str, ConversationHistory]],
+    mode: str,
+    use_cache: bool,
+    use_router: bool,
+    on_event: Optional[Callable[[dict], None]],
+) -> str:
+    start = time.perf_counter()
+
+    def progress(stage: str, message: str) -> None:
+        if on_event is not None:
+            on_event({"type": "progress", "stage": stage, "message": message})
+
+    def report_usage(route_name: str, token_usage: Optional[dict] = None) -> None:
+        annotate(route=route_name, **(token_usage or {}))
+        if on_event is not None:
+            on_event({"type": "usage", "route": route_name, **(token_usage or dict.fromkeys(USAGE_FIELDS, 0))})
+
+    progress("cache", "Checking previous answers...")
+
+    # ---- Fast path: answer cache ----
+    # Follow-ups ("tell me more") depend on the conversation, which is not part
+    # of the cache key, so only questions without history are cached
+    cache = get_answer_cache() if use_cache and not history else None
+    semantic_cache = get_semantic_cache() if use_cache and not history else None
+    kb_version = get_knowledge_base_version() if use_cache else None
+    if cache is not None:
+        cached = cache.get(question, mode, kb_version)
+        count_cache("answer", "hit" if cached is not None else "miss")
+        if cached is not None:
+            route_stats.record(ROUTE_ANSWER_CACHE, time.perf_counter() - start, mode=mode)
+            report_usage(ROUTE_ANSWER_CACHE)
+            return cached
+
+    # ---- Semantic cache: paraphrases reuse the answer or skip research ----
+    research_summary = None
+    question_vector = None
+    route = ROUTE_RESEARCH
+    if semantic_cache is not None:
+        question_vector = semantic_cache.embed(question)
+        hit = semantic_cache.lookup(question, mode, kb_version, vector=question_vector)
+        if hit is None:
+            count_cache("semantic", "miss")
+        else:
+            if hit.answer is not None:
+                count_cache("semantic", "hit_answer")
+                route_stats.record(ROUTE_SEMANTIC_ANSWER, time.perf_counter() - start, mode=mode)
+                report_usage(ROUTE_SEMANTIC_ANSWER)
+                return hit.answer
+            if hit.research_summary is not None:
+                count_cache("semantic", "hit_research")
+                research_summary = hit.research_summary
+                route = ROUTE_SEMANTIC_RESEARCH
+            else:
+                # Similar question, but its entry has only an answer that is not close enough to reuse
+                count_cache("semantic", "hit")
+
+    # ---- Crew memory lookup, overlapped with routing and research ----
+    # The agents would otherwise each search the memory store before their task
+    memory = get_shared_memory(tutor_agent.llm)
+    prefetched_memories = prefetch_recall(memory, question) if MEMORY_PREFETCH_ENABLED else None
+
+    # ---- Retrieval-first routing: answer from local notes when confident ----
+    local_passages = None
+    if research_summary is None and use_router:
+        progress("route", "Searching local history notes...")
+        with span("route", "stage") as route_span:
+            decision = route_question(question)
+            if route_span is not None:
+                route_span.set(decision=decision.route, reason=decision.reason)
+        if decision.route == ROUTE_LOCAL:
+            research_summary = decision.context()
+            route = ROUTE_LOCAL
+        local_passages = decision.passages
+
+    # Optional conversation context prefix; the research task gets a smaller,
+    # question-focused slice than the tutor/quiz task
+    research_history, answer_history, baseline_history = history_contexts(history, question)
+    context_part = f"Conversation so far:\n{answer_history}\n\n" if answer_history else ""
+    research_context_part = f"Conversation so far:\n{research_history}\n\n" if research_history else ""
+
+    research_part = ""
+    if research_summary:
+        research_part = f"Researcher's summary:\n{research_summary}\n\n"
+
+    # ---- Research stage ----
+    # Skipped when the semantic cache or the router already provide the facts.
+    # Otherwise all research sources are queried concurrently and the agent
+    # gets the merged evidence.
+    evidence_part = ""
+    research_instructions = (
+        "First check the 'search_history_vector' tool for local notes. "
+        "If insufficient, use Wikipedia or online search. "
+    )
+    if not research_summary and FANOUT_ENABLED:
+        progress("research", "Researching notes, Wikipedia and the web...")
+        with span("research.fanout", "stage") as fanout_span:
+            # The router already searched the local notes; reuse its passages
+            bundle = fan_out(question, default_sources(local_passages))
+            if fanout_span is not None:
+                fanout_span.set(
+                    sources=bundle.sources, timed_out=bundle.timed_out, failed=bundle.failed, skipped=bundle.skipped
+                )
+        if bundle.evidence:
+            evidence_part = f"Evidence gathered from {', '.join(bundle.sources)}:\n{bundle.to_text()}\n\n"
+            research_instructions = (
+                "Base your answer on the evidence above. "
+                "Only call a tool if an essential fact is missing. "
+            )
+
+    # Previously the verbatim history was sent to both tasks
+    history_tasks = 1 if research_summary else 2
+    history_usage = HistoryUsage(
+        sent_tokens=approx_token_count(context_part) + (0 if research_summary else approx_token_count(research_context_part)),
+        baseline_tokens=approx_token_count(baseline_history) * history_tasks if baseline_history else 0,
+    )
+    if history:
+        route_stats.record_history(history_usage.sent_tokens, history_usage.baseline_tokens)
+    if on_event is not None:
+        on_event({
+            "type": "history",
+            "sent_tokens": history_usage.sent_tokens,
+            "baseline_tokens": history_usage.baseline_tokens,
+            "saved_tokens": history_usage.saved_tokens,
+        })
+
+    inputs = {
+        "question": question,
+        "context": context_part,
+        "research_context": research_context_part,
+        "research": research_part,
+        "evidence": evidence_part,
+        "research_instructions": research_instructions,
+    }
+
+    progress("answer", "Researching and writing the answer..." if not research_summary else "Writing the answer...")
+    # ---- Reuse a prebuilt crew for this mode; per-question text goes in via inputs ----
+    with crew_template(mode, tutor_agent, research_agent, quiz_agent, with_research=not research_summary) as crew:
+        usage_before = llm_usage(crew.agents)
+        with use_prefetched_recall(prefetched_memories), \
+                span("crew.kickoff", "stage", with_research=not research_summary):
+            result = crew.kickoff(inputs=inputs)
+        token_usage = usage_delta(usage_before, llm_usage(crew.agents))
+    answer = str(result)
+
+    route_stats.record(
+        route,
+        time.perf_counter() - start,
+        llm_calls=token_usage["llm_calls"],
+        mode=mode,
+        history_tokens=history_usage.sent_tokens,
+        history_tokens_saved=history_usage.saved_tokens,
+    )
+    report_usage(route, token_usage)
+
+    if cache is not None:
+        cache.set(question, mode, kb_version, answer)
+
+    if semantic_cache is not None:
+        if route == ROUTE_RESEARCH and result.tasks_output:
+            research_summary = result.tasks_output[0].raw
+        semantic_cache.add(
+            question,
+            mode,
+            kb_version,
+            research_summary=research_summary,
+            answer=answer,
+            vector=question_vector,
+        )
+        semantic_cache.save()
+
+    return answer
+
+
+# ---- Streaming ----
+# LLM stream chunks are emitted on CrewAI's global event bus from the thread
+# running the crew. The handler is registered once; each streaming request sets
+# a context-local sink so chunks end up in the right queue.
+
+_stream_sink: contextvars.ContextVar = contextvars.ContextVar("stream_sink", default=None)
+_stream_handler_registered = False
+_stream_handler_lock = threading.Lock()
+_stream_executor = None
+_stream_executor_lock = threading.Lock()
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+
+def _on_stream_chunk(source, event) -> None:
+    sink = _stream_sink.get()
+    if sink is not None:
+        sink(event)
+
+
+def _ensure_stream_handler() -> None:
+    global _stream_handler_registered
+    with _stream_handler_lock:
+        if not _stream_handler_registered:
+            from crewai.events import LLMStreamChunkEvent, crewai_event_bus
+            crewai_event_bus.register_handler(LLMStreamChunkEvent, _on_stream_chunk)
+            _stream_handler_registered = True
+
+
+def _get_stream_executor() -> ThreadPoolExecutor:
+    """
+    Long-lived threads for the crews behind stream_answer, instead of a new
+    thread per question; a bounded number of streams run at once.
+    """
+    global _stream_executor
+    with _stream_executor_lock:
+        if _stream_executor is None:
+            _stream_executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="stream_answer")
+        return _stream_executor
+
+
+class _FinalAnswerFilter:
+    """
+    Pass through only the text after "Final Answer:" in a ReAct-style stream.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.started = False
+
+    def feed(self, chunk: str) -> str:
+        if self.started:
+            return chunk
+        self.buffer += chunk
+        idx = self.buffer.find(FINAL_ANSWER_MARKER)
+        if idx == -1:
+            return ""
+        self.started = True
+        return self.buffer[idx + len(FINAL_ANSWER_MARKER):].lstrip()
+
+
+def stream_answer(
+    question: str,
+    tutor_agent: Agent,
+    research_agent: Agent,
+    quiz_agent: Agent,
+    history: Optional[Union[str, ConversationHistory]] = None,
+    mode: str = "Regular answer",
+    **kwargs,
+) -> Iterator[dict]:
+    """
+    Streaming variant of answer_question.
+
+    Yields dicts:
+    - {"type": "progress", "stage", "message"} while caches, routing and research run
+    - {"type": "history", "sent_tokens", "baseline_tokens", "saved_tokens"} once
+      the prompt is assembled (not sent for cached answers)
+    - {"type": "usage", ...} with the route and token usage (see answer_question)
+    - {"type": "token", "text"} for the final agent's answer as it is generated
+    - {"type": "done", "answer", "ttft", "elapsed"} at the end (times in seconds)
+    Errors raised by answer_question are re-raised from the generator.
+    """
+    _ensure_stream_handler()
+
+    events: "queue.Queue[dict]" = queue.Queue()
+    output_roles = {tutor_agent.role, quiz_agent.role}
+    final_filter = _FinalAnswerFilter()
+
+    def sink(event) -> None:
+        if getattr(event, "agent_role", None) not in output_roles or not event.chunk:
+            return
+        text = final_filter.feed(event.chunk)
+        if text:
+            events.put({"type": "token", "text": text})
+
+    def worker() -> None:
+        token = _stream_sink.set(sink)
+        try:
+            answer = answer_question(
+                question,
+                tutor_agent,
+                research_agent,
+                quiz_agent,
+                history=history,
+                mode=mode,
+                on_event=events.put,
+                **kwargs,
+            )
+            events.put({"type": "_result", "answer": answer})
+        except Exception as e:
+            events.put({"type": "_error", "error": e})
+        finally:
+            _stream_sink.reset(token)
+
+    start = time.perf_counter()
+    ttft = None
+    streamed = False
+    # A fresh context per question, as a new thread would have
+    _get_stream_executor().submit(contextvars.Context().run, worker)
+
+    while True:
+        event = events.get()
+        if event["type"] == "_error":
+            raise event["error"]
+        if event["type"] == "_result":
+            answer = event["answer"]
+            if not streamed:
+                # Cache hits and non-streaming LLMs deliver the answer in one piece
+                ttft = time.perf_counter() - start
+                yield {"type": "token", "text": answer}
+            route_stats.record_ttft(ttft)
+            yield {"type": "done", "answer": answer, "ttft": ttft, "elapsed": time.perf_counter() - start}
+            return
+        if event["type"] == "token" and not streamed:
+            streamed = True
+            ttft = time.perf_counter() - start
+        yield event
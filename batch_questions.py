@@ -0,0 +1,179 @@
+"""
+Answer a list of questions offline, e.g. for worksheets and quizzes.
+
+Reads questions from JSONL ({"question": ..., "mode": ...} per line) or CSV
+(columns question and mode), drops duplicate (question, mode) pairs and
+runs answer_question on a pool of worker threads. All workers share the
+process-wide LLM rate limit (CREW_MAX_RPM). Every result is appended to the
+output JSONL as soon as it is ready, so the output doubles as the checkpoint:
+rerunning the same command skips questions that were already answered and
+retries the ones that failed.
+
+Usage:
+    python batch_questions.py questions.csv -o answers.jsonl [--workers 4] [--mode Quiz]
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from tools.answer_cache import normalize_question
+
+MODES = ["Regular answer", "Summary", "Explanation", "Quiz"]
+
+
+def read_questions(path: str, default_mode: str = "Regular answer") -> List[dict]:
+    """
+    Return [{"row", "question", "mode"}] from a .jsonl or .csv file.
+    """
+    rows = []
+    suffix = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if suffix == ".csv":
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for row_number, record in enumerate(records, 1):
+            question = (record.get("question") or "").strip()
+            if not question:
+                continue
+            mode = (record.get("mode") or "").strip() or default_mode
+            if mode not in MODES:
+                raise ValueError(f"Row {row_number}: unknown mode {mode!r}, expected one of {MODES}")
+            rows.append({"row": row_number, "question": question, "mode": mode})
+    return rows
+
+
+def item_key(question: str, mode: str) -> str:
+    return f"{mode}|{normalize_question(question)}"
+
+
+def dedupe(rows: List[dict]) -> List[dict]:
+    """
+    Merge rows with the same (normalized question, mode); keeps their row numbers.
+    """
+    items: Dict[str, dict] = {}
+    for row in rows:
+        key = item_key(row["question"], row["mode"])
+        if key in items:
+            items[key]["rows"].append(row["row"])
+        else:
+            items[key] = {"key": key, "question": row["question"], "mode": row["mode"], "rows": [row["row"]]}
+    return list(items.values())
+
+
+def load_done(output_path: str) -> set:
+    """
+    Keys of items already answered successfully in a previous run.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written line from an interrupted run
+            if record.get("status") == "ok":
+                done.add(record["key"])
+    return done
+
+
+_worker_agents = threading.local()
+
+
+def answer_item(item: dict, build_llm, tenant: Optional[str] = None) -> dict:
+    """
+    Worker: answer one item with this thread's own agents.
+    """
+    from agents import USAGE_FIELDS, answer_question, build_agents
+
+    # Agents hold per-run state, and a private LLM keeps per-item token usage exact,
+    # so every worker thread gets its own set; the RPM limit is still shared
+    agents = getattr(_worker_agents, "agents", None)
+    if agents is None:
+        agents = _worker_agents.agents = build_agents(build_llm(stream=False))
+
+    usage = {}
+
+    def on_event(event: dict) -> None:
+        if event["type"] == "usage":
+            usage.update(event)
+
+    start = time.perf_counter()
+    record = {"key": item["key"], "rows": item["rows"], "question": item["question"], "mode": item["mode"]}
+    try:
+        answer = answer_question(item["question"], *agents, mode=item["mode"], on_event=on_event, tenant=tenant)
+        record.update(status="ok", answer=answer)
+    except Exception as e:
+        record.update(status="error", error=str(e))
+    record["latency_s"] = round(time.perf_counter() - start, 3)
+    record["route"] = usage.get("route")
+    record["token_usage"] = {
+        name: usage.get(name, 0) for name in USAGE_FIELDS
+    }
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions in batch.")
+    parser.add_argument("input", help="Questions as .jsonl or .csv (fields: question, mode).")
+    parser.add_argument("-o", "--output", default=None, help="Output JSONL (default: <input>.answers.jsonl).")
+    parser.add_argument("--workers", type=int, default=4, help="Questions answered concurrently.")
+    parser.add_argument("--mode", default="Regular answer", choices=MODES, help="Mode for rows without one.")
+    parser.add_argument("--restart", action="store_true", help="Ignore previous results in the output file.")
+    parser.add_argument("--tenant", default=None, help="Class whose uploaded documents are searched too.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    from agents import CREW_MAX_RPM, build_llm
+
+    output_path = args.output or os.path.splitext(args.input)[0] + ".answers.jsonl"
+    rows = read_questions(args.input, args.mode)
+    items = dedupe(rows)
+    if args.restart and os.path.exists(output_path):
+        os.remove(output_path)
+    done = load_done(output_path)
+    todo = [item for item in items if item["key"] not in done]
+    print(
+        f"{len(rows)} rows, {len(items)} unique questions, {len(items) - len(todo)} already answered, "
+        f"{len(todo)} to do ({args.workers} workers, {CREW_MAX_RPM} LLM requests/min)."
+    )
+
+    start = time.perf_counter()
+    completed, failures, total_tokens = 0, 0, 0
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(answer_item, item, build_llm, args.tenant) for item in todo]
+        for future in as_completed(futures):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            completed += 1
+            total_tokens += record["token_usage"]["total_tokens"]
+            if record["status"] != "ok":
+                failures += 1
+                print(f"[ERROR] row {record['rows'][0]}: {record['error']}")
+            else:
+                print(
+                    f"[{completed}/{len(todo)}] {record['mode']}: {record['question'][:60]} "
+                    f"({record['latency_s']:.1f}s, {record['route']})"
+                )
+
+    elapsed = time.perf_counter() - start
+    print("\nSummary")
+    print(f"  questions: {completed - failures} answered, {failures} failed, {len(items) - len(todo)} resumed")
+    print(f"  tokens:    {total_tokens}")
+    print(f"  elapsed:   {elapsed:.1f}s")
+    print(f"  output:    {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compare chunking strategies on index size, ingest time and retrieval recall.
+
+Usage:
+    python -m benchmarks.bench_chunking [--corpus data/ww2_history_notes.txt ...] [--k 3]
+
+Each strategy is indexed into a throwaway in-memory Chroma collection with the
+same DefaultEmbeddingFunction as the real knowledge base. Recall@k is the share
+of questions in retrieval_eval.jsonl whose expected text appears in one of
+the top-k chunks.
+"""
+import argparse
+import json
+import os
+import time
+
+import chromadb
+from chromadb.utils import embedding_functions
+
+from tools.chunker import CHUNKERS, approx_token_count, chunk_lines, get_chunker
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS = [os.path.join(BASE_DIR, "data", "ww2_history_notes.txt")]
+DEFAULT_EVAL = os.path.join(os.path.dirname(__file__), "retrieval_eval.jsonl")
+
+
+def load_eval(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_strategy(name, corpus, eval_set, k, ef, client):
+    chunker = get_chunker(name)
+    start = time.perf_counter()
+
+    chunks = []
+    for path in corpus:
+        with open(path, "r", encoding="utf-8") as f:
+            chunks.extend((os.path.basename(path), c) for c in chunk_lines(f, chunker))
+
+    collection = client.create_collection(name=f"bench_{name}", embedding_function=ef)
+    collection.add(
+        ids=[str(i) for i in range(len(chunks))],
+        documents=[c.text for _, c in chunks],
+        metadatas=[c.metadata(source) for source, c in chunks],
+    )
+    ingest_seconds = time.perf_counter() - start
+
+    hits = 0
+    query_start = time.perf_counter()
+    for item in eval_set:
+        results = collection.query(query_texts=[item["question"]], n_results=min(k, len(chunks)))
+        if any(item["expected"] in doc for doc in results["documents"][0]):
+            hits += 1
+    query_seconds = time.perf_counter() - query_start
+
+    tokens = [approx_token_count(c.text) for _, c in chunks]
+    client.delete_collection(name=f"bench_{name}")
+    return {
+        "strategy": name,
+        "chunks": len(chunks),
+        "avg_tokens": sum(tokens) / len(tokens) if tokens else 0,
+        "max_tokens": max(tokens) if tokens else 0,
+        # 384-dim float32 vectors plus the stored text
+        "index_bytes": len(chunks) * 384 * 4 + sum(len(c.text.encode("utf-8")) for _, c in chunks),
+        "ingest_seconds": ingest_seconds,
+        "query_ms": query_seconds / len(eval_set) * 1000 if eval_set else 0,
+        f"recall@{k}": hits / len(eval_set) if eval_set else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunking strategies.")
+    parser.add_argument("--corpus", nargs="+", default=DEFAULT_CORPUS, help="Text/markdown files to index.")
+    parser.add_argument("--eval", default=DEFAULT_EVAL, help="JSONL with 'question' and 'expected' fields.")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--strategies", nargs="+", default=sorted(CHUNKERS))
+    args = parser.parse_args()
+
+    eval_set = load_eval(args.eval)
+    ef = embedding_functions.DefaultEmbeddingFunction()
+    client = chromadb.EphemeralClient()
+
+    for name in args.strategies:
+        report = run_strategy(name, args.corpus, eval_set, args.k, ef, client)
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Microbenchmark of per-request crew setup overhead, with the LLM stubbed out.
+
+Usage:
+    python -m benchmarks.bench_crew_setup [--requests 50]
+
+"before" builds Task and Crew objects (with a fresh memory backend) for every
+request, like answer_question used to. "after" answers the same number of
+questions through stream_answer, the path the CLI, Streamlit and the server
+use, with the fake LLM and tools from benchmarks/fakes.py, and times every
+crew that has to be built along the way. With the template pool only the
+first question per mode builds one. Nothing in data/ is touched.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+from crewai import Crew, Process
+
+import agents
+from agents import build_agents, build_crew, stream_answer
+from benchmarks.bench_chunking import DEFAULT_CORPUS
+from benchmarks.bench_e2e import fixture_chunks, fixture_questions, install_fakes, load_sentences, \
+    use_in_memory_knowledge_base
+from benchmarks.fakes import HashingEmbeddingFunction, build_fake_llm
+
+MODES = ["Regular answer", "Summary", "Explanation", "Quiz"]
+
+
+def per_request_setup(tutor_agent, research_agent, quiz_agent, mode):
+    crew = build_crew(mode, tutor_agent, research_agent, quiz_agent)
+    # Old behaviour: a new Crew(memory=True) per question
+    return Crew(agents=crew.agents, tasks=crew.tasks, process=Process.sequential, max_rpm=10, memory=True)
+
+
+def measure(fn, requests):
+    timings = []
+    for i in range(requests):
+        start = time.perf_counter()
+        fn(MODES[i % len(MODES)])
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def streamed_setup(tutor_agent, research_agent, quiz_agent, requests, sentences):
+    """
+    Crew setup time per question when answering through stream_answer.
+    """
+    use_in_memory_knowledge_base(HashingEmbeddingFunction(), "bench_crew_setup")
+    from tools.vector_tool import ingest_chunks
+    ingest_chunks(fixture_chunks(sentences, 200), "fixture.txt")
+    questions = fixture_questions(sentences)
+
+    builds = []
+
+    def timed_build(*args, **kwargs):
+        start = time.perf_counter()
+        crew = build_crew(*args, **kwargs)
+        builds.append((time.perf_counter() - start) * 1000)
+        return crew
+
+    agents.build_crew = timed_build
+    timings = []
+    try:
+        for i in range(requests):
+            before = sum(builds)
+            for _ in stream_answer(questions[i % len(questions)], tutor_agent, research_agent, quiz_agent,
+                                   mode=MODES[i % len(MODES)], use_cache=False):
+                pass
+            timings.append(sum(builds) - before)
+    finally:
+        agents.build_crew = build_crew
+    return timings, len(builds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-request crew setup overhead.")
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    # Measure setup, not the process-wide LLM rate limit
+    agents.CREW_MAX_RPM = 0
+    sentences = load_sentences(DEFAULT_CORPUS)
+    with tempfile.TemporaryDirectory(prefix="bench_crew_setup_") as tmp_dir:
+        # Before any crew exists, so the shared memory uses the temporary store too
+        install_fakes(argparse.Namespace(tool_latency=0.0, vision_latency=0.0), sentences, tmp_dir)
+        tutor_agent, research_agent, quiz_agent = build_agents(build_fake_llm())
+
+        before = measure(lambda m: per_request_setup(tutor_agent, research_agent, quiz_agent, m), args.requests)
+        after, built = streamed_setup(tutor_agent, research_agent, quiz_agent, args.requests, sentences)
+
+    for name, timings in (("before (per-request)", before), ("after (stream_answer)", after)):
+        print(
+            f"{name:22s} mean {statistics.mean(timings):8.3f} ms   "
+            f"p50 {statistics.median(timings):8.3f} ms   max {max(timings):8.3f} ms"
+        )
+    print(f"crews built for {args.requests} streamed questions: {built}")
+
+
+if __name__ == "__main__":
+    main()
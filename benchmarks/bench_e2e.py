@@ -0,0 +1,393 @@
+"""
+End-to-end benchmark suite with every remote service replaced by a local fake.
+
+Usage:
+    python -m benchmarks.bench_e2e [--scales 1000 10000 100000] [--queries 200]
+        [--requests 10] [--embedder hashing|onnx] [-o benchmark_results.json]
+
+Sections:
+- ingestion: chunks/s through ingest_chunks (embed, upsert, BM25 index) for
+  each corpus size in --scales
+- retrieval: p50/p95/p99 latency of retrieve() at each of those sizes
+- answer: answer_question latency per mode and route, with the fake LLM,
+  Wikipedia and SerpAPI (benchmarks/fakes.py) and no caches
+- vision: analyze_images throughput and cache hit rate with the fake vision
+  backend, for new images, exact re-uploads and re-encoded copies
+- memory: process RSS after every section
+
+The fixture corpus is generated deterministically from
+data/ww2_history_notes.txt, and the hashing embedder has the same dimension
+as the ONNX model, so runs with the same arguments can be compared by diffing
+their JSON output. Pass --embedder onnx to include the real embedding cost in
+the ingestion numbers. A 1000000-chunk scale works but needs several GB of RAM.
+
+Nothing in data/ is touched: collections are in memory and caches, logs and
+traces are redirected to a temporary directory.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import tempfile
+import time
+import uuid
+
+from benchmarks.bench_chunking import DEFAULT_CORPUS, DEFAULT_EVAL, load_eval
+from benchmarks.fakes import (
+    FakeWikipedia,
+    HashingEmbeddingFunction,
+    build_fake_google_search,
+    build_fake_llm,
+    build_fake_vision_backend,
+)
+
+MODES = ["Regular answer", "Summary", "Explanation", "Quiz"]
+
+
+def percentiles(timings_ms):
+    """
+    p50/p95/p99/max of a list of latencies in milliseconds.
+    """
+    if not timings_ms:
+        return {"n": 0}
+    ordered = sorted(timings_ms)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.mean(ordered), 3),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def rss_mb():
+    """
+    Current and peak resident set size of this process, in MB.
+    """
+    current = None
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        peak = None
+    return {
+        "rss_mb": round(current, 1) if current is not None else None,
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+    }
+
+
+def load_sentences(corpus):
+    sentences = []
+    for path in corpus:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        sentences.extend(s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if len(s.split()) >= 4)
+    return sentences
+
+
+def fixture_chunks(sentences, count, seed=0):
+    """
+    count distinct chunks of 2-3 sentences from the notes, always the same for a seed.
+
+    Every chunk carries a fragment number so content-addressed IDs do not collide.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        picked = rng.sample(sentences, k=min(len(sentences), rng.choice((2, 3))))
+        yield f"Fragment {i}. " + " ".join(picked)
+
+
+def fixture_questions(sentences):
+    """
+    Questions made from the opening words of the notes, which the router can answer locally.
+    """
+    return [" ".join(s.split()[:8]).strip(",.;:") + "?" for s in sentences]
+
+
+def fixture_pages(sentences):
+    """
+    Fake Wikipedia pages, one per sentence of the notes, titled by their first words.
+    """
+    return {" ".join(s.split()[:5]).strip(",.;:"): s for s in sentences}
+
+
+def use_in_memory_knowledge_base(ef, name):
+    """
+    Point tools.vector_tool at a fresh in-memory collection and retriever.
+    """
+    import chromadb
+
+    from tools import vector_tool
+    from tools.hybrid_retriever import HybridRetriever, build_reranker
+
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(name=name, embedding_function=ef)
+    retriever = HybridRetriever(collection, reranker=build_reranker())
+    retriever.ensure_index()  # Index incrementally during ingestion, like the running app
+    with vector_tool._resources_lock:
+        vector_tool._resources.update(client=client, ef=ef, collection=collection, retriever=retriever)
+    return client, collection
+
+
+def bench_ingest_and_retrieval(args, sentences, questions, ef):
+    from tools.vector_tool import ingest_chunks, retrieve
+
+    results = []
+    for scale in args.scales:
+        name = f"bench_e2e_{scale}_{uuid.uuid4().hex[:8]}"
+        client, collection = use_in_memory_knowledge_base(ef, name)
+
+        start = time.perf_counter()
+        added = ingest_chunks(fixture_chunks(sentences, scale, args.seed), "fixture.txt", batch_size=args.batch_size)
+        ingest_seconds = time.perf_counter() - start
+
+        timings = []
+        for i in range(args.queries):
+            question = questions[i % len(questions)]
+            start = time.perf_counter()
+            retrieve(question)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        result = {
+            "chunks": added,
+            "ingest_seconds": round(ingest_seconds, 3),
+            "ingest_chunks_per_s": round(added / ingest_seconds, 1) if ingest_seconds else None,
+            "retrieval": percentiles(timings),
+            **rss_mb(),
+        }
+        results.append(result)
+        print(
+            f"  {scale:>8} chunks: ingest {result['ingest_chunks_per_s']} chunks/s, "
+            f"retrieve p50 {result['retrieval']['p50_ms']} ms, p99 {result['retrieval']['p99_ms']} ms"
+        )
+        client.delete_collection(name)
+    return results
+
+
+def install_fakes(args, sentences, tmp_dir):
+    """
+    Swap the LLM-free remote services for fakes and keep all state in tmp_dir.
+    """
+    from router import route_stats
+    from tools import memory_store, serpapi_tool, vision_tool, wiki_tool
+    from tools.telemetry import tracer
+
+    os.environ.setdefault("SERPAPI_API_KEY", "fake")
+    route_stats.log_path = None
+    tracer.log_path = None
+    wiki_tool._client = wiki_tool.WikipediaClient(
+        offline=FakeWikipedia(fixture_pages(sentences), latency=args.tool_latency)
+    )
+    serpapi_tool._client = serpapi_tool.SerpApiClient(
+        search_fn=build_fake_google_search(latency=args.tool_latency),
+        cache=serpapi_tool.SearchResultCache(path=os.path.join(tmp_dir, "serpapi.sqlite")),
+    )
+    vision_tool._analyzer = vision_tool.VisionAnalyzer(
+        backend=build_fake_vision_backend(latency=args.vision_latency),
+        cache=vision_tool.VisionCache(path=os.path.join(tmp_dir, "vision.sqlite")),
+    )
+    memory_store._storage = memory_store.BoundedMemoryStorage(path=os.path.join(tmp_dir, "crew_memory.sqlite"))
+
+
+def bench_answer(args, sentences, questions, ef):
+    import agents
+    from agents import answer_question, build_agents
+    from tools.vector_tool import ingest_chunks
+
+    # Measure the pipeline, not the process-wide LLM rate limit
+    agents.CREW_MAX_RPM = 0
+
+    # The router needs notes to find: a small knowledge base of the fixture corpus
+    use_in_memory_knowledge_base(ef, f"bench_e2e_answer_{uuid.uuid4().hex[:8]}")
+    ingest_chunks(fixture_chunks(sentences, 1000, args.seed), "fixture.txt")
+
+    tutor_agent, research_agent, quiz_agent = build_agents(build_fake_llm(latency=args.llm_latency))
+    # Warm up the crew templates, memory and event handlers outside the measurement
+    for mode in MODES:
+        answer_question(questions[0], tutor_agent, research_agent, quiz_agent, mode=mode, use_cache=False)
+
+    # Router on with questions about the notes (mostly the local route),
+    # router off with the eval questions (research fan-out plus two tasks)
+    question_sets = {True: fixture_questions(sentences), False: questions}
+    results = []
+    for mode in MODES:
+        for use_router in (True, False):
+            timings, routes, llm_calls = [], {}, []
+
+            def on_event(event):
+                if event["type"] == "usage":
+                    routes[event["route"]] = routes.get(event["route"], 0) + 1
+                    llm_calls.append(event["llm_calls"])
+
+            for i in range(args.requests):
+                start = time.perf_counter()
+                batch = question_sets[use_router]
+                answer_question(
+                    batch[i % len(batch)],
+                    tutor_agent,
+                    research_agent,
+                    quiz_agent,
+                    mode=mode,
+                    use_cache=False,
+                    use_router=use_router,
+                    on_event=on_event,
+                )
+                timings.append((time.perf_counter() - start) * 1000)
+
+            result = {
+                "mode": mode,
+                "router": use_router,
+                "routes": routes,
+                "llm_calls_per_request": round(statistics.mean(llm_calls), 2) if llm_calls else 0,
+                "latency": percentiles(timings),
+            }
+            results.append(result)
+            print(
+                f"  {mode:15s} router={'on ' if use_router else 'off'} p50 {result['latency']['p50_ms']} ms, "
+                f"p95 {result['latency']['p95_ms']} ms, {result['llm_calls_per_request']} LLM calls"
+            )
+    return results
+
+
+def fixture_images(count, seed=0):
+    """
+    count distinct 2000x1500 JPEG photos with random shapes.
+    """
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        image = Image.new("RGB", (2000, 1500), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x, y = rng.randrange(1800), rng.randrange(1300)
+            draw.rectangle((x, y, x + rng.randrange(50, 600), y + rng.randrange(50, 600)),
+                           fill=tuple(rng.randrange(256) for _ in range(3)))
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=95)
+        images.append(out.getvalue())
+    return images
+
+
+def resized(image_bytes, scale=0.6, quality=80):
+    """
+    The same photo at a lower resolution and quality, as a student might re-upload it.
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+    image = image.resize((int(image.width * scale), int(image.height * scale)))
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+
+def bench_vision(args):
+    from tools.telemetry import tracer
+    from tools.vision_tool import analyze_images, preprocess_image
+
+    images = fixture_images(args.images, args.seed)
+    original_bytes = sum(len(image) for image in images)
+    sent_bytes = sum(len(preprocess_image(image)[0]) for image in images)
+
+    result = {"images": len(images), "original_mb": round(original_bytes / 1e6, 2),
+              "uploaded_mb": round(sent_bytes / 1e6, 2)}
+    # cold: every image reaches the backend; exact: the same bytes again;
+    # similar: re-encoded copies that only the perceptual hash recognizes
+    runs = {"cold": images, "exact": images, "similar": [resized(image) for image in images]}
+    for run, batch in runs.items():
+        before = tracer.metrics.counter_value("tutor_cache_events_total", cache="vision", outcome="miss")
+        start = time.perf_counter()
+        analyze_images(batch)
+        elapsed = time.perf_counter() - start
+        misses = tracer.metrics.counter_value("tutor_cache_events_total", cache="vision", outcome="miss") - before
+        result[run] = {
+            "images_per_s": round(len(batch) / elapsed, 1),
+            "cache_hit_rate": round(1 - misses / len(batch), 3),
+        }
+    print(
+        f"  {len(images)} images: {result['original_mb']} MB -> {result['uploaded_mb']} MB uploaded; "
+        + ", ".join(f"{run} {result[run]['images_per_s']}/s (hits {result[run]['cache_hit_rate']:.0%})" for run in runs)
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks with local fakes.")
+    parser.add_argument("--corpus", nargs="+", default=DEFAULT_CORPUS)
+    parser.add_argument("--eval", default=DEFAULT_EVAL, help="Questions used as queries.")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200, help="Retrieval queries per scale.")
+    parser.add_argument("--requests", type=int, default=10, help="answer_question calls per mode and route.")
+    parser.add_argument("--images", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=None, help="Ingest batch size (default: INGEST_BATCH_SIZE).")
+    parser.add_argument("--embedder", choices=["hashing", "onnx"], default="hashing")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Fake LLM delay per call, seconds.")
+    parser.add_argument("--tool-latency", type=float, default=0.0, help="Fake Wikipedia/SerpAPI delay, seconds.")
+    parser.add_argument("--vision-latency", type=float, default=0.0, help="Fake vision backend delay, seconds.")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["retrieval", "answer", "vision"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    from tools.vector_tool import INGEST_BATCH_SIZE
+    args.batch_size = args.batch_size or INGEST_BATCH_SIZE
+
+    if args.embedder == "onnx":
+        from chromadb.utils import embedding_functions
+        ef = embedding_functions.DefaultEmbeddingFunction()
+    else:
+        ef = HashingEmbeddingFunction()
+
+    sentences = load_sentences(args.corpus)
+    questions = [item["question"] for item in load_eval(args.eval)]
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "memory": {"start": rss_mb()},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="bench_e2e_") as tmp_dir:
+        install_fakes(args, sentences, tmp_dir)
+
+        if "retrieval" not in args.skip:
+            print("Ingestion and retrieval")
+            report["retrieval"] = bench_ingest_and_retrieval(args, sentences, questions, ef)
+            report["memory"]["after_retrieval"] = rss_mb()
+
+        if "answer" not in args.skip:
+            print("answer_question per mode")
+            report["answer"] = bench_answer(args, sentences, questions, ef)
+            report["memory"]["after_answer"] = rss_mb()
+
+        if "vision" not in args.skip:
+            print("Vision")
+            report["vision"] = bench_vision(args)
+            report["memory"]["after_vision"] = rss_mb()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+Compare the Chroma HNSW collection with the quantized memory-mapped index.
+
+Usage:
+    python -m benchmarks.bench_quantized [--chunks 100000] [--queries 200] [--k 10]
+        [--hnsw-m 16 32] [--hnsw-ef-search 100 200] [--quantization int8 pq]
+        [--bm25 memory sqlite] [-o quantized_results.json]
+
+Every configuration is built in a fresh worker process and reports:
+- build time (indexing only: embeddings are computed once and shared)
+- size on disk
+- memory: RSS growth of the worker after building and querying, in total
+  and excluding memory-mapped file pages (anon)
+- QPS of single-query searches
+- recall@k against exact brute-force cosine search over the same vectors
+  (results that tie with the k-th exact score count as hits)
+
+With VECTOR_BACKEND=quantized the app does not query the index alone:
+search_history_vector and the router run the hybrid BM25 + dense retriever.
+That path is measured end to end on the quantized index, with the BM25 index
+in memory and in SQLite (--bm25): BM25 build time, time to reopen it after a
+restart, RSS growth and search latency.
+
+The corpus is the bench_e2e fixture corpus with extra words from the notes'
+vocabulary, so chunks do not collapse onto a handful of identical vectors.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from benchmarks.bench_chunking import DEFAULT_CORPUS
+from benchmarks.bench_e2e import fixture_chunks, load_sentences, percentiles, rss_mb
+from benchmarks.fakes import HashingEmbeddingFunction
+
+BUILD_BATCH_SIZE = 1000
+
+
+def fixture_corpus(sentences, count, seed=0, extra_words=12):
+    rng = random.Random(seed)
+    vocabulary = sorted({word.strip(",.;:()").lower() for s in sentences for word in s.split()} - {""})
+    return [
+        chunk + " " + " ".join(rng.choices(vocabulary, k=extra_words))
+        for chunk in fixture_chunks(sentences, count, seed)
+    ]
+
+
+def fixture_queries(documents, count, seed=1):
+    """
+    Queries made of a few words from random chunks.
+    """
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        words = rng.choice(documents).split()
+        start = rng.randrange(max(1, len(words) - 8))
+        queries.append(" ".join(words[start:start + 8]))
+    return queries
+
+
+def anonymous_rss_mb():
+    """
+    Resident memory not backed by a file: unlike memory-mapped index pages,
+    the kernel cannot drop it under memory pressure.
+    """
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    )
+
+
+def build_and_query(config, embeddings_path, query_vectors, k, workdir):
+    """
+    Worker: build one index from the shared embeddings and time the queries.
+    """
+    baseline, baseline_anon = rss_mb()["rss_mb"], anonymous_rss_mb()
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    ids = [f"c{i}" for i in range(len(embeddings))]
+    path = os.path.join(workdir, config["name"])
+
+    start = time.perf_counter()
+    if config["backend"] == "chroma":
+        import chromadb
+
+        client = chromadb.PersistentClient(path=path)
+        collection = client.create_collection(
+            name="bench_quantized",
+            configuration={"hnsw": {"space": "cosine", **config["hnsw"]}},
+        )
+        batch_size = min(BUILD_BATCH_SIZE * 5, client.get_max_batch_size())
+    else:
+        from tools.quantized_index import PQ_TRAIN_SIZE, QuantizedCollection
+
+        collection = QuantizedCollection(
+            "bench_quantized",
+            path,
+            quantization=config["quantization"],
+            rescore_candidates=config["rescore_candidates"],
+        )
+        batch_size = BUILD_BATCH_SIZE
+    for offset in range(0, len(ids), batch_size):
+        collection.upsert(
+            ids=ids[offset:offset + batch_size],
+            embeddings=np.asarray(embeddings[offset:offset + batch_size]),
+            documents=[""] * len(ids[offset:offset + batch_size]),
+        )
+    if config["backend"] == "quantized" and len(ids) < PQ_TRAIN_SIZE:
+        collection.train()  # Larger indexes train themselves once PQ_TRAIN_SIZE vectors are stored
+    build_seconds = time.perf_counter() - start
+    del embeddings  # Drop the shared input from the RSS numbers
+
+    results, timings = [], []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        found = collection.query(query_embeddings=[vector.tolist()], n_results=k, include=["distances"])
+        timings.append((time.perf_counter() - start) * 1000)
+        results.append(found["ids"][0])
+
+    return {
+        "build_seconds": round(build_seconds, 3),
+        "disk_mb": round(directory_size(path) / 1e6, 1),
+        "rss_growth_mb": round(rss_mb()["rss_mb"] - baseline, 1),
+        "anon_rss_growth_mb": round(anonymous_rss_mb() - baseline_anon, 1) if baseline_anon is not None else None,
+        "qps": round(len(timings) / (sum(timings) / 1000), 1),
+        "latency": percentiles(timings),
+        "results": results,
+    }
+
+
+def build_embedder(name):
+    if name == "onnx":
+        from chromadb.utils import embedding_functions
+        return embedding_functions.DefaultEmbeddingFunction()
+    return HashingEmbeddingFunction()
+
+
+def hybrid_search(config, embeddings_path, documents_path, queries, k, workdir):
+    """
+    Worker: the search_history_vector path (hybrid BM25 + dense search) on the
+    quantized index, including building the BM25 index.
+    """
+    from tools.hybrid_retriever import BM25Index, HybridRetriever, SqliteBM25Index
+    from tools.quantized_index import QuantizedCollection
+
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    with open(documents_path, "r", encoding="utf-8") as f:
+        documents = json.load(f)
+    ids = [f"c{i}" for i in range(len(documents))]
+    path = os.path.join(workdir, config["name"])
+    collection = QuantizedCollection(
+        "bench_quantized", path, embedding_function=build_embedder(config["embedder"]),
+        quantization=config["quantization"],
+    )
+    for offset in range(0, len(ids), BUILD_BATCH_SIZE):
+        collection.upsert(
+            ids=ids[offset:offset + BUILD_BATCH_SIZE],
+            embeddings=np.asarray(embeddings[offset:offset + BUILD_BATCH_SIZE]),
+            documents=documents[offset:offset + BUILD_BATCH_SIZE],
+        )
+    del embeddings, documents
+    bm25_path = os.path.join(path, "bm25.sqlite")
+
+    def open_retriever():
+        bm25 = SqliteBM25Index(bm25_path) if config["bm25"] == "sqlite" else BM25Index()
+        return HybridRetriever(collection, bm25=bm25)
+
+    baseline, baseline_anon = rss_mb()["rss_mb"], anonymous_rss_mb()
+    start = time.perf_counter()
+    retriever = open_retriever()
+    retriever.ensure_index()
+    build_seconds = time.perf_counter() - start
+
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        retriever.search(query, k=k)
+        timings.append((time.perf_counter() - start) * 1000)
+    rss_growth = rss_mb()["rss_mb"] - baseline
+    anon_growth = anonymous_rss_mb() - baseline_anon if baseline_anon is not None else None
+
+    # A restart: the in-memory index is rebuilt, the SQLite one is reused
+    del retriever
+    start = time.perf_counter()
+    open_retriever().ensure_index()
+    reopen_seconds = time.perf_counter() - start
+
+    return {
+        "bm25_build_seconds": round(build_seconds, 3),
+        "bm25_reopen_seconds": round(reopen_seconds, 3),
+        "bm25_disk_mb": round(os.path.getsize(bm25_path) / 1e6, 1) if os.path.exists(bm25_path) else 0.0,
+        "rss_growth_mb": round(rss_growth, 1),
+        "anon_rss_growth_mb": round(anon_growth, 1) if anon_growth is not None else None,
+        "qps": round(len(timings) / (sum(timings) / 1000), 1),
+        "latency": percentiles(timings),
+    }
+
+
+def recall_at_k(results, exact_scores, k):
+    """
+    Share of returned IDs scoring at least the k-th best exact score.
+    """
+    hits = 0
+    for ids, scores in zip(results, exact_scores):
+        threshold = np.partition(scores, -k)[-k] - 1e-5
+        hits += sum(1 for doc_id in ids if scores[int(doc_id[1:])] >= threshold)
+    return round(hits / (k * len(results)), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Chroma HNSW against the quantized index.")
+    parser.add_argument("--corpus", nargs="+", default=DEFAULT_CORPUS)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--hnsw-m", nargs="+", type=int, default=[16])
+    parser.add_argument("--hnsw-ef-construction", type=int, default=100)
+    parser.add_argument("--hnsw-ef-search", nargs="+", type=int, default=[100])
+    parser.add_argument("--quantization", nargs="+", choices=["int8", "pq"], default=["int8", "pq"])
+    parser.add_argument("--rescore-candidates", type=int, default=None,
+                        help="Candidates re-scored at full precision (default: QUANT_RESCORE_CANDIDATES).")
+    parser.add_argument("--bm25", nargs="+", choices=["memory", "sqlite"], default=["memory", "sqlite"],
+                        help="BM25 indexes for the end-to-end hybrid search on the quantized index.")
+    parser.add_argument("--hybrid-k", type=int, default=3, help="Results per hybrid search (RETRIEVAL_K).")
+    parser.add_argument("--embedder", choices=["hashing", "onnx"], default="hashing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="quantized_results.json")
+    args = parser.parse_args()
+
+    from tools.quantized_index import QUANT_RESCORE_CANDIDATES
+    rescore_candidates = args.rescore_candidates or QUANT_RESCORE_CANDIDATES
+
+    ef = build_embedder(args.embedder)
+
+    sentences = load_sentences(args.corpus)
+    documents = fixture_corpus(sentences, args.chunks, args.seed)
+    queries = fixture_queries(documents, args.queries, args.seed + 1)
+
+    print(f"Embedding {len(documents)} chunks and {len(queries)} queries...")
+    embeddings = np.concatenate([
+        np.asarray(ef(documents[i:i + 5000]), dtype=np.float32) for i in range(0, len(documents), 5000)
+    ])
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+    query_vectors = np.asarray(ef(queries), dtype=np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True).clip(min=1e-12)
+    exact_scores = [embeddings @ q for q in query_vectors]
+
+    configs = [
+        {
+            "name": f"chroma_m{m}_ef{ef_search}",
+            "backend": "chroma",
+            "hnsw": {"max_neighbors": m, "ef_construction": args.hnsw_ef_construction, "ef_search": ef_search},
+        }
+        for m in args.hnsw_m
+        for ef_search in args.hnsw_ef_search
+    ] + [
+        {
+            "name": f"quantized_{quantization}",
+            "backend": "quantized",
+            "quantization": quantization,
+            "rescore_candidates": rescore_candidates,
+        }
+        for quantization in args.quantization
+    ]
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "float32_vectors_mb": round(embeddings.nbytes / 1e6, 1),
+        "results": [],
+        "hybrid_results": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="bench_quantized_") as workdir:
+        embeddings_path = os.path.join(workdir, "embeddings.npy")
+        np.save(embeddings_path, embeddings)
+        for config in configs:
+            # A fresh process per index, so memory numbers do not include the previous one
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(build_and_query, config, embeddings_path, query_vectors, args.k, workdir).result()
+            result[f"recall@{args.k}"] = recall_at_k(result.pop("results"), exact_scores, args.k)
+            report["results"].append({**config, **result})
+            print(
+                f"  {config['name']:24s} build {result['build_seconds']:8.1f}s  disk {result['disk_mb']:8.1f} MB  "
+                f"rss +{result['rss_growth_mb']:7.1f} MB (anon +{result['anon_rss_growth_mb']} MB)  "
+                f"{result['qps']:8.1f} qps  "
+                f"p95 {result['latency']['p95_ms']:7.2f} ms  recall@{args.k} {result[f'recall@{args.k}']:.3f}"
+            )
+
+        documents_path = os.path.join(workdir, "documents.json")
+        with open(documents_path, "w", encoding="utf-8") as f:
+            json.dump(documents, f)
+        for bm25 in args.bm25:
+            config = {
+                "name": f"hybrid_quantized_{args.quantization[0]}_bm25_{bm25}",
+                "backend": "quantized",
+                "quantization": args.quantization[0],
+                "bm25": bm25,
+                "embedder": args.embedder,
+            }
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(
+                    hybrid_search, config, embeddings_path, documents_path, queries, args.hybrid_k, workdir
+                ).result()
+            report["hybrid_results"].append({**config, **result})
+            print(
+                f"  {config['name']:24s} bm25 build {result['bm25_build_seconds']:8.1f}s  "
+                f"reopen {result['bm25_reopen_seconds']:6.2f}s  "
+                f"rss +{result['rss_growth_mb']:7.1f} MB (anon +{result['anon_rss_growth_mb']} MB)  "
+                f"{result['qps']:8.1f} qps  p95 {result['latency']['p95_ms']:7.2f} ms"
+            )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
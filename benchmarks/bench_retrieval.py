@@ -0,0 +1,83 @@
+"""
+Compare dense-only retrieval (the original search_history_vector) with the
+hybrid BM25 + vector retriever on recall@k and latency.
+
+Usage:
+    python -m benchmarks.bench_retrieval [--corpus data/ww2_history_notes.txt ...] [--k 3] [--rerank]
+
+Both retrievers query the same throwaway in-memory Chroma collection, built
+with the structure-aware chunker and the DefaultEmbeddingFunction.
+"""
+import argparse
+import json
+import statistics
+import time
+
+import chromadb
+from chromadb.utils import embedding_functions
+
+from benchmarks.bench_chunking import DEFAULT_CORPUS, DEFAULT_EVAL, load_eval
+from tools.chunker import chunk_lines
+from tools.hybrid_retriever import HybridRetriever, build_reranker
+
+
+def build_collection(corpus, client, ef):
+    collection = client.create_collection(name="bench_retrieval", embedding_function=ef)
+    chunks = []
+    for path in corpus:
+        with open(path, "r", encoding="utf-8") as f:
+            chunks.extend((path, c) for c in chunk_lines(f))
+    collection.add(
+        ids=[str(i) for i in range(len(chunks))],
+        documents=[c.text for _, c in chunks],
+        metadatas=[c.metadata(path) for path, c in chunks],
+    )
+    return collection
+
+
+def evaluate(name, search, eval_set, k):
+    hits = 0
+    latencies = []
+    for item in eval_set:
+        start = time.perf_counter()
+        docs = search(item["question"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        if any(item["expected"] in doc for doc in docs[:k]):
+            hits += 1
+    latencies.sort()
+    return {
+        "retriever": name,
+        f"recall@{k}": hits / len(eval_set) if eval_set else 0,
+        "p50_ms": statistics.median(latencies) if latencies else 0,
+        "max_ms": latencies[-1] if latencies else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dense vs hybrid retrieval.")
+    parser.add_argument("--corpus", nargs="+", default=DEFAULT_CORPUS)
+    parser.add_argument("--eval", default=DEFAULT_EVAL)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--rerank", action="store_true", help="Enable the cross-encoder (RERANKER_MODEL).")
+    args = parser.parse_args()
+
+    eval_set = load_eval(args.eval)
+    ef = embedding_functions.DefaultEmbeddingFunction()
+    collection = build_collection(args.corpus, chromadb.EphemeralClient(), ef)
+    k = min(args.k, collection.count())
+
+    def dense_search(query):
+        return collection.query(query_texts=[query], n_results=k)["documents"][0]
+
+    hybrid = HybridRetriever(collection, reranker=build_reranker() if args.rerank else None)
+    hybrid.ensure_index()
+
+    def hybrid_search(query):
+        return [c.text for c in hybrid.search(query, k=k)]
+
+    print(json.dumps(evaluate("dense", dense_search, eval_set, k)))
+    print(json.dumps(evaluate("hybrid", hybrid_search, eval_set, k)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Replay a query log against the semantic cache and report its hit rate.
+
+Usage:
+    python -m benchmarks.bench_semantic_cache [--log benchmarks/query_log.txt] [--threshold 0.85]
+
+Every miss is inserted into the cache with a placeholder answer, mimicking
+answer_question storing the result of a full crew run.
+"""
+import argparse
+import os
+import time
+
+from tools.semantic_cache import DEFAULT_ANSWER_THRESHOLD, DEFAULT_RESEARCH_THRESHOLD, SemanticCache
+
+DEFAULT_LOG = os.path.join(os.path.dirname(__file__), "query_log.txt")
+
+
+def load_queries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--log", default=DEFAULT_LOG, help="One question per line.")
+    parser.add_argument("--mode", default="Regular answer")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_RESEARCH_THRESHOLD, help="Research summary reuse threshold.")
+    parser.add_argument("--answer-threshold", type=float, default=DEFAULT_ANSWER_THRESHOLD, help="Final answer reuse threshold.")
+    parser.add_argument("--max-entries", type=int, default=2000)
+    args = parser.parse_args()
+
+    queries = load_queries(args.log)
+    cache = SemanticCache(
+        answer_threshold=args.answer_threshold,
+        research_threshold=args.threshold,
+        max_entries=args.max_entries,
+    )
+
+    answer_hits = 0
+    research_hits = 0
+    lookup_times = []
+    for question in queries:
+        start = time.perf_counter()
+        vector = cache.embed(question)
+        hit = cache.lookup(question, args.mode, "bench", vector=vector)
+        lookup_times.append(time.perf_counter() - start)
+
+        if hit is None:
+            cache.add(question, args.mode, "bench", research_summary="summary", answer="answer", vector=vector)
+        elif hit.answer is not None:
+            answer_hits += 1
+        else:
+            research_hits += 1
+
+    lookup_times.sort()
+    total = len(queries)
+    print(f"Queries replayed:      {total}")
+    print(f"Answer reuse hits:     {answer_hits} ({answer_hits / total:.1%})")
+    print(f"Research reuse hits:   {research_hits} ({research_hits / total:.1%})")
+    print(f"Research agent skipped:{(answer_hits + research_hits) / total:.1%}")
+    print(f"Cache entries:         {len(cache)}")
+    print(f"Lookup p50 / max (ms): {lookup_times[total // 2] * 1000:.2f} / {lookup_times[-1] * 1000:.2f}")
+
+
+if __name__ == "__main__":
+    main()
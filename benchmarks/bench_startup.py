@@ -0,0 +1,110 @@
+"""
+Startup benchmark for the Streamlit app.
+
+Usage:
+    python -m benchmarks.bench_startup [--reruns 10]
+
+Each measurement runs in a fresh interpreter so imports are really cold:
+
+- import: importing tools.vector_tool (no Chroma client or embedder is created)
+- cold start: first run of streamlit_app.py, imports and agent setup included
+- rerun: later runs of the same session, as after every widget interaction
+
+The rerun is also measured with st.cache_resource cleared before every run,
+which is what rebuilding the LLM and agents on each rerun used to cost.
+Only construction is timed; no LLM request is made. The app runs against an
+empty temporary data directory, so the benchmark never creates or touches
+the real vector database and caches under data/.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import json, time
+start = time.perf_counter()
+import tools.vector_tool
+print(json.dumps({"import_s": time.perf_counter() - start}))
+"""
+
+APP_PROBE = """
+import json, os, sys, time
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from router import route_stats
+from tools import answer_cache, document_registry, memory_store, vector_tool
+from tools.telemetry import tracer
+
+# Keep every store the app opens in the temporary directory
+state_dir = sys.argv[3]
+vector_tool.DB_PATH = os.path.join(state_dir, "vector_db")
+vector_tool.KB_VERSION_PATH = os.path.join(vector_tool.DB_PATH, "kb_version.txt")
+vector_tool.QUANTIZED_DB_PATH = os.path.join(vector_tool.DB_PATH, "quantized")
+vector_tool.REGISTRY_PATH = os.path.join(vector_tool.DB_PATH, "registry.sqlite")
+document_registry._registry = document_registry.DocumentRegistry(vector_tool.REGISTRY_PATH)
+answer_cache._answer_cache = answer_cache.AnswerCache(path=os.path.join(state_dir, "answers.sqlite"))
+memory_store._storage = memory_store.BoundedMemoryStorage(path=os.path.join(state_dir, "crew_memory.sqlite"))
+route_stats.log_path = None
+tracer.log_path = None
+
+reruns, clear_cache = int(sys.argv[1]), sys.argv[2] == "1"
+app = AppTest.from_file("streamlit_app.py", default_timeout=300)
+start = time.perf_counter()
+app.run()
+cold = time.perf_counter() - start
+assert not app.exception, app.exception
+
+times = []
+for _ in range(reruns):
+    if clear_cache:
+        st.cache_resource.clear()
+    start = time.perf_counter()
+    app.run()
+    times.append(time.perf_counter() - start)
+print(json.dumps({"cold_start_s": cold, "reruns_s": times}))
+"""
+
+
+def run_probe(code, *args):
+    env = dict(os.environ)
+    # Constructing the LLM needs a key, but nothing is sent
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    result = subprocess.run(
+        [sys.executable, "-c", code, *args],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Streamlit cold-start and rerun latency.")
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    imported = run_probe(IMPORT_PROBE)
+    print(f"import tools.vector_tool: {imported['import_s'] * 1000:8.1f} ms")
+
+    for label, clear_cache in [("cached resources", "0"), ("rebuilt per rerun", "1")]:
+        with tempfile.TemporaryDirectory(prefix="bench_startup_") as state_dir:
+            result = run_probe(APP_PROBE, str(args.reruns), clear_cache, state_dir)
+        reruns = result["reruns_s"]
+        print(
+            f"{label:18s} cold start {result['cold_start_s'] * 1000:8.1f} ms | "
+            f"rerun mean {statistics.mean(reruns) * 1000:7.1f} ms, "
+            f"max {max(reruns) * 1000:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
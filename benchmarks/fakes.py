@@ -0,0 +1,195 @@
+"""
+Deterministic stand-ins for the remote services, for benchmarks and local load tests.
+"""
+import hashlib
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from crewai.events.types.llm_events import LLMCallType
+from crewai.llms.base_llm import BaseLLM, llm_call_context
+
+
+class FakeLLM(BaseLLM):
+    """
+    CrewAI LLM that answers immediately (after an optional fixed delay) with a
+    canned final answer, so crews run end to end without network access.
+    """
+
+    latency: float = 0.0
+    calls: int = 0
+    stream_chunks: bool = True
+
+    def call(
+        self,
+        messages,
+        tools=None,
+        callbacks=None,
+        available_functions=None,
+        from_task=None,
+        from_agent=None,
+        response_model=None,
+    ) -> Any:
+        # Same event sequence as a real provider, so tracing works offline
+        with llm_call_context() as call_id:
+            self._emit_call_started_event(messages=messages, from_task=from_task, from_agent=from_agent)
+            response, usage = self._respond(messages, call_id, from_task, from_agent)
+            self._emit_call_completed_event(
+                response=response,
+                call_type=LLMCallType.LLM_CALL,
+                from_task=from_task,
+                from_agent=from_agent,
+                messages=messages,
+                usage=usage,
+            )
+        return response
+
+    def _respond(self, messages, call_id, from_task, from_agent):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(messages, str):
+            prompt = messages
+            prompt_words = len(messages.split())
+        else:
+            prompt = str(messages[-1].get("content", "")) if messages else ""
+            prompt_words = sum(len(str(m.get("content", "")).split()) for m in messages)
+        topic = " ".join(prompt.split()[:12])
+        response = f"Thought: I now know the final answer\nFinal Answer: Stub answer about: {topic}"
+        # Report word counts as token usage so per-request usage can be checked offline
+        completion_words = len(response.split())
+        usage = {
+            "prompt_tokens": prompt_words,
+            "completion_tokens": completion_words,
+            "total_tokens": prompt_words + completion_words,
+        }
+        self._track_token_usage_internal(usage)
+        if self.stream_chunks:
+            self._emit_chunks(response, call_id, from_task, from_agent)
+        return response, usage
+
+    def _emit_chunks(self, response, call_id, from_task, from_agent) -> None:
+        # Mimic a streaming provider: one LLMStreamChunkEvent per word
+        from crewai.events import LLMStreamChunkEvent, crewai_event_bus
+
+        for word in response.split(" "):
+            crewai_event_bus.emit(
+                self,
+                LLMStreamChunkEvent(
+                    chunk=word + " ",
+                    from_task=from_task,
+                    from_agent=from_agent,
+                    call_id=call_id,
+                    model=self.model,
+                ),
+            )
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return False
+
+    def get_context_window_size(self) -> int:
+        return 128000
+
+
+def build_fake_llm(latency: float = 0.0) -> FakeLLM:
+    return FakeLLM(model="fake/stub", latency=latency)
+
+
+class HashingEmbeddingFunction:
+    """
+    Deterministic bag-of-words embedder with the same dimension as the ONNX
+    MiniLM model, so collections of any size can be built without the model.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for word in re.findall(r"\w+", text.lower()):
+                vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dim] += 1.0
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm else vector)
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "hashing"
+
+    def embed_query(self, input):
+        return self(input)
+
+    def get_config(self) -> dict:
+        return {"dim": self.dim}
+
+    @staticmethod
+    def build_from_config(config: dict) -> "HashingEmbeddingFunction":
+        return HashingEmbeddingFunction(config.get("dim", 384))
+
+
+class FakeWikipedia:
+    """
+    Stand-in for WikipediaClient: search and page lookup over fixture pages.
+    """
+
+    def __init__(self, pages: Dict[str, str], latency: float = 0.0):
+        from tools.hybrid_retriever import BM25Index
+
+        self.latency = latency
+        self.pages = {
+            title: {"title": title, "url": f"https://example.org/wiki/{title.replace(' ', '_')}",
+                    "content": content, "revision_id": 1}
+            for title, content in pages.items()
+        }
+        self.index = BM25Index()
+        for title, content in pages.items():
+            self.index.add(title, f"{title} {content}")
+
+    def search(self, query: str) -> List[str]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [title for title, _ in self.index.search(query, 3)]
+
+    def page(self, title: str) -> Optional[dict]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self.pages.get(title)
+
+
+def build_fake_google_search(latency: float = 0.0):
+    """
+    search_fn for SerpApiClient returning canned organic results.
+    """
+    def search(params: dict) -> dict:
+        if latency:
+            time.sleep(latency)
+        query = params["q"]
+        return {
+            "organic_results": [
+                {
+                    "title": f"Result {i + 1} for {query}",
+                    "link": f"https://example.org/search/{i + 1}",
+                    "snippet": f"Stub web result {i + 1} about {query}.",
+                }
+                for i in range(params.get("num", 3))
+            ]
+        }
+    return search
+
+
+def build_fake_vision_backend(latency: float = 0.0):
+    """
+    Vision backend (see tools/vision_tool.py) describing only size and type.
+    """
+    def describe(data: bytes, mime: str, prompt: str) -> str:
+        if latency:
+            time.sleep(latency)
+        return f"Stub description of a {mime} image ({len(data)} bytes)."
+    return describe
@@ -0,0 +1,86 @@
+"""
+Load test for server.py.
+
+Start the server with the stub LLM, then fire concurrent questions at it:
+
+    TUTOR_FAKE_LLM=1 uvicorn server:app --port 8000
+    python -m benchmarks.load_test --users 200 --questions 3
+
+Reports status codes (200 / 429 / 504), latency percentiles and throughput.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import time
+
+import httpx
+
+QUESTIONS = [
+    "What happened on D-Day?",
+    "Why was Stalingrad a turning point?",
+    "When did the war in Europe end?",
+    "Why were atomic bombs dropped on Japan?",
+]
+MODES = ["Regular answer", "Summary", "Explanation", "Quiz"]
+
+
+async def student(client, url, user_idx, questions, results):
+    for i in range(questions):
+        payload = {
+            # Vary the wording so the answer cache does not absorb the whole load
+            "question": f"{QUESTIONS[(user_idx + i) % len(QUESTIONS)]} (student {user_idx}, q{i})",
+            "mode": MODES[(user_idx + i) % len(MODES)],
+            "user_id": f"student-{user_idx}",
+        }
+        start = time.perf_counter()
+        try:
+            response = await client.post(f"{url}/ask", json=payload)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = "error"
+        results.append((status, time.perf_counter() - start))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+async def run(args):
+    results = []
+    start = time.perf_counter()
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        await asyncio.gather(*(
+            student(client, args.url, u, args.questions, results) for u in range(args.users)
+        ))
+        server_stats = (await client.get(f"{args.url}/stats")).json()
+    elapsed = time.perf_counter() - start
+
+    ok = [latency for status, latency in results if status == 200]
+    report = {
+        "requests": len(results),
+        "status": dict(collections.Counter(str(status) for status, _ in results)),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0,
+        "p50_s": percentile(ok, 0.50),
+        "p95_s": percentile(ok, 0.95),
+        "p99_s": percentile(ok, 0.99),
+        "server": server_stats,
+    }
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the tutor HTTP service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=2, help="Questions per user, sent sequentially.")
+    parser.add_argument("--timeout", type=float, default=300)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Token-budgeted conversation history.
+
+Instead of pasting the last turns verbatim into every task, the conversation
+is kept as a rolling summary of older turns plus the most recent turns. Turns
+that fall out of the recent window are folded into the summary once, so only
+new turns are ever summarized, and summaries are cached by content.
+
+Each task gets its own slice: the research task only needs what the student
+asked (to resolve "he", "that battle", ...), the tutor/quiz task also gets the
+previous answers. Both slices are cut to a token budget, keeping the summary
+lines that overlap most with the new question.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence
+
+from tools.chunker import approx_token_count
+from tools.hybrid_retriever import tokenize
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "400"))
+HISTORY_RESEARCH_BUDGET = int(os.getenv("HISTORY_RESEARCH_BUDGET", "120"))
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "4"))
+HISTORY_MAX_TURN_TOKENS = int(os.getenv("HISTORY_MAX_TURN_TOKENS", "150"))
+HISTORY_SUMMARY_MAX_LINES = int(os.getenv("HISTORY_SUMMARY_MAX_LINES", "12"))
+HISTORY_SUMMARIZER = os.getenv("HISTORY_SUMMARIZER", "extractive")
+
+# What the app used to send: the last 6 turns, verbatim
+NAIVE_HISTORY_TURNS = 6
+
+
+@dataclass
+class Turn:
+    role: str  # "user" or "assistant"
+    content: str
+    mode: str = "Regular answer"
+
+    def label(self) -> str:
+        return "User" if self.role == "user" else "Assistant"
+
+
+def clip_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text to roughly max_tokens, on a word boundary.
+    """
+    if approx_token_count(text) <= max_tokens:
+        return text
+    words = text.split()
+    # approx_token_count counts ~1.3 tokens per word; leave room for the ellipsis
+    keep = max(1, int((max_tokens - 2) / 1.3))
+    return " ".join(words[:keep]) + " ..."
+
+
+def _first_sentence(text: str, max_tokens: int = 30) -> str:
+    """
+    First real sentence of text, skipping fragments such as list numbers.
+    """
+    for sentence in re.split(r"(?<=[.?!])\s+|\n+", text):
+        if len(sentence.split()) >= 4:
+            return clip_to_tokens(" ".join(sentence.split()), max_tokens)
+    return clip_to_tokens(" ".join(text.split()), max_tokens)
+
+
+def extractive_summarizer(previous: List[str], turns: Sequence[Turn]) -> List[str]:
+    """
+    Fold turns into the summary without an LLM call: one short line per turn.
+    """
+    lines = list(previous)
+    for turn in turns:
+        if turn.role == "user":
+            lines.append(f"- Student asked: {_first_sentence(turn.content)}")
+        else:
+            lines.append(f"- Tutor ({turn.mode}): {_first_sentence(turn.content)}")
+    return lines
+
+
+def llm_summarizer(llm) -> Callable[[List[str], Sequence[Turn]], List[str]]:
+    """
+    Summarizer that asks the LLM to update the running summary.
+    """
+    def summarize(previous: List[str], turns: Sequence[Turn]) -> List[str]:
+        new_turns = "\n".join(f"{t.label()}: {clip_to_tokens(t.content, 300)}" for t in turns)
+        prompt = (
+            "Update the running summary of a tutoring conversation about World War II.\n"
+            f"Current summary:\n{chr(10).join(previous) or '(empty)'}\n\n"
+            f"New turns:\n{new_turns}\n\n"
+            f"Return at most {HISTORY_SUMMARY_MAX_LINES} bullet lines starting with '- ', "
+            "keeping names, dates and topics the student may refer back to."
+        )
+        response = llm.call([{"role": "user", "content": prompt}])
+        return [line.strip() for line in str(response).splitlines() if line.strip().startswith("-")]
+    return summarize
+
+
+def build_summarizer(llm=None):
+    """
+    The summarizer selected by HISTORY_SUMMARIZER ("extractive" or "llm").
+    """
+    if HISTORY_SUMMARIZER == "llm" and llm is not None:
+        return llm_summarizer(llm)
+    return extractive_summarizer
+
+
+class SummaryCache:
+    """
+    Small LRU of (previous summary, new turns) -> updated summary.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(previous: List[str], turns: Sequence[Turn]) -> str:
+        payload = "\n".join(previous) + "\x00" + "\x00".join(f"{t.role}|{t.mode}|{t.content}" for t in turns)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            lines = self._entries.get(key)
+            if lines is not None:
+                self._entries.move_to_end(key)
+            return lines
+
+    def set(self, key: str, lines: List[str]) -> None:
+        with self._lock:
+            self._entries[key] = lines
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+summary_cache = SummaryCache()
+
+
+@dataclass
+class HistoryUsage:
+    """
+    Prompt tokens spent on conversation history for one request.
+    """
+    sent_tokens: int
+    baseline_tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(self.baseline_tokens - self.sent_tokens, 0)
+
+
+@dataclass
+class ConversationHistory:
+    """
+    Conversation with a bounded prompt footprint.
+
+    The last recent_turns turns are kept verbatim (each clipped to
+    max_turn_tokens); older turns are folded into summary_lines.
+    """
+    recent_turns: int = HISTORY_RECENT_TURNS
+    max_turn_tokens: int = HISTORY_MAX_TURN_TOKENS
+    summarize: Callable[[List[str], Sequence[Turn]], List[str]] = extractive_summarizer
+    turns: List[Turn] = field(default_factory=list)
+    summary_lines: List[str] = field(default_factory=list)
+    summarized_upto: int = 0  # turns[:summarized_upto] are in the summary
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def add(self, role: str, content: str, mode: str = "Regular answer") -> None:
+        self.turns.append(Turn(role, content, mode))
+        self._fold()
+
+    def clear(self) -> None:
+        self.turns.clear()
+        self.summary_lines = []
+        self.summarized_upto = 0
+
+    def _fold(self) -> None:
+        """
+        Summarize the turns that just left the recent window.
+        """
+        boundary = len(self.turns) - self.recent_turns
+        if boundary <= self.summarized_upto:
+            return
+        new_turns = self.turns[self.summarized_upto:boundary]
+        key = SummaryCache.key(self.summary_lines, new_turns)
+        lines = summary_cache.get(key)
+        if lines is None:
+            lines = self.summarize(self.summary_lines, new_turns)[-HISTORY_SUMMARY_MAX_LINES:]
+            summary_cache.set(key, lines)
+        self.summary_lines = lines
+        self.summarized_upto = boundary
+
+    def render(
+        self,
+        question: Optional[str] = None,
+        budget_tokens: int = HISTORY_TOKEN_BUDGET,
+        roles: Optional[Sequence[str]] = None,
+    ) -> str:
+        """
+        History text within budget_tokens.
+
+        Recent turns are added newest first; the remaining budget goes to the
+        summary lines that share the most terms with question. roles limits
+        the verbatim turns, e.g. ("user",) for the research task.
+        """
+        recent = [t for t in self.turns[self.summarized_upto:] if roles is None or t.role in roles]
+        # Keep a share of the budget for the summary when there is one
+        reserve = min(budget_tokens // 3, sum(approx_token_count(l) for l in self.summary_lines))
+
+        kept, used = [], 0
+        for turn in reversed(recent):
+            line = f"{turn.label()}: {clip_to_tokens(turn.content, self.max_turn_tokens)}"
+            cost = approx_token_count(line)
+            if used + cost > budget_tokens - reserve:
+                break
+            kept.append(line)
+            used += cost
+        kept.reverse()
+
+        summary = self._relevant_summary(question, budget_tokens - used)
+        parts = []
+        if summary:
+            parts.append("Earlier in the conversation:\n" + "\n".join(summary))
+        if kept:
+            parts.append("\n".join(kept))
+        return "\n\n".join(parts)
+
+    def _relevant_summary(self, question: Optional[str], budget_tokens: int) -> List[str]:
+        lines = self.summary_lines
+        if sum(approx_token_count(l) for l in lines) <= budget_tokens:
+            return list(lines)
+
+        terms = set(tokenize(question or ""))
+        # Rank by term overlap, most recent first on ties, then restore order
+        ranked = sorted(
+            range(len(lines)),
+            key=lambda i: (len(terms & set(tokenize(lines[i]))), i),
+            reverse=True,
+        )
+        chosen, used = [], 0
+        for i in ranked:
+            cost = approx_token_count(lines[i])
+            if used + cost > budget_tokens:
+                continue
+            chosen.append(i)
+            used += cost
+        return [lines[i] for i in sorted(chosen)]
+
+    def naive_text(self, turns: int = NAIVE_HISTORY_TURNS) -> str:
+        """
+        The last turns verbatim, as the app used to send them (for savings reports).
+        """
+        return "\n".join(f"{t.label()}: {t.content}" for t in self.turns[-turns:])
+
+
+def history_contexts(history, question: str):
+    """
+    Split history (a ConversationHistory or plain text) into
+    (research_context, answer_context, baseline_text).
+    """
+    if not history:
+        return "", "", ""
+    if isinstance(history, ConversationHistory):
+        return (
+            history.render(question, HISTORY_RESEARCH_BUDGET, roles=("user",)),
+            history.render(question, HISTORY_TOKEN_BUDGET),
+            history.naive_text(),
+        )
+    # Plain text (e.g. from the HTTP API): keep the most recent lines within budget
+    def tail(budget):
+        kept, used = [], 0
+        for line in reversed(history.splitlines()):
+            line = clip_to_tokens(line, HISTORY_MAX_TURN_TOKENS)
+            cost = approx_token_count(line)
+            if used + cost > budget:
+                break
+            kept.append(line)
+            used += cost
+        return "\n".join(reversed(kept))
+    return tail(HISTORY_RESEARCH_BUDGET), tail(HISTORY_TOKEN_BUDGET), history
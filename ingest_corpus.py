@@ -0,0 +1,185 @@
+"""
+Bulk loader for the 'ww2_knowledge' vector store.
+
+Walks a directory tree of PDF/DOCX/TXT/MD files, converts them with Docling in
+a process pool, then embeds and writes the chunks in batches from the main
+process. Progress is checkpointed per file so an interrupted run can be resumed,
+and files whose mtime/hash did not change since the last run are skipped. A
+changed file is diffed against its stored chunks: only new chunks are embedded
+and chunks that disappeared are deleted.
+
+Usage:
+    python ingest_corpus.py data/ [--workers 4] [--batch-size 64] [--force] [--tenant 3a-history]
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from tools.chunker import DEFAULT_CHUNKER, CHUNKERS, chunk_docling_document, chunk_lines, get_chunker
+from tools.docling_cache import convert_document
+from tools.tenants import normalize_tenant
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECKPOINT_PATH = os.path.join(BASE_DIR, "data", "cache", "ingest_checkpoint.json")
+SUPPORTED_SUFFIXES = {".pdf", ".docx", ".txt", ".md"}
+
+
+def source_key(path):
+    """
+    Stable source id for a file, whatever --root it was found under.
+
+    Files inside the project are keyed relative to BASE_DIR (e.g.
+    "data/pdfs/x.pdf"), anything else by its absolute path.
+    """
+    path = os.path.abspath(path)
+    if os.path.commonpath([path, BASE_DIR]) == BASE_DIR:
+        return os.path.relpath(path, BASE_DIR).replace(os.sep, "/")
+    return path
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def convert_file(path, chunker_name=DEFAULT_CHUNKER):
+    """
+    Worker: turn one file into a list of Chunk objects.
+
+    Runs in a child process, so it must not touch the Chroma client. Each
+    worker keeps its own Docling converter and shares the conversion cache.
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    chunker = get_chunker(chunker_name)
+
+    if suffix in {".txt", ".md"}:
+        with open(path, "r", encoding="utf-8") as f:
+            return list(chunk_lines(f, chunker))
+
+    with open(path, "rb") as f:
+        document = convert_document(f.read(), path)
+    return list(chunk_docling_document(document, chunker))
+
+
+def find_files(root):
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in SUPPORTED_SUFFIXES:
+                yield os.path.join(dirpath, name)
+
+
+def load_checkpoint(path=CHECKPOINT_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint, path=CHECKPOINT_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def plan_files(root, checkpoint, force=False):
+    """
+    Return (files to ingest, number of unchanged files skipped).
+
+    A file is unchanged when its mtime matches the checkpoint, or when the
+    mtime moved but the content hash is still the same.
+    """
+    todo = []
+    skipped = 0
+    for path in find_files(root):
+        key = source_key(path)
+        mtime = os.path.getmtime(path)
+        previous = checkpoint.get(key)
+
+        if previous and not force:
+            if previous["mtime"] == mtime:
+                skipped += 1
+                continue
+            sha = file_sha256(path)
+            if previous["sha256"] == sha:
+                previous["mtime"] = mtime
+                skipped += 1
+                continue
+        else:
+            sha = file_sha256(path)
+
+        todo.append((path, key, mtime, sha))
+    return todo, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load documents into the WW2 vector store.")
+    parser.add_argument("root", help="Directory to scan for PDF/DOCX/TXT/MD files.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Docling conversion processes.")
+    parser.add_argument("--batch-size", type=int, default=None, help="Chunks per embedding batch.")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file for resuming (default: one per tenant).")
+    parser.add_argument("--chunker", default=DEFAULT_CHUNKER, choices=sorted(CHUNKERS), help="Chunking strategy.")
+    parser.add_argument("--force", action="store_true", help="Re-ingest files even if unchanged.")
+    parser.add_argument("--tenant", default=None, help="Load into a class's own collection instead of the base corpus.")
+    args = parser.parse_args()
+
+    # Imported here so worker processes never open the Chroma client
+    from tools.vector_tool import INGEST_BATCH_SIZE, sync_document, bump_knowledge_base_version
+
+    batch_size = args.batch_size or INGEST_BATCH_SIZE
+    args.tenant = normalize_tenant(args.tenant)
+    if args.checkpoint is None:
+        args.checkpoint = CHECKPOINT_PATH.replace(".json", f".{args.tenant}.json") if args.tenant else CHECKPOINT_PATH
+    checkpoint = load_checkpoint(args.checkpoint)
+    todo, skipped = plan_files(args.root, checkpoint, force=args.force)
+    print(f"{len(todo)} files to ingest, {skipped} unchanged files skipped.")
+
+    start = time.perf_counter()
+    docs_done = 0
+    chunks_done = 0
+    changed = False
+    failures = 0
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = {pool.submit(convert_file, path, args.chunker): (path, key, mtime, sha) for path, key, mtime, sha in todo}
+            for future in as_completed(futures):
+                path, key, mtime, sha = futures[future]
+                try:
+                    chunks = future.result()
+                    added, unchanged, removed = sync_document(chunks, key, sha, batch_size=batch_size, tenant=args.tenant)
+                except Exception as e:
+                    failures += 1
+                    print(f"[ERROR] {key}: {e}")
+                    continue
+
+                docs_done += 1
+                chunks_done += added
+                changed = changed or bool(added or removed)
+                checkpoint[key] = {"mtime": mtime, "sha256": sha, "chunks": added + unchanged}
+                save_checkpoint(checkpoint, args.checkpoint)
+                print(f"[{docs_done}/{len(todo)}] {key}: {added} new, {unchanged} unchanged, {removed} removed chunks")
+
+        if changed:
+            bump_knowledge_base_version(args.tenant)
+    else:
+        save_checkpoint(checkpoint, args.checkpoint)
+
+    elapsed = time.perf_counter() - start
+    print("\nSummary")
+    print(f"  documents: {docs_done} ingested, {skipped} skipped, {failures} failed")
+    print(f"  chunks:    {chunks_done} embedded")
+    print(f"  elapsed:   {elapsed:.1f}s")
+    if elapsed > 0:
+        print(f"  throughput: {docs_done / elapsed:.2f} docs/sec, {chunks_done / elapsed:.1f} chunks/sec")
+
+
+if __name__ == "__main__":
+    main()
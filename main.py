@@ -1,7 +1,9 @@
 import os
+import uuid
 from dotenv import load_dotenv
 
-from agents import build_llm, build_agents, answer_question
+from agents import build_llm, build_agents, stream_answer
+from history import ConversationHistory, build_summarizer
 
 
 def main():
@@ -15,6 +17,8 @@ def main():
     print("Initializing LLM and agents (CrewAI + OpenAI)...")
     llm = build_llm()
     tutor_agent, research_agent, quiz_agent = build_agents(llm)
+    conversation = ConversationHistory(summarize=build_summarizer(llm))
+    session_id = uuid.uuid4().hex  # Crew memories are scoped to this run
 
     print("\nHistory Tutor (World War II)")
     print("Type your question, or 'quit' to exit.\n")
@@ -33,15 +37,33 @@ def main():
         if not user_input:
             continue
 
-        print("\n[Thinking... please wait]\n")
+        print()
         try:
-            answer = answer_question(user_input, tutor_agent, research_agent, quiz_agent)
+            started_answer = False
+            saved_tokens = 0
+            for event in stream_answer(
+                user_input, tutor_agent, research_agent, quiz_agent, history=conversation, session_id=session_id
+            ):
+                if event["type"] == "progress":
+                    print(f"[{event['message']}]")
+                elif event["type"] == "history":
+                    saved_tokens = event["saved_tokens"]
+                elif event["type"] == "token":
+                    if not started_answer:
+                        print("\nAssistant:")
+                        started_answer = True
+                    print(event["text"], end="", flush=True)
+                elif event["type"] == "done":
+                    print(
+                        f"\n\n[first token after {event['ttft']:.1f}s, done in {event['elapsed']:.1f}s, "
+                        f"{saved_tokens} history tokens saved]\n"
+                    )
+                    conversation.add("user", user_input)
+                    conversation.add("assistant", event["answer"])
         except Exception as e:
-            print(f"[ERROR] Something went wrong: {e}")
+            print(f"\n[ERROR] Something went wrong: {e}")
             continue
 
-        print(f"Assistant:\n{answer}\n")
-
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,108 @@
+"""
+Inspect and maintain the documents in the knowledge base.
+
+Usage:
+    python manage_knowledge_base.py list [--tenant 3a-history]
+    python manage_knowledge_base.py delete notes.pdf [--tenant 3a-history]
+    python manage_knowledge_base.py tenants
+    python manage_knowledge_base.py reembed all-mpnet-base-v2 [--batch-size 64]
+    python manage_knowledge_base.py status
+
+reembed copies every chunk into a new collection embedded with the given
+sentence-transformers model while the current one keeps answering questions,
+then switches over. Running apps pick up the new model within a few seconds.
+"""
+import argparse
+import sys
+import time
+
+from tools.document_registry import get_document_registry
+from tools.vector_tool import (
+    INGEST_BATCH_SIZE,
+    collection_name,
+    delete_document,
+    get_active_embedding_model,
+    get_collection,
+    list_documents,
+    start_reembedding,
+)
+
+
+def print_documents(tenant=None):
+    documents = list_documents(tenant)
+    for record in documents:
+        updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(record.updated_at))
+        print(f"{record.source:50s} {record.chunk_count:6d} chunks  {record.embedding_model}  {updated}")
+    print(f"\n{len(documents)} documents")
+
+
+def print_tenants():
+    tenants = get_document_registry().tenants()
+    for tenant in tenants:
+        documents = list_documents(tenant)
+        print(f"{tenant:30s} {len(documents):4d} documents {sum(d.chunk_count for d in documents):8d} chunks")
+    print(f"\n{len(tenants)} tenants")
+
+
+def print_status():
+    model = get_active_embedding_model()
+    print(f"embedding model: {model}")
+    print(f"collection:      {collection_name(model)} ({get_collection().count()} chunks)")
+
+
+def reembed(model, batch_size):
+    try:
+        job = start_reembedding(model, batch_size=batch_size)
+    except RuntimeError as e:
+        print(e)
+        return 1
+
+    last_state = None
+    while job.is_alive():
+        status = job.status()
+        if status["state"] != last_state:
+            last_state = status["state"]
+            print(f"\n{last_state}...")
+        print(f"\r  {status['copied']}/{status['total']} chunks", end="", flush=True)
+        time.sleep(1)
+
+    status = job.status()
+    if status["state"] == "failed":
+        print(f"\nRe-embedding failed: {status['error']}")
+        return 1
+    print(f"\nThe knowledge base now uses {model} ({status['copied']} chunks embedded).")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the documents in the WW2 knowledge base.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="List the documents in the knowledge base.")
+    list_parser.add_argument("--tenant", default=None, help="List a class's documents instead of the base corpus.")
+    delete_parser = commands.add_parser("delete", help="Remove a document and all its chunks.")
+    delete_parser.add_argument("source", help="Filename (or corpus path) of the document.")
+    delete_parser.add_argument("--tenant", default=None, help="Class the document was uploaded for.")
+    commands.add_parser("tenants", help="List the classes with their own documents.")
+    reembed_parser = commands.add_parser("reembed", help="Re-embed everything with another model.")
+    reembed_parser.add_argument("model", help="sentence-transformers model name.")
+    reembed_parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    commands.add_parser("status", help="Show the active embedding model.")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        print_documents(args.tenant)
+    elif args.command == "tenants":
+        print_tenants()
+    elif args.command == "delete":
+        success, message = delete_document(args.source, args.tenant)
+        print(message)
+        return 0 if success else 1
+    elif args.command == "reembed":
+        return reembed(args.model, args.batch_size)
+    else:
+        print_status()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Retrieval-first routing for answer_question.
+
+Before the ResearchAgent spends LLM round-trips deciding which tool to call,
+the local knowledge base is searched directly. When the best passages score
+above the similarity/BM25 thresholds, they are handed straight to the tutor or
+quiz task and the research crew is skipped.
+
+Every answered question is recorded with its route, latency and LLM-call count
+so the thresholds can be tuned from real traffic. The log is rotated by size
+like the trace log (TELEMETRY_LOG_MAX_MB, TELEMETRY_LOG_BACKUPS).
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from tools.telemetry import JsonlLog
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROUTE_LOG_PATH = os.path.join(BASE_DIR, "data", "cache", "route_log.jsonl")
+
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1") != "0"
+ROUTER_K = int(os.getenv("ROUTER_K", "4"))
+ROUTER_MIN_SIMILARITY = float(os.getenv("ROUTER_MIN_SIMILARITY", "0.55"))
+ROUTER_MIN_BM25 = float(os.getenv("ROUTER_MIN_BM25", "6.0"))
+
+# Route names, also used as keys in the route statistics
+ROUTE_ANSWER_CACHE = "answer_cache"
+ROUTE_SEMANTIC_ANSWER = "semantic_answer"
+ROUTE_SEMANTIC_RESEARCH = "semantic_research"
+ROUTE_LOCAL = "local"
+ROUTE_RESEARCH = "research"
+
+
+@dataclass
+class RouteDecision:
+    route: str
+    confidence: float = 0.0
+    passages: List = field(default_factory=list)
+    reason: str = ""
+
+    def context(self) -> str:
+        """
+        Passages formatted as grounding for the tutor/quiz task.
+        """
+        lines = []
+        for idx, chunk in enumerate(self.passages, 1):
+            source = chunk.metadata.get("source", "notes")
+            lines.append(f"[{idx}] ({source}) {chunk.text}")
+        return "\n\n".join(lines)
+
+
+def route_question(
+    question: str,
+    retrieve=None,
+    k: int = ROUTER_K,
+    min_similarity: float = ROUTER_MIN_SIMILARITY,
+    min_bm25: float = ROUTER_MIN_BM25,
+    where: Optional[dict] = None,
+) -> RouteDecision:
+    """
+    Decide whether local notes are enough to answer the question.
+
+    retrieve defaults to tools.vector_tool.retrieve and can be swapped for a
+    stub. The decision is "local" when the best dense similarity or the best
+    BM25 score clears its threshold, "research" otherwise.
+    """
+    if retrieve is None:
+        from tools.vector_tool import retrieve
+
+    passages = retrieve(question, k=k, where=where)
+    if not passages:
+        return RouteDecision(ROUTE_RESEARCH, reason="no local passages")
+
+    best_similarity = max((p.similarity for p in passages if p.similarity is not None), default=0.0)
+    best_bm25 = max((p.bm25 for p in passages if p.bm25 is not None), default=0.0)
+
+    if best_similarity >= min_similarity:
+        return RouteDecision(ROUTE_LOCAL, best_similarity, passages, f"similarity {best_similarity:.2f}")
+    if best_bm25 >= min_bm25:
+        return RouteDecision(ROUTE_LOCAL, best_bm25, passages, f"bm25 {best_bm25:.2f}")
+
+    return RouteDecision(
+        ROUTE_RESEARCH,
+        best_similarity,
+        passages,
+        f"low confidence (similarity {best_similarity:.2f}, bm25 {best_bm25:.2f})",
+    )
+
+
+class RouteStats:
+    """
+    Per-route latency and LLM-call counters, mirrored to a JSONL log, plus
+    time-to-first-token of streamed answers and history token usage.
+    """
+
+    def __init__(self, log_path: Optional[str] = ROUTE_LOG_PATH):
+        self._log = None
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+        self._latency = defaultdict(float)
+        self._llm_calls = defaultdict(int)
+        self._ttft: List[float] = []
+        self._history = {"requests": 0, "sent_tokens": 0, "baseline_tokens": 0}
+
+    @property
+    def log_path(self) -> Optional[str]:
+        return self._log.path if self._log is not None else None
+
+    @log_path.setter
+    def log_path(self, path: Optional[str]) -> None:
+        # Assigning None (e.g. in benchmarks) closes the log and stops writing
+        if self._log is not None:
+            self._log.close()
+        self._log = JsonlLog(path) if path else None
+
+    def record(self, route: str, latency_seconds: float, llm_calls: int = 0, **extra) -> None:
+        with self._lock:
+            self._counts[route] += 1
+            self._latency[route] += latency_seconds
+            self._llm_calls[route] += llm_calls
+
+            if self._log is not None:
+                self._log.write({
+                    "ts": time.time(),
+                    "route": route,
+                    "latency_s": round(latency_seconds, 4),
+                    "llm_calls": llm_calls,
+                    **extra,
+                })
+
+    def record_ttft(self, ttft_seconds: float) -> None:
+        """
+        Record time-to-first-token of a streamed answer.
+        """
+        with self._lock:
+            self._ttft.append(ttft_seconds)
+            # Keep a bounded window of recent requests
+            del self._ttft[:-1000]
+
+    def record_history(self, sent_tokens: int, baseline_tokens: int) -> None:
+        """
+        Record prompt tokens spent on conversation history vs. sending the last turns verbatim.
+        """
+        with self._lock:
+            self._history["requests"] += 1
+            self._history["sent_tokens"] += sent_tokens
+            self._history["baseline_tokens"] += baseline_tokens
+
+    def history_summary(self) -> dict:
+        """
+        {"requests", "sent_tokens", "baseline_tokens", "saved_tokens"} totals.
+        """
+        with self._lock:
+            summary = dict(self._history)
+        summary["saved_tokens"] = max(summary["baseline_tokens"] - summary["sent_tokens"], 0)
+        return summary
+
+    def ttft_summary(self) -> dict:
+        """
+        {"count", "avg_s", "p50_s", "p95_s"} over recent streamed answers.
+        """
+        with self._lock:
+            values = sorted(self._ttft)
+        if not values:
+            return {"count": 0}
+        return {
+            "count": len(values),
+            "avg_s": sum(values) / len(values),
+            "p50_s": values[len(values) // 2],
+            "p95_s": values[min(len(values) - 1, int(len(values) * 0.95))],
+        }
+
+    def summary(self) -> dict:
+        """
+        {route: {"count", "avg_latency_s", "avg_llm_calls"}}
+        """
+        with self._lock:
+            return {
+                route: {
+                    "count": count,
+                    "avg_latency_s": self._latency[route] / count,
+                    "avg_llm_calls": self._llm_calls[route] / count,
+                }
+                for route, count in self._counts.items()
+            }
+
+
+route_stats = RouteStats()
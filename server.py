@@ -0,0 +1,332 @@
+"""
+Headless HTTP service around the tutor pipeline, for multi-user deployments.
+
+    uvicorn server:app --host 0.0.0.0 --port 8000
+
+answer_question is blocking, so requests are executed on a bounded worker
+pool. Waiting requests are queued per user and dispatched round-robin, so one
+student firing many questions cannot starve the rest of the class. When the
+queue is full (or a user already has too many pending questions) the server
+answers 429 instead of piling up work, and requests that cannot finish before
+their deadline get 504.
+
+Set TUTOR_FAKE_LLM=1 to run against the stub LLM for local load tests
+(see benchmarks/load_test.py).
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+
+from agents import answer_question, build_agents, build_llm, stream_answer
+from tools.telemetry import tracer
+from tools.tenants import normalize_tenant
+
+load_dotenv()
+
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "8"))
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", "200"))
+SERVER_MAX_PER_USER = int(os.getenv("SERVER_MAX_PER_USER", "3"))
+SERVER_DEADLINE = float(os.getenv("SERVER_DEADLINE", "120"))
+TUTOR_FAKE_LLM = os.getenv("TUTOR_FAKE_LLM", "0") == "1"
+TUTOR_FAKE_LLM_LATENCY = float(os.getenv("TUTOR_FAKE_LLM_LATENCY", "0.5"))
+
+
+class Saturated(Exception):
+    """The scheduler cannot accept more work right now (HTTP 429)."""
+
+
+class DeadlineExceeded(Exception):
+    """The request could not be completed before its deadline (HTTP 504)."""
+
+
+@dataclass
+class Job:
+    user_id: str
+    fn: Callable[[], Any]
+    deadline: float
+    future: "asyncio.Future" = None
+    abandoned: bool = False
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class FairScheduler:
+    """
+    Bounded worker pool with per-user round-robin queues.
+    """
+
+    def __init__(self, workers: int, max_queue: int, max_per_user: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tutor-worker")
+        self.queues: Dict[str, Deque[Job]] = {}
+        self.turns: Deque[str] = deque()  # users with queued jobs, in round-robin order
+        self.queued = 0
+        self.running = 0
+        self.stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0, "expired": 0}
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        asyncio.get_running_loop().create_task(self._dispatch_loop())
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "queued": self.queued,
+            "running": self.running,
+            "workers": self.workers,
+            "users_waiting": len(self.turns),
+        }
+
+    def enqueue(self, user_id: str, fn: Callable[[], Any], deadline_s: float) -> Job:
+        """
+        Queue a job or raise Saturated. Must be called on the event loop.
+        """
+        user_queue = self.queues.get(user_id)
+        if self.queued >= self.max_queue or (user_queue and len(user_queue) >= self.max_per_user):
+            self.stats["rejected"] += 1
+            raise Saturated()
+
+        job = Job(user_id, fn, time.monotonic() + deadline_s, asyncio.get_running_loop().create_future())
+        if user_queue is None:
+            user_queue = self.queues[user_id] = deque()
+        if not user_queue:
+            self.turns.append(user_id)
+        user_queue.append(job)
+        self.queued += 1
+        self.stats["accepted"] += 1
+        self._wakeup.set()
+        return job
+
+    async def wait(self, job: Job) -> Any:
+        """
+        Wait for a job's result, raising DeadlineExceeded past its deadline.
+        """
+        remaining = job.deadline - time.monotonic()
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout=max(remaining, 0))
+        except asyncio.TimeoutError:
+            job.abandoned = True
+            self.stats["expired"] += 1
+            raise DeadlineExceeded()
+
+    async def submit(self, user_id: str, fn: Callable[[], Any], deadline_s: float) -> Any:
+        return await self.wait(self.enqueue(user_id, fn, deadline_s))
+
+    def _next_job(self) -> Optional[Job]:
+        while self.turns:
+            user_id = self.turns.popleft()
+            user_queue = self.queues[user_id]
+            job = user_queue.popleft()
+            self.queued -= 1
+            if user_queue:
+                self.turns.append(user_id)  # back of the line
+            else:
+                del self.queues[user_id]
+            if job.abandoned or time.monotonic() >= job.deadline:
+                if not job.future.done():
+                    job.future.set_exception(DeadlineExceeded())
+                    job.future.exception()  # Mark retrieved; the waiter may be gone
+                continue
+            return job
+        return None
+
+    async def _dispatch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.running < self.workers:
+                job = self._next_job()
+                if job is None:
+                    break
+                self.running += 1
+                task = loop.run_in_executor(self.executor, job.fn)
+                task.add_done_callback(lambda t, job=job: self._finished(job, t))
+
+    def _finished(self, job: Job, task: "asyncio.Future") -> None:
+        self.running -= 1
+        if not job.future.done():
+            if task.exception() is not None:
+                self.stats["failed"] += 1
+                job.future.set_exception(task.exception())
+            else:
+                self.stats["completed"] += 1
+                job.future.set_result(task.result())
+        self._wakeup.set()
+
+
+# ---- Pipeline (LLM built once per process, agents once per worker thread) ----
+
+def _build_llm():
+    if TUTOR_FAKE_LLM:
+        from benchmarks.fakes import build_fake_llm
+        return build_fake_llm(latency=TUTOR_FAKE_LLM_LATENCY)
+    return build_llm()
+
+
+scheduler = FairScheduler(SERVER_WORKERS, SERVER_MAX_QUEUE, SERVER_MAX_PER_USER)
+_llm = None
+_llm_lock = threading.Lock()
+_worker_agents = threading.local()
+
+
+def get_llm():
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            _llm = _build_llm()
+        return _llm
+
+
+def get_agents():
+    """
+    Return this thread's own agent set, building it on first use.
+
+    CrewAI keeps per-run state on the agents (crew, executor, ...), so
+    concurrent requests must not share them; the LLM and RPM limit are shared.
+    Call from the worker thread that runs the request.
+    """
+    agents = getattr(_worker_agents, "agents", None)
+    if agents is None:
+        agents = _worker_agents.agents = build_agents(get_llm())
+    return agents
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    scheduler.start()
+    yield
+
+
+app = FastAPI(title="WW2 History Tutor", lifespan=_lifespan)
+
+
+class AskRequest(BaseModel):
+    question: str
+    mode: str = "Regular answer"
+    history: Optional[str] = None
+    user_id: str = Field("anonymous", description="Used for per-user fairness and limits.")
+    tenant: Optional[str] = Field(None, description="Class or teacher whose uploaded documents are searched too.")
+    session_id: Optional[str] = Field(
+        None, max_length=128, description="Chat session whose crew memories are used (defaults to user_id)."
+    )
+    deadline_s: float = Field(SERVER_DEADLINE, gt=0, le=SERVER_DEADLINE)
+
+    @field_validator("tenant")
+    @classmethod
+    def _normalize_tenant(cls, value: Optional[str]) -> Optional[str]:
+        return normalize_tenant(value)
+
+
+@app.get("/healthz")
+async def healthz() -> dict:
+    return {"status": "ok"}
+
+
+@app.get("/stats")
+async def stats() -> dict:
+    return scheduler.snapshot()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> str:
+    """
+    Prometheus scrape endpoint (request, LLM, tool and cache metrics).
+    """
+    return tracer.metrics.render_prometheus()
+
+
+@app.post("/ask")
+async def ask(request: AskRequest) -> dict:
+    def run() -> str:
+        tutor_agent, research_agent, quiz_agent = get_agents()
+        return answer_question(
+            request.question,
+            tutor_agent,
+            research_agent,
+            quiz_agent,
+            history=request.history,
+            mode=request.mode,
+            tenant=request.tenant,
+            session_id=request.session_id or request.user_id,
+        )
+
+    start = time.perf_counter()
+    try:
+        answer = await scheduler.submit(request.user_id, run, request.deadline_s)
+    except Saturated:
+        raise HTTPException(status_code=429, detail="Server busy, please retry shortly.", headers={"Retry-After": "5"})
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="The answer took too long.")
+    return {"answer": answer, "mode": request.mode, "latency_s": time.perf_counter() - start}
+
+
+@app.post("/ask/stream")
+async def ask_stream(request: AskRequest) -> StreamingResponse:
+    """
+    Same as /ask but streams stream_answer() events as NDJSON lines.
+    """
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Optional[dict]]" = asyncio.Queue()
+
+    def run() -> None:
+        try:
+            tutor_agent, research_agent, quiz_agent = get_agents()
+            for event in stream_answer(
+                request.question,
+                tutor_agent,
+                research_agent,
+                quiz_agent,
+                history=request.history,
+                mode=request.mode,
+                tenant=request.tenant,
+                session_id=request.session_id or request.user_id,
+            ):
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, {"type": "error", "message": str(e)})
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, None)
+
+    try:
+        job = scheduler.enqueue(request.user_id, run, request.deadline_s)
+    except Saturated:
+        raise HTTPException(status_code=429, detail="Server busy, please retry shortly.", headers={"Retry-After": "5"})
+
+    async def body():
+        waiter = asyncio.ensure_future(scheduler.wait(job))
+        while True:
+            get_event = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait({get_event, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if get_event in done:
+                event = get_event.result()
+                if event is None:
+                    break
+                yield json.dumps(event) + "\n"
+                continue
+            get_event.cancel()
+            if waiter.exception() is not None:
+                yield json.dumps({"type": "error", "message": "The answer took too long."}) + "\n"
+                break
+            # Job finished; drain whatever is left in the queue
+            while True:
+                event = await events.get()
+                if event is None:
+                    return
+                yield json.dumps(event) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
@@ -1,8 +1,16 @@
+import uuid
+
 import streamlit as st
 from dotenv import load_dotenv
-from agents import build_llm, build_agents, answer_question
-from tools.vector_tool import add_document_to_knowledge_base
+from agents import build_llm, build_agents, stream_answer
+from history import ConversationHistory, build_summarizer
+from tutor_client import TUTOR_API_URL, remote_stream_answer
+from tools.vector_tool import add_document_to_knowledge_base, delete_document, list_documents
 from tools.vision_tool import analyze_image
+from tools.answer_cache import get_answer_cache
+from router import route_stats
+from tools.telemetry import format_trace, tracer
+from tools.tenants import normalize_tenant
 
 # Load environment variables
 load_dotenv()
@@ -38,9 +46,23 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize LLM and Agents
-# Using cache_resource to avoid reloading the LLM on every rerun if possible
-llm = build_llm()
-tutor_agent, research_agent, quiz_agent = build_agents(llm)
+# cache_resource keeps one LLM per process instead of rebuilding it on every rerun
+@st.cache_resource
+def load_llm():
+    return build_llm()
+
+
+def load_agents():
+    # CrewAI keeps per-run state on the agents, so concurrent sessions each get
+    # their own set; it is built once per session, not on every rerun
+    if "agents" not in st.session_state:
+        st.session_state.agents = build_agents(load_llm())
+    return st.session_state.agents
+
+
+# With TUTOR_API_URL set the app is a thin client of server.py and runs no agents itself
+if not TUTOR_API_URL:
+    tutor_agent, research_agent, quiz_agent = load_agents()
 
 # Session State Initialization
 if "chat_history" not in st.session_state:
@@ -49,6 +71,19 @@ if "chat_history" not in st.session_state:
 if "mode" not in st.session_state:
     st.session_state.mode = "Regular answer"
 
+if "tenant" not in st.session_state:
+    st.session_state.tenant = None
+
+if "session_id" not in st.session_state:
+    # Crew memories are only recalled within the browser session that created them
+    st.session_state.session_id = uuid.uuid4().hex
+
+if "conversation" not in st.session_state:
+    # Token-budgeted history sent to the agents; older turns are summarized
+    st.session_state.conversation = ConversationHistory(
+        summarize=build_summarizer(None if TUTOR_API_URL else tutor_agent.llm)
+    )
+
 # --- Sidebar Controls ---
 with st.sidebar:
     st.header("⚙️ Settings")
@@ -59,6 +94,16 @@ with st.sidebar:
         help="Choose how the AI should respond to your questions."
     )
     
+    class_code = st.text_input(
+        "Class code:",
+        value=st.session_state.tenant or "",
+        help="Documents uploaded with a class code are only searched for that class, next to the shared notes."
+    )
+    try:
+        st.session_state.tenant = normalize_tenant(class_code)
+    except ValueError as e:
+        st.error(str(e))
+
     st.divider()
 
     st.subheader("📂 Upload Files")
@@ -73,12 +118,32 @@ with st.sidebar:
     if uploaded_doc is not None:
         if st.button("📄 Process Document", use_container_width=True):
             with st.spinner("Reading document with Docling..."):
-                success, message = add_document_to_knowledge_base(uploaded_doc, uploaded_doc.name)
+                progress_text = st.empty()
+
+                def report_progress(batches_done, chunks_done):
+                    progress_text.caption(f"Indexed {chunks_done} chunks ({batches_done} batches)...")
+
+                success, message = add_document_to_knowledge_base(
+                    uploaded_doc, uploaded_doc.name, progress_callback=report_progress, tenant=st.session_state.tenant
+                )
+                progress_text.empty()
                 if success:
                     st.success(message)
                 else:
                     st.error(message)
 
+    documents = list_documents(st.session_state.tenant)
+    if documents:
+        with st.expander(f"📚 Documents ({len(documents)})"):
+            for record in documents:
+                name_col, delete_col = st.columns([4, 1])
+                name_col.caption(f"{record.source} · {record.chunk_count} chunks")
+                if delete_col.button("🗑️", key=f"delete_{record.source}", help=f"Remove {record.source}"):
+                    success, message = delete_document(record.source, st.session_state.tenant)
+                    if success:
+                        st.rerun()
+                    st.error(message)
+
     st.markdown("---")
 
     # Image Upload (Vision with GPT-4.1-mini)
@@ -103,6 +168,9 @@ with st.sidebar:
                 st.session_state.chat_history.append(
                     ("assistant", f"*[System Note: I analyzed an uploaded image. Description: {description}]*", "Vision Analysis")
                 )
+                st.session_state.conversation.add(
+                    "assistant", f"Image analysis: {description}", "Vision Analysis"
+                )
 
                 st.rerun()
 
@@ -110,9 +178,42 @@ with st.sidebar:
     
     if st.button("🗑️ Clear Chat", type="primary", use_container_width=True):
         st.session_state.chat_history = []
+        st.session_state.conversation.clear()
         st.rerun()
     
     st.markdown("---")
+    cache_stats = get_answer_cache().stats()
+    st.caption(
+        f"Answer cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+        f"({cache_stats['entries']} stored)"
+    )
+    routes = route_stats.summary()
+    if routes:
+        with st.expander("Routing stats"):
+            ttft = route_stats.ttft_summary()
+            if ttft["count"]:
+                st.caption(f"Time to first token: {ttft['p50_s']:.2f}s p50, {ttft['p95_s']:.2f}s p95")
+            history_usage = route_stats.history_summary()
+            if history_usage["requests"]:
+                st.caption(
+                    f"History: {history_usage['sent_tokens']} prompt tokens sent, "
+                    f"{history_usage['saved_tokens']} saved over {history_usage['requests']} questions"
+                )
+            for route_name, route_summary in routes.items():
+                st.caption(
+                    f"{route_name}: {route_summary['count']}x, "
+                    f"{route_summary['avg_latency_s']:.2f}s avg, "
+                    f"{route_summary['avg_llm_calls']:.1f} LLM calls avg"
+                )
+    if st.checkbox("Show debug panel", value=False, help="Spans and metrics of recent requests."):
+        traces = tracer.recent_traces(limit=1)
+        with st.expander("🔍 Last request", expanded=True):
+            if traces:
+                st.code(format_trace(traces[0]), language=None)
+            else:
+                st.caption("No requests traced yet.")
+        with st.expander("📈 Metrics"):
+            st.code(tracer.metrics.render_prometheus(), language=None)
     st.caption("Powered by CrewAI, Docling & GPT-4o")
 
 # --- Main Interface ---
@@ -140,30 +241,56 @@ if prompt := st.chat_input("Ask a question (e.g., 'What happened on D-Day?')..."
     
     # 3. Generate Answer
     with st.chat_message("assistant"):
-        with st.spinner("Analyzing history books..."):
-            try:
-                # Construct history string from last 6 turns for context
-                history_lines = []
-                for r, c, m in st.session_state.chat_history[-6:]:
-                    prefix = "User" if r == "user" else "Assistant"
-                    history_lines.append(f"{prefix}: {c}")
-                history_text = "\n".join(history_lines)
-                
-                response = answer_question(
+        try:
+            conversation = st.session_state.conversation
+            status = st.status("Analyzing history books...")
+            final = {}
+
+            if TUTOR_API_URL:
+                events = remote_stream_answer(
+                    prompt,
+                    history=conversation.render(prompt),
+                    mode=current_mode,
+                    tenant=st.session_state.tenant,
+                    # Each browser session is its own user in the server's fair scheduling
+                    user_id=st.session_state.session_id,
+                    session_id=st.session_state.session_id,
+                )
+            else:
+                events = stream_answer(
                     prompt,
                     tutor_agent,
                     research_agent,
                     quiz_agent,
-                    history=history_text,
+                    history=conversation,
                     mode=current_mode,
+                    tenant=st.session_state.tenant,
+                    session_id=st.session_state.session_id,
                 )
-                
-                st.markdown(response)
-                if current_mode != "Regular answer":
-                    st.caption(f"Mode: {current_mode}")
-                
-                # 4. Add Assistant response to history
-                st.session_state.chat_history.append(("assistant", response, current_mode))
-                
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
\ No newline at end of file
+
+            def answer_tokens():
+                # Progress events update the status box, tokens are streamed into the chat
+                for event in events:
+                    if event["type"] == "progress":
+                        status.update(label=event["message"])
+                    elif event["type"] == "history" and event["saved_tokens"]:
+                        status.update(label=f"History trimmed, {event['saved_tokens']} prompt tokens saved...")
+                    elif event["type"] == "token":
+                        yield event["text"]
+                    elif event["type"] == "done":
+                        final.update(event)
+
+            st.write_stream(answer_tokens())
+            status.update(label=f"Done (first token after {final['ttft']:.1f}s)", state="complete")
+            response = final["answer"]
+
+            if current_mode != "Regular answer":
+                st.caption(f"Mode: {current_mode}")
+
+            # 4. Add Assistant response to history
+            st.session_state.chat_history.append(("assistant", response, current_mode))
+            conversation.add("user", prompt, current_mode)
+            conversation.add("assistant", response, current_mode)
+
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("crewai")
+
+import agents
+from agents import build_agents, stream_answer
+from benchmarks.fakes import HashingEmbeddingFunction, build_fake_llm
+from router import route_stats
+from tools import memory_store
+from tools.telemetry import tracer
+
+
+@pytest.fixture
+def crew_agents(monkeypatch, tmp_path):
+    """
+    Agents on the fake LLM, with no research fan-out and all state in tmp_path.
+    """
+    monkeypatch.setattr(agents, "CREW_MAX_RPM", 0)
+    monkeypatch.setattr(agents, "FANOUT_ENABLED", False)
+    monkeypatch.setattr(route_stats, "log_path", None)
+    monkeypatch.setattr(tracer, "log_path", None)
+    llm = build_fake_llm()
+    storage = memory_store.BoundedMemoryStorage(path=str(tmp_path / "memory.sqlite"))
+    # Local embeddings, so the crew memory makes no network calls either
+    monkeypatch.setattr(agents, "_shared_memory", memory_store.SessionMemory(
+        llm=llm, root_scope="/crew/test", storage=storage, embedder=HashingEmbeddingFunction(),
+    ))
+    return build_agents(llm)
+
+
+def ask(question, crew_agents, mode="Regular answer"):
+    events = list(stream_answer(question, *crew_agents, mode=mode, use_cache=False, use_router=False))
+    return events[-1]
+
+
+def test_streamed_questions_reuse_the_crew_template(crew_agents, monkeypatch):
+    built = []
+    build_crew = agents.build_crew
+
+    def counting_build_crew(*args, **kwargs):
+        built.append(args[0])
+        return build_crew(*args, **kwargs)
+
+    monkeypatch.setattr(agents, "build_crew", counting_build_crew)
+
+    for question in ["Who led the Afrika Korps?", "When did Operation Overlord start?", "What was Enigma?"]:
+        done = ask(question, crew_agents)
+        assert done["type"] == "done"
+        assert done["answer"].startswith("Stub answer")
+
+    # Every stream runs on another thread than the previous one, but the crew is built once
+    assert built == ["Regular answer"]
+
+
+def test_no_history_reports_no_history_tokens(crew_agents):
+    events = list(stream_answer("What was Enigma?", *crew_agents, use_cache=False, use_router=False))
+    (history,) = [event for event in events if event["type"] == "history"]
+    assert history["sent_tokens"] == 0
+    assert history["baseline_tokens"] == 0
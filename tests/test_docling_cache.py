@@ -0,0 +1,27 @@
+import os
+import threading
+
+from tools.docling_cache import _write_cache
+
+
+def test_concurrent_writers_do_not_collide(tmp_path):
+    path = str(tmp_path / "ab" / "abcdef.json")
+    payloads = [f'{{"writer": {i}, "text": "{"x" * 100_000}"}}' for i in range(8)]
+    errors = []
+
+    def write(text):
+        try:
+            _write_cache(path, text)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(text,)) for text in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with open(path, "r", encoding="utf-8") as f:
+        assert f.read() in payloads
+    assert os.listdir(os.path.dirname(path)) == ["abcdef.json"]
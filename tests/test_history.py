@@ -0,0 +1,12 @@
+from history import ConversationHistory
+from tools.chunker import approx_token_count
+
+
+def test_empty_text_costs_no_tokens():
+    assert approx_token_count("") == 0
+    assert approx_token_count("  \n ") == 0
+    assert approx_token_count("Operation Overlord") == 3
+
+
+def test_empty_history_renders_within_budget():
+    assert approx_token_count(ConversationHistory().render("When was D-Day?")) == 0
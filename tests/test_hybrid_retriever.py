@@ -0,0 +1,114 @@
+import threading
+
+from tools.hybrid_retriever import BM25Index, HybridRetriever, SqliteBM25Index
+
+
+class FakeCollection:
+    """
+    The parts of a Chroma collection the BM25 side of the retriever uses.
+    """
+
+    def __init__(self, docs=None):
+        self.docs = dict(docs or {})
+        self.before_page = None  # called before every page read, to interleave writes
+
+    def count(self):
+        return len(self.docs)
+
+    def get(self, ids=None, include=None, limit=None, offset=0):
+        if self.before_page is not None:
+            self.before_page(offset)
+        keys = list(self.docs) if ids is None else [i for i in ids if i in self.docs]
+        keys = keys[offset:offset + limit] if limit is not None else keys
+        return {"ids": keys, "documents": [self.docs[k] for k in keys], "metadatas": [{} for _ in keys]}
+
+
+def bm25_ids(retriever, query):
+    return [doc_id for doc_id, _ in retriever.bm25.search(query, 10)]
+
+
+def test_bm25_scores_match_between_memory_and_sqlite(tmp_path):
+    items = [
+        ("a", "The 101st Airborne landed in Normandy", {}),
+        ("b", "Operation Market Garden and the 101st Airborne", {}),
+        ("c", "The Eastern Front and the Battle of Kursk", {}),
+    ]
+    memory, disk = BM25Index(), SqliteBM25Index(str(tmp_path / "bm25.sqlite"))
+    memory.add_many(items)
+    disk.add_many(items)
+
+    expected = memory.search("101st Airborne Normandy", 3)
+    actual = disk.search("101st Airborne Normandy", 3)
+    assert [doc_id for doc_id, _ in actual] == [doc_id for doc_id, _ in expected]
+    for (_, a), (_, b) in zip(actual, expected):
+        assert abs(a - b) < 1e-9
+
+
+def test_rebuild_when_the_version_changes():
+    collection = FakeCollection({"a": "Panzer II light tank"})
+    version = {"value": "1"}
+    retriever = HybridRetriever(collection, version_fn=lambda: version["value"], check_interval=0)
+    retriever.ensure_index()
+
+    # Another process adds a chunk and bumps the version
+    collection.docs["b"] = "Tiger I heavy tank"
+    version["value"] = "2"
+    retriever.ensure_index()
+
+    assert sorted(bm25_ids(retriever, "tank")) == ["a", "b"]
+
+
+def test_writes_during_a_rebuild_are_not_lost():
+    collection = FakeCollection({f"old{i}": "Eastern Front" for i in range(3)})
+    version = {"value": "1"}
+    retriever = HybridRetriever(collection, version_fn=lambda: version["value"], check_interval=0)
+    retriever.ensure_index()
+
+    written = threading.Event()
+
+    def write_concurrently(offset):
+        if offset == 0 and not written.is_set():
+            def write():
+                collection.docs["new"] = "Operation Bagration"
+                retriever.index_chunks(["new"], ["Operation Bagration"], [{}])
+                written.set()
+            threading.Thread(target=write).start()
+            # The write waits for the rebuild instead of landing in the old index
+            assert not written.wait(0.2)
+
+    collection.before_page = write_concurrently
+    version["value"] = "2"
+    retriever.ensure_index()
+    assert written.wait(5)
+    collection.before_page = None
+    retriever.mark_current()
+
+    assert bm25_ids(retriever, "Bagration") == ["new"]
+
+
+def test_persistent_index_is_built_once_and_survives_restarts(tmp_path):
+    collection = FakeCollection({"a": "Battle of Kursk", "b": "Battle of the Bulge"})
+    path = str(tmp_path / "bm25.sqlite")
+    HybridRetriever(collection, bm25=SqliteBM25Index(path)).ensure_index()
+
+    reads = []
+    collection.before_page = reads.append
+    restarted = HybridRetriever(collection, bm25=SqliteBM25Index(path))
+    restarted.ensure_index()
+
+    assert reads == []
+    assert sorted(bm25_ids(restarted, "battle")) == ["a", "b"]
+
+
+def test_persistent_index_repairs_a_lost_write(tmp_path):
+    collection = FakeCollection({"a": "Battle of Kursk", "b": "Battle of the Bulge"})
+    retriever = HybridRetriever(collection, bm25=SqliteBM25Index(str(tmp_path / "bm25.sqlite")), check_interval=0)
+    retriever.ensure_index()
+
+    # A writer crashed after the collection upsert, before the index write
+    collection.docs["c"] = "Battle of Midway"
+    retriever.ensure_index()
+    assert "c" not in bm25_ids(retriever, "Midway")  # maybe still in progress
+
+    retriever.ensure_index()
+    assert bm25_ids(retriever, "Midway") == ["c"]
@@ -0,0 +1,39 @@
+import os
+
+import ingest_corpus
+from ingest_corpus import plan_files
+
+
+def test_source_key_does_not_depend_on_root(tmp_path, monkeypatch):
+    corpus = tmp_path / "data" / "pdfs"
+    corpus.mkdir(parents=True)
+    (corpus / "overlord.txt").write_text("Operation Overlord began on 6 June 1944.", encoding="utf-8")
+    monkeypatch.setattr(ingest_corpus, "BASE_DIR", str(tmp_path))
+
+    from_data, _ = plan_files(str(tmp_path / "data"), {})
+    from_pdfs, _ = plan_files(str(corpus), {})
+
+    assert [key for _, key, _, _ in from_data] == ["data/pdfs/overlord.txt"]
+    assert [key for _, key, _, _ in from_pdfs] == ["data/pdfs/overlord.txt"]
+
+
+def test_unchanged_file_is_skipped_from_another_root(tmp_path, monkeypatch):
+    corpus = tmp_path / "data"
+    corpus.mkdir()
+    (corpus / "midway.md").write_text("The Battle of Midway, June 1942.", encoding="utf-8")
+    monkeypatch.setattr(ingest_corpus, "BASE_DIR", str(tmp_path))
+
+    todo, _ = plan_files(str(corpus), {})
+    checkpoint = {key: {"mtime": mtime, "sha256": sha} for _, key, mtime, sha in todo}
+    monkeypatch.chdir(corpus)
+
+    assert plan_files(".", checkpoint) == ([], 1)
+
+
+def test_files_outside_the_project_use_absolute_paths(tmp_path, monkeypatch):
+    (tmp_path / "notes.txt").write_text("Stalingrad", encoding="utf-8")
+    monkeypatch.setattr(ingest_corpus, "BASE_DIR", os.path.join(str(tmp_path), "project"))
+
+    todo, _ = plan_files(str(tmp_path), {})
+
+    assert [key for _, key, _, _ in todo] == [str(tmp_path / "notes.txt")]
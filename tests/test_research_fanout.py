@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from tools.research_fanout import ResearchSource, enough_sources, fan_out
+
+
+@pytest.fixture
+def release():
+    # Lets blocked fake sources finish once the test is done with them
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def answer(text, delay=0.0):
+    def search(query):
+        time.sleep(delay)
+        return text
+    return search
+
+
+def blocked(release):
+    def search(query):
+        release.wait(5)
+        return "late passage"
+    return search
+
+
+def test_merges_and_deduplicates_passages():
+    bundle = fan_out("q", [
+        ResearchSource("local_notes", answer("The Panzer II was a light tank.\n\nIt entered service in 1936.")),
+        ResearchSource("wikipedia", answer("the panzer II was a light tank!\n\nIt was built by MAN.")),
+    ], good_enough=lambda b: False)
+
+    texts = [e.text for e in bundle.evidence]
+    assert len(texts) == 3
+    assert "It entered service in 1936." in texts
+    assert "It was built by MAN." in texts
+    assert bundle.sources == ["local_notes", "wikipedia"]
+
+
+def test_slow_source_is_abandoned_at_its_deadline(release):
+    start = time.perf_counter()
+    bundle = fan_out("q", [
+        ResearchSource("local_notes", answer("notes")),
+        ResearchSource("wikipedia", blocked(release), timeout=0.2),
+    ], good_enough=lambda b: False)
+
+    assert time.perf_counter() - start < 2
+    assert bundle.timed_out == ["wikipedia"]
+    assert bundle.sources == ["local_notes"]
+
+
+def test_failing_and_empty_sources_give_no_evidence():
+    def broken(query):
+        raise RuntimeError("boom")
+
+    bundle = fan_out("q", [
+        ResearchSource("local_notes", answer("No relevant information found in the notes.")),
+        ResearchSource("wikipedia", broken),
+        ResearchSource("web", answer("Error: no API key")),
+    ])
+
+    assert bundle.evidence == []
+    assert bundle.failed == ["wikipedia"]
+    assert set(bundle.timings) == {"local_notes", "wikipedia", "web"}
+
+
+def test_stops_once_the_evidence_is_good_enough(release):
+    start = time.perf_counter()
+    bundle = fan_out("q", [
+        ResearchSource("local_notes", answer("notes")),
+        ResearchSource("wikipedia", answer("article")),
+        ResearchSource("slow", blocked(release)),
+    ], good_enough=enough_sources(2))
+
+    assert time.perf_counter() - start < 2
+    assert bundle.sources == ["local_notes", "wikipedia"]
+    assert bundle.timed_out == ["slow"]
+
+
+def test_hedged_source_is_skipped_when_not_needed():
+    calls = []
+
+    def web(query):
+        calls.append(query)
+        return "web result"
+
+    bundle = fan_out("q", [
+        ResearchSource("local_notes", answer("notes")),
+        ResearchSource("wikipedia", answer("article")),
+        ResearchSource("web", web, hedge=5),
+    ], good_enough=enough_sources(2))
+
+    assert calls == []
+    assert bundle.skipped == ["web"]
+    assert bundle.sources == ["local_notes", "wikipedia"]
+
+
+def test_hedged_source_starts_when_the_others_are_weak():
+    bundle = fan_out("q", [
+        ResearchSource("local_notes", answer("No relevant information found in the notes.")),
+        ResearchSource("wikipedia", answer("article")),
+        ResearchSource("web", answer("web result"), hedge=5),
+    ], good_enough=enough_sources(2))
+
+    # Everything else finished without enough evidence, so the web search starts
+    # right away instead of after the full hedge delay
+    assert bundle.skipped == []
+    assert bundle.sources == ["web", "wikipedia"]
+
+
+def test_hedged_source_starts_after_its_delay(release):
+    start = time.perf_counter()
+    bundle = fan_out("q", [
+        ResearchSource("local_notes", answer("notes")),
+        ResearchSource("wikipedia", blocked(release), timeout=2),
+        ResearchSource("web", answer("web result"), hedge=0.2),
+    ], good_enough=enough_sources(2))
+
+    assert 0.2 <= bundle.timings["web"] < 1.5
+    assert time.perf_counter() - start < 1.5
+    assert bundle.sources == ["local_notes", "web"]
+    assert bundle.timed_out == ["wikipedia"]
@@ -0,0 +1,81 @@
+import numpy as np
+
+from tools.semantic_cache import SemanticCache
+
+DIM = 8
+
+
+def one_hot(i):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[i % DIM] = 1.0
+    return vector
+
+
+def make_cache(**kwargs):
+    # Questions embed by their first word, so "a ..." and "a ... again" are paraphrases
+    vocab = {}
+
+    def embed(texts):
+        return [one_hot(vocab.setdefault(text.split()[0], len(vocab))) for text in texts]
+
+    return SemanticCache(embed_fn=embed, answer_threshold=0.97, research_threshold=0.85, **kwargs)
+
+
+def test_paraphrase_reuses_the_answer():
+    cache = make_cache()
+    cache.add("Dday when was it", "Regular answer", "v1", research_summary="facts", answer="6 June 1944")
+
+    hit = cache.lookup("Dday what date", "Regular answer", "v1")
+    assert hit.answer == "6 June 1944"
+    assert cache.lookup("Dday what date", "Quiz", "v1") is None
+    assert cache.lookup("Dday what date", "Regular answer", "v2") is None
+
+
+def test_different_numbers_never_match():
+    cache = make_cache()
+    cache.add("Airborne the 101st", "Regular answer", "v1", answer="Screaming Eagles")
+    assert cache.lookup("Airborne the 82nd", "Regular answer", "v1") is None
+
+
+def test_full_cache_replaces_the_least_recently_used_entry():
+    cache = make_cache(max_entries=3)
+    for word in ["a", "b", "c"]:
+        cache.add(f"{word} question", "Regular answer", "v1", answer=word)
+    cache.lookup("a question", "Regular answer", "v1")  # a is now more recent than b
+
+    cache.add("d question", "Regular answer", "v1", answer="d")
+
+    assert len(cache) == 3
+    assert cache.lookup("b question", "Regular answer", "v1") is None
+    assert cache.lookup("a question", "Regular answer", "v1").answer == "a"
+    assert cache.lookup("d question", "Regular answer", "v1").answer == "d"
+
+
+def test_adds_grow_the_buffer_geometrically():
+    cache = make_cache(max_entries=1000)
+    reallocations, buffer = 0, None
+    for i in range(200):
+        cache.add(f"q{i} question", "Regular answer", "v1", answer=str(i), vector=one_hot(i))
+        if cache._buffer is not buffer:
+            reallocations, buffer = reallocations + 1, cache._buffer
+    assert reallocations <= 6
+    assert cache._matrix.shape == (200, DIM)
+
+
+def test_flush_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "semantic_cache")
+    cache = make_cache(flush_every=2)
+    cache.add("a question", "Regular answer", "v1", answer="a")
+    cache.save(path)
+    assert not (tmp_path / "semantic_cache.npy").exists()  # not due yet
+
+    cache.add("b question", "Regular answer", "v1", answer="b")
+    cache.save(path)
+    restored = make_cache()
+    restored.embed_fn = cache.embed_fn
+    restored.load(path)
+
+    assert len(restored) == 2
+    assert restored.lookup("b question", "Regular answer", "v1").answer == "b"
+    restored.add("c question", "Regular answer", "v1", answer="c")
+    assert len(restored) == 3
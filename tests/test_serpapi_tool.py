@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("crewai")
+
+from tools.serpapi_tool import SearchResultCache, SerpApiClient, TokenBucket
+
+
+class FakeSearch:
+    """
+    Stand-in for GoogleSearch: counts calls and can hold them until released.
+    """
+
+    def __init__(self, hold: bool = False):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def __call__(self, params):
+        self.calls.append(params["q"])
+        self.started.set()
+        self.release.wait(5)
+        return {"organic_results": [{"title": params["q"], "snippet": "...", "link": "https://example.org"}]}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SearchResultCache(path=str(tmp_path / "serpapi.sqlite"))
+
+
+def test_token_bucket_allows_a_burst_then_throttles():
+    bucket = TokenBucket(rate=0.001, capacity=3)
+    assert [bucket.acquire() for _ in range(3)] == [True, True, True]
+    assert bucket.acquire() is False
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate=50, capacity=1)
+    assert bucket.acquire()
+    assert bucket.acquire(timeout=0.5)
+
+
+def test_search_result_cache_expires(cache):
+    cache.set("q|3", {"organic_results": []})
+    assert cache.get("q|3") == {"organic_results": []}
+
+    cache.ttl_seconds = -1
+    assert cache.get("q|3") is None
+
+
+def test_repeated_queries_are_served_from_the_cache(cache):
+    search = FakeSearch()
+    client = SerpApiClient(search_fn=search, cache=cache, limiter=TokenBucket(1, 10))
+
+    first = client.search("Battle of Kursk", "key")
+    # Normalized: case and whitespace do not matter
+    second = client.search("  battle of   KURSK ", "key")
+
+    assert first == second
+    assert search.calls == ["Battle of Kursk"]
+    assert client.stats()["hits"] == 1
+    assert client.stats()["requests"] == 1
+
+
+def test_concurrent_identical_queries_are_coalesced(cache):
+    search = FakeSearch(hold=True)
+    client = SerpApiClient(search_fn=search, cache=cache, limiter=TokenBucket(1, 10))
+    results = []
+
+    def ask():
+        results.append(client.search("Operation Overlord", "key"))
+
+    leader = threading.Thread(target=ask)
+    leader.start()
+    assert search.started.wait(5)
+    followers = [threading.Thread(target=ask) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    # Give the followers time to join the in-flight request before it completes
+    deadline = time.monotonic() + 5
+    while client.stats()["coalesced"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    search.release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert search.calls == ["Operation Overlord"]
+    assert len(results) == 4
+    assert client.stats()["coalesced"] == 3
+
+
+def test_no_request_is_sent_without_a_token(cache, monkeypatch):
+    monkeypatch.setattr("tools.serpapi_tool.SERPAPI_MAX_WAIT", 0)
+    search = FakeSearch()
+    client = SerpApiClient(search_fn=search, cache=cache, limiter=TokenBucket(0.001, 1))
+
+    client.search("first", "key")
+    with pytest.raises(RuntimeError):
+        client.search("second", "key")
+
+    assert search.calls == ["first"]
+    assert client.stats()["throttled"] == 1
+
+
+def test_error_responses_are_not_cached(cache):
+    client = SerpApiClient(search_fn=lambda params: {"error": "Invalid API key."}, cache=cache,
+                           limiter=TokenBucket(1, 10))
+    client.search("q", "bad key")
+    assert cache.get("q|3") is None
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("crewai")
+
+import server
+from server import DeadlineExceeded, FairScheduler, Saturated
+
+
+def run_with_scheduler(scenario, workers=1, max_queue=100, max_per_user=10):
+    scheduler = FairScheduler(workers, max_queue, max_per_user)
+
+    async def main():
+        scheduler.start()
+        return await scenario(scheduler)
+
+    try:
+        return asyncio.run(main())
+    finally:
+        scheduler.executor.shutdown(wait=True)
+
+
+async def occupy_worker(scheduler, release):
+    # A job that holds the only worker so the following jobs queue up
+    job = scheduler.enqueue("blocker", lambda: release.wait(5), deadline_s=10)
+    await asyncio.sleep(0.05)
+    return job
+
+
+def test_users_are_served_round_robin():
+    order = []
+    release = threading.Event()
+
+    async def scenario(scheduler):
+        blocker = await occupy_worker(scheduler, release)
+        jobs = [
+            scheduler.enqueue(user, lambda name=f"{user}{i}": order.append(name), deadline_s=10)
+            for user, i in [("alice", 1), ("alice", 2), ("alice", 3), ("bob", 1), ("carol", 1)]
+        ]
+        release.set()
+        await asyncio.gather(*(scheduler.wait(job) for job in [blocker, *jobs]))
+
+    run_with_scheduler(scenario)
+
+    # alice queued three questions first, but bob and carol do not wait behind all of them
+    assert order == ["alice1", "bob1", "carol1", "alice2", "alice3"]
+
+
+def test_rejects_when_a_user_has_too_many_pending():
+    release = threading.Event()
+
+    async def scenario(scheduler):
+        jobs = [await occupy_worker(scheduler, release)]
+        jobs.append(scheduler.enqueue("alice", lambda: None, deadline_s=10))
+        jobs.append(scheduler.enqueue("alice", lambda: None, deadline_s=10))
+        with pytest.raises(Saturated):
+            scheduler.enqueue("alice", lambda: None, deadline_s=10)
+        # Other users are still accepted
+        jobs.append(scheduler.enqueue("bob", lambda: None, deadline_s=10))
+        release.set()
+        await asyncio.gather(*(scheduler.wait(job) for job in jobs))
+        return scheduler.snapshot()
+
+    stats = run_with_scheduler(scenario, max_per_user=2)
+    assert stats["rejected"] == 1
+    assert stats["accepted"] == 4
+
+
+def test_rejects_when_the_queue_is_full():
+    release = threading.Event()
+
+    async def scenario(scheduler):
+        jobs = [await occupy_worker(scheduler, release)]
+        jobs.append(scheduler.enqueue("alice", lambda: None, deadline_s=10))
+        jobs.append(scheduler.enqueue("bob", lambda: None, deadline_s=10))
+        with pytest.raises(Saturated):
+            scheduler.enqueue("carol", lambda: None, deadline_s=10)
+        release.set()
+        await asyncio.gather(*(scheduler.wait(job) for job in jobs))
+
+    run_with_scheduler(scenario, max_queue=2)
+
+
+def test_expired_jobs_are_never_started():
+    ran = []
+    release = threading.Event()
+
+    async def scenario(scheduler):
+        blocker = await occupy_worker(scheduler, release)
+        job = scheduler.enqueue("alice", lambda: ran.append("alice"), deadline_s=0.05)
+        with pytest.raises(DeadlineExceeded):
+            await scheduler.wait(job)
+        release.set()
+        await scheduler.wait(blocker)
+        await asyncio.sleep(0.05)
+        return scheduler.snapshot()
+
+    stats = run_with_scheduler(scenario)
+    assert ran == []
+    assert stats["expired"] == 1
+    assert stats["queued"] == 0
+
+
+def test_each_worker_thread_gets_its_own_agents(monkeypatch):
+    built = []
+    llm = object()
+
+    def fake_build_agents(shared_llm):
+        assert shared_llm is llm
+        agents = (object(), object(), object())
+        built.append(agents)
+        return agents
+
+    monkeypatch.setattr(server, "_worker_agents", threading.local())
+    monkeypatch.setattr(server, "_llm", llm)
+    monkeypatch.setattr(server, "build_agents", fake_build_agents)
+
+    barrier = threading.Barrier(3)
+
+    def two_requests(_):
+        barrier.wait(5)  # all three threads are busy at the same time
+        return server.get_agents(), server.get_agents()
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        per_thread = list(pool.map(two_requests, range(3)))
+
+    assert len(built) == 3
+    assert all(first is second for first, second in per_thread)
+    assert len({id(first) for first, _ in per_thread}) == 3
+
+
+def test_app_startup_starts_the_scheduler(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    scheduler = FairScheduler(1, 10, 3)
+    monkeypatch.setattr(server, "scheduler", scheduler)
+    with TestClient(server.app) as client:
+        assert client.get("/stats").json()["workers"] == 1
+        assert scheduler._wakeup is not None
+    scheduler.executor.shutdown(wait=True)
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from tools import telemetry
+from tools.research_fanout import ResearchSource, fan_out
+from tools.telemetry import JsonlLog, Tracer, format_trace, span, traced
+
+
+@pytest.fixture
+def tracer(monkeypatch, tmp_path):
+    # A fresh tracer per test, logging to a temporary file
+    fresh = Tracer(str(tmp_path / "traces.jsonl"))
+    monkeypatch.setattr(telemetry, "tracer", fresh)
+    monkeypatch.setattr(telemetry, "TELEMETRY_ENABLED", True)
+    return fresh
+
+
+def spans_by_name(tracer):
+    (trace,) = tracer.recent_traces()
+    return {s.name: s for s in trace}
+
+
+def test_spans_nest_under_the_request(tracer):
+    with span("answer_question", kind="request") as request:
+        with span("fanout") as stage:
+            with span("vector.search", kind="tool"):
+                pass
+
+    spans = spans_by_name(tracer)
+    assert request.parent_id is None
+    assert spans["fanout"].parent_id == request.span_id
+    assert spans["vector.search"].parent_id == stage.span_id
+    assert {s.trace_id for s in spans.values()} == {request.trace_id}
+
+
+def test_spans_outside_a_request_have_no_trace(tracer):
+    with span("vector.search", kind="tool") as orphan:
+        pass
+    assert orphan.trace_id is None
+    assert tracer.recent_traces() == []
+
+
+def test_exceptions_mark_the_span_failed(tracer):
+    with pytest.raises(ValueError):
+        with span("answer_question", kind="request"):
+            raise ValueError("boom")
+
+    (request,) = tracer.recent_traces()[0]
+    assert request.status == "error"
+    assert request.attributes["error"] == "boom"
+
+
+def test_traced_tools_reporting_errors_are_marked_failed(tracer):
+    @traced("wikipedia.search")
+    def search(query):
+        return "Error: no results"
+
+    with span("answer_question", kind="request"):
+        search("Kursk")
+
+    assert spans_by_name(tracer)["wikipedia.search"].status == "error"
+    assert tracer.metrics.counter_value("tutor_tool_calls_total", tool="wikipedia.search", status="error") == 1
+
+
+def test_fan_out_threads_join_the_request_trace(tracer):
+    @traced("wikipedia.search")
+    def wikipedia(query):
+        return "article"
+
+    @traced("vector.search")
+    def notes(query):
+        return "notes"
+
+    with span("answer_question", kind="request"):
+        with span("fanout") as stage:
+            fan_out("q", [ResearchSource("wikipedia", wikipedia), ResearchSource("local_notes", notes)])
+
+    spans = spans_by_name(tracer)
+    assert spans["wikipedia.search"].parent_id == stage.span_id
+    assert spans["vector.search"].parent_id == stage.span_id
+    assert format_trace(tracer.recent_traces()[0]).splitlines()[1].startswith("  stage:fanout")
+
+
+def test_finished_spans_are_written_to_the_log(tracer, tmp_path):
+    with span("answer_question", kind="request", route="local"):
+        pass
+
+    with open(tmp_path / "traces.jsonl", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["name"] for r in records] == ["answer_question"]
+    assert records[0]["attributes"] == {"route": "local"}
+
+
+def test_log_path_none_stops_writing(tracer, tmp_path):
+    tracer.log_path = None
+    with span("answer_question", kind="request"):
+        pass
+    assert not (tmp_path / "traces.jsonl").exists()
+
+
+def test_jsonl_log_rotates_by_size(tmp_path):
+    path = tmp_path / "route_log.jsonl"
+    log = JsonlLog(str(path), max_mb=0.001, backups=2)
+    for i in range(200):
+        log.write({"i": i, "padding": "x" * 50})
+    log.close()
+
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert files == ["route_log.jsonl", "route_log.jsonl.1", "route_log.jsonl.2"]
+    assert all(p.stat().st_size <= 1100 for p in tmp_path.iterdir())
+    with open(path, encoding="utf-8") as f:
+        assert json.loads(f.readlines()[-1])["i"] == 199
@@ -0,0 +1,79 @@
+import hashlib
+import io
+
+import pytest
+
+from tools.vision_tool import MAX_HASH_DISTANCE, VisionAnalyzer, VisionCache, hamming_distance
+
+PROMPT = "What is shown in this image?"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return VisionCache(path=str(tmp_path / "vision.sqlite"))
+
+
+def flip_bits(phash, count):
+    return phash ^ ((1 << count) - 1)
+
+
+def test_exact_matches_survive_a_restart(tmp_path):
+    path = str(tmp_path / "vision.sqlite")
+    VisionCache(path=path).set("digest", PROMPT, 0xF0F0F0F0F0F0F0F0, "A Panzer II.")
+
+    reopened = VisionCache(path=path)
+    assert reopened.get_exact("digest", PROMPT) == "A Panzer II."
+    assert reopened.get_similar(0xF0F0F0F0F0F0F0F0, PROMPT) == "A Panzer II."
+    assert reopened.get_exact("digest", "another prompt") is None
+
+
+def test_similar_matches_are_limited_to_a_few_bits(cache):
+    phash = 0x8F3C00FFAA5511E7
+    cache.set("digest", PROMPT, phash, "A Panzer II.")
+
+    assert hamming_distance(phash, flip_bits(phash, MAX_HASH_DISTANCE)) == MAX_HASH_DISTANCE
+    assert cache.get_similar(flip_bits(phash, MAX_HASH_DISTANCE), PROMPT) == "A Panzer II."
+    assert cache.get_similar(flip_bits(phash, MAX_HASH_DISTANCE + 1), PROMPT) is None
+    assert cache.get_similar(phash, "another prompt") is None
+
+
+def test_max_distance_is_capped(tmp_path):
+    cache = VisionCache(path=str(tmp_path / "vision.sqlite"), max_distance=10)
+    assert cache.max_distance == MAX_HASH_DISTANCE
+
+
+def test_negative_max_distance_only_allows_exact_matches(tmp_path):
+    cache = VisionCache(path=str(tmp_path / "vision.sqlite"), max_distance=-1)
+    cache.set("digest", PROMPT, 1234, "A Panzer II.")
+    assert cache.get_similar(1234, PROMPT) is None
+    assert cache.get_exact("digest", PROMPT) == "A Panzer II."
+
+
+def png(color, size=(64, 48)):
+    Image = pytest.importorskip("PIL.Image")
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_analyzer_calls_the_backend_once_per_image(cache):
+    calls = []
+
+    def backend(data, mime, prompt):
+        calls.append(mime)
+        return f"image {len(calls)}"
+
+    analyzer = VisionAnalyzer(backend=backend, cache=cache)
+    image = png((200, 30, 30))
+
+    assert analyzer.analyze(image, PROMPT) == "image 1"
+    assert analyzer.analyze(image, PROMPT) == "image 1"
+    assert calls == ["image/png"]
+
+
+def test_failed_descriptions_are_not_cached(cache):
+    analyzer = VisionAnalyzer(backend=lambda data, mime, prompt: "", cache=cache)
+    image = png((10, 120, 10))
+
+    analyzer.analyze(image, PROMPT)
+    assert cache.get_exact(hashlib.sha256(image).hexdigest(), PROMPT) is None
@@ -0,0 +1,97 @@
+import pytest
+
+pytest.importorskip("crewai")
+
+from tools.wiki_tool import WikiPageStore, WikipediaClient
+
+PAGE = {
+    "title": "Battle of Kursk",
+    "url": "https://en.wikipedia.org/wiki/Battle_of_Kursk",
+    "content": "Lead.\n\n== Background ==\nOperation Citadel.",
+    "revision_id": 42,
+}
+
+
+class FakeWikipediaApi:
+    """
+    Stand-in for the Wikipedia API; set online = False to simulate no network.
+    """
+
+    def __init__(self):
+        self.online = True
+        self.fetches = []
+        self.revision = PAGE["revision_id"]
+
+    def _check(self):
+        if not self.online:
+            raise ConnectionError("network unreachable")
+
+    def search(self, query):
+        self._check()
+        return ["Kursk"]
+
+    def fetch_page(self, title):
+        self._check()
+        self.fetches.append(title)
+        return dict(PAGE)  # "Kursk" redirects to "Battle of Kursk"
+
+    def revision_id(self, title):
+        self._check()
+        return self.revision
+
+
+@pytest.fixture
+def api():
+    return FakeWikipediaApi()
+
+
+def client_for(api, store):
+    return WikipediaClient(store=store, search_fn=api.search, fetch_page=api.fetch_page, revision_fn=api.revision_id)
+
+
+def test_cached_pages_are_served_without_network(api, tmp_path):
+    client = client_for(api, WikiPageStore(path=str(tmp_path / "wikipedia.sqlite")))
+    titles = client.search("Kursk 1943")
+    assert client.page(titles[0])["content"] == PAGE["content"]
+
+    api.online = False
+    assert client.search("Kursk 1943") == ["Kursk"]
+    assert client.page("Kursk")["title"] == "Battle of Kursk"
+    assert api.fetches == ["Kursk"]
+
+
+def test_expired_pages_are_served_when_offline(api, tmp_path):
+    store = WikiPageStore(path=str(tmp_path / "wikipedia.sqlite"))
+    client = client_for(api, store)
+    client.page("Kursk")
+
+    store.ttl_seconds = -1
+    api.online = False
+    page = client.page("Kursk")
+    assert page["content"] == PAGE["content"]
+    assert page["fresh"] is False
+
+
+def test_expired_pages_are_revalidated_not_refetched(api, tmp_path):
+    store = WikiPageStore(path=str(tmp_path / "wikipedia.sqlite"))
+    client = client_for(api, store)
+    client.page("Kursk")
+
+    store.ttl_seconds = -1
+    client.page("Kursk")
+    assert api.fetches == ["Kursk"]
+
+    api.revision = 43
+    client.page("Kursk")
+    assert api.fetches == ["Kursk", "Kursk"]
+
+
+def test_pages_are_stored_under_their_resolved_title(api, tmp_path):
+    store = WikiPageStore(path=str(tmp_path / "wikipedia.sqlite"))
+    client = client_for(api, store)
+    client.page("Kursk")
+
+    # The redirect and the canonical title share one entry
+    assert client.page("Battle of Kursk")["title"] == "Battle of Kursk"
+    assert api.fetches == ["Kursk"]
+    assert store._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0] == 1
@@ -0,0 +1,178 @@
+"""
+Persistent answer cache for answer_question.
+
+Final answers are stored in a small SQLite file on local disk, keyed on the
+normalized question, the response mode and a fingerprint of the knowledge base.
+Entries expire after a TTL and the least recently used ones are evicted once
+the cache grows past its maximum size.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "data", "cache")
+CACHE_PATH = os.path.join(CACHE_DIR, "answers.sqlite")
+
+DEFAULT_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+
+def normalize_question(question: str) -> str:
+    """
+    Lowercase, strip punctuation and collapse whitespace so trivial variations
+    of the same question share one cache entry.
+    """
+    text = question.lower().strip()
+    text = re.sub(r"[^\w\s-]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class AnswerCache:
+    """
+    SQLite-backed TTL + LRU cache for final answers.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                kb_version TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_access ON answers (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(question: str, mode: str, kb_version: str) -> str:
+        raw = "\x1f".join([normalize_question(question), mode, kb_version])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, question: str, mode: str, kb_version: str) -> Optional[str]:
+        """
+        Return the cached answer, or None on a miss or an expired entry.
+        """
+        key = self.make_key(question, mode, kb_version)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            answer, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return answer
+
+    def set(self, question: str, mode: str, kb_version: str, answer: str) -> None:
+        """
+        Store an answer and evict the least recently used entries if needed.
+        """
+        key = self.make_key(question, mode, kb_version)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(key, question, mode, kb_version, answer, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, normalize_question(question), mode, kb_version, answer, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def invalidate(self, current_kb_version: Optional[str] = None, scope: str = "") -> int:
+        """
+        Drop entries built against an older knowledge base.
+
+        With no version given the whole cache is cleared. scope limits the
+        removal to versions starting with it (one tenant's entries).
+        Returns the number of removed entries.
+        """
+        with self._lock:
+            if current_kb_version is None:
+                cursor = self._conn.execute("DELETE FROM answers")
+            else:
+                cursor = self._conn.execute(
+                    "DELETE FROM answers WHERE kb_version != ? AND substr(kb_version, 1, ?) = ?",
+                    (current_kb_version, len(scope), scope),
+                )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters for this process plus the current number of entries.
+        """
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": size,
+        }
+
+    def _evict(self) -> None:
+        # Expired entries first, then the least recently used ones over the cap
+        self._conn.execute(
+            "DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+        )
+        overflow = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN "
+                "(SELECT key FROM answers ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    Return the process-wide answer cache, creating it on first use.
+    """
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
@@ -0,0 +1,267 @@
+"""
+Chunking strategies for the knowledge base.
+
+- "paragraph": the original blank-line split, kept for comparison.
+- "structure": walks the document structure (sections, tables, lists), keeps
+  chunks within token bounds, merges undersized fragments, overlaps oversized
+  splits and records the section/page each chunk came from.
+
+Docling documents are chunked from their item tree; plain text and markdown
+are parsed into the same kind of blocks from their headings and blank lines.
+This module does not touch the vector store, so it can run in worker processes.
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional
+
+DEFAULT_CHUNKER = os.getenv("CHUNKER", "structure")
+DEFAULT_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "220"))
+DEFAULT_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "40"))
+DEFAULT_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "30"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def approx_token_count(text: str) -> int:
+    """
+    Cheap estimate of wordpiece tokens (MiniLM averages ~1.3 tokens per word).
+
+    Empty or whitespace-only text counts as 0.
+    """
+    words = len(text.split())
+    return int(words * 1.3) + 1 if words else 0
+
+
+@dataclass
+class Block:
+    """A structural unit of a document: paragraph, heading, table or list."""
+    kind: str
+    text: str
+    section: str = ""
+    page: Optional[int] = None
+
+
+@dataclass
+class Chunk:
+    text: str
+    section: str = ""
+    page: Optional[int] = None
+
+    def metadata(self, source: str) -> dict:
+        # Chroma metadata values cannot be None
+        meta = {"source": source, "section": self.section}
+        if self.page is not None:
+            meta["page"] = self.page
+        return meta
+
+
+# ---- Block extraction ----
+
+def blocks_from_lines(lines: Iterable[str]) -> Iterator[Block]:
+    """
+    Parse plain text / markdown lines into blocks.
+
+    '#' headings start a new section, consecutive '|' lines form one table and
+    other text is grouped by blank lines.
+    """
+    section = ""
+    buffer: List[str] = []
+    buffer_kind = "text"
+
+    def flush():
+        if buffer:
+            text = "\n".join(buffer).strip()
+            if text:
+                return Block(buffer_kind, text, section)
+        return None
+
+    for raw in lines:
+        line = raw.rstrip("\n")
+        stripped = line.strip()
+
+        if stripped.startswith("#"):
+            block = flush()
+            if block:
+                yield block
+            buffer = []
+            section = stripped.lstrip("#").strip()
+            yield Block("heading", section, section)
+            continue
+
+        kind = "table" if stripped.startswith("|") else "text"
+        if not stripped or (buffer and kind != buffer_kind):
+            block = flush()
+            if block:
+                yield block
+            buffer = []
+        if stripped:
+            buffer_kind = kind
+            buffer.append(line)
+
+    block = flush()
+    if block:
+        yield block
+
+
+def blocks_from_docling(document) -> Iterator[Block]:
+    """
+    Walk a DoclingDocument and yield blocks with section and page information.
+    """
+    section = ""
+    for item, _level in document.iterate_items():
+        label = str(getattr(item, "label", "")).lower()
+        page = item.prov[0].page_no if getattr(item, "prov", None) else None
+
+        if "table" in label:
+            text = item.export_to_markdown(doc=document)
+            kind = "table"
+        else:
+            text = getattr(item, "text", "") or ""
+            if label in ("section_header", "title"):
+                section = text.strip()
+                kind = "heading"
+            elif label == "list_item":
+                kind = "list"
+            else:
+                kind = "text"
+
+        if text.strip():
+            yield Block(kind, text.strip(), section, page)
+
+
+# ---- Chunkers ----
+
+class ParagraphChunker:
+    """
+    The original strategy: every blank-line separated paragraph is a chunk.
+    """
+
+    name = "paragraph"
+
+    def chunk_blocks(self, blocks: Iterable[Block]) -> Iterator[Chunk]:
+        for block in blocks:
+            for paragraph in block.text.split("\n\n"):
+                if paragraph.strip():
+                    yield Chunk(paragraph.strip(), block.section, block.page)
+
+
+class StructureChunker:
+    """
+    Token-bounded chunker that respects section boundaries.
+
+    Blocks from the same section are packed together up to max_tokens. Pieces
+    smaller than min_tokens (headings, single table rows) are merged with their
+    neighbours instead of becoming chunks of their own, and blocks larger than
+    max_tokens are split on sentences with overlap_tokens of overlap.
+    """
+
+    name = "structure"
+
+    def __init__(
+        self,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        min_tokens: int = DEFAULT_MIN_TOKENS,
+        overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+        count_tokens: Callable[[str], int] = approx_token_count,
+    ):
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = count_tokens
+
+    def chunk_blocks(self, blocks: Iterable[Block]) -> Iterator[Chunk]:
+        parts: List[str] = []
+        tokens = 0
+        section = ""
+        page = None
+
+        for block in blocks:
+            if parts and block.section != section and tokens >= self.min_tokens:
+                yield Chunk("\n\n".join(parts), section, page)
+                parts, tokens = [], 0
+
+            if not parts:
+                section, page = block.section, block.page
+
+            block_tokens = self.count_tokens(block.text)
+            if block_tokens > self.max_tokens:
+                if parts:
+                    yield Chunk("\n\n".join(parts), section, page)
+                    parts, tokens = [], 0
+                for piece in self._split(block.text):
+                    yield Chunk(piece, block.section, block.page)
+                continue
+
+            if tokens + block_tokens > self.max_tokens and parts:
+                yield Chunk("\n\n".join(parts), section, page)
+                parts, tokens = [], 0
+                section, page = block.section, block.page
+
+            parts.append(block.text)
+            tokens += block_tokens
+
+        if parts:
+            yield Chunk("\n\n".join(parts), section, page)
+
+    def _split(self, text: str) -> Iterator[str]:
+        """
+        Split an oversized block on sentence boundaries with token overlap.
+        """
+        sentences = [s for s in _SENTENCE_END.split(text) if s.strip()]
+        # Very long "sentences" (e.g. tables) fall back to words
+        units: List[str] = []
+        for sentence in sentences:
+            if self.count_tokens(sentence) > self.max_tokens:
+                units.extend(sentence.split())
+            else:
+                units.append(sentence)
+
+        window: List[str] = []
+        tokens = 0
+        for unit in units:
+            unit_tokens = self.count_tokens(unit)
+            if window and tokens + unit_tokens > self.max_tokens:
+                yield " ".join(window)
+                # Carry the tail of the previous window over as overlap
+                overlap: List[str] = []
+                overlap_tokens = 0
+                for prev in reversed(window):
+                    prev_tokens = self.count_tokens(prev)
+                    if overlap_tokens + prev_tokens > self.overlap_tokens:
+                        break
+                    overlap.insert(0, prev)
+                    overlap_tokens += prev_tokens
+                window, tokens = overlap, overlap_tokens
+            window.append(unit)
+            tokens += unit_tokens
+
+        if window:
+            yield " ".join(window)
+
+
+CHUNKERS = {
+    "paragraph": ParagraphChunker,
+    "structure": StructureChunker,
+}
+
+
+def get_chunker(name: str = DEFAULT_CHUNKER, **kwargs):
+    """
+    Build a chunker by name ("paragraph" or "structure").
+    """
+    if name not in CHUNKERS:
+        raise ValueError(f"Unknown chunker '{name}'. Choose from: {', '.join(CHUNKERS)}")
+    if name == "paragraph":
+        return ParagraphChunker()
+    return CHUNKERS[name](**kwargs)
+
+
+def chunk_lines(lines: Iterable[str], chunker=None) -> Iterator[Chunk]:
+    chunker = chunker or get_chunker()
+    return chunker.chunk_blocks(blocks_from_lines(lines))
+
+
+def chunk_docling_document(document, chunker=None) -> Iterator[Chunk]:
+    chunker = chunker or get_chunker()
+    return chunker.chunk_blocks(blocks_from_docling(document))
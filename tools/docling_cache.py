@@ -0,0 +1,108 @@
+"""
+Shared Docling converter and content-addressed conversion cache.
+
+Building a DocumentConverter loads the layout/OCR models, so converters are
+created lazily in a small per-process pool and reused by every upload (and
+every Streamlit session, which all live in the same process). Converted
+documents are stored on disk as DoclingDocument JSON keyed by the SHA-256 of
+the source bytes, so re-uploading or re-indexing the same file skips
+conversion entirely.
+"""
+import hashlib
+import io
+import os
+import queue
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from tools.telemetry import count_cache, traced
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+CONVERSION_CACHE_DIR = os.path.join(BASE_DIR, "data", "cache", "docling")
+
+CONVERTER_POOL_SIZE = int(os.getenv("DOCLING_POOL_SIZE", "1"))
+
+_pool = queue.Queue()
+_created = 0
+_pool_lock = threading.Lock()
+
+
+@contextmanager
+def borrow_converter():
+    """
+    Borrow a DocumentConverter from the process-wide pool.
+
+    Converters are created lazily, up to DOCLING_POOL_SIZE; callers beyond
+    that wait until one is returned.
+    """
+    global _created
+    converter = None
+    try:
+        converter = _pool.get_nowait()
+    except queue.Empty:
+        with _pool_lock:
+            if _created < CONVERTER_POOL_SIZE:
+                from docling.document_converter import DocumentConverter
+                converter = DocumentConverter()
+                _created += 1
+        if converter is None:
+            converter = _pool.get()
+    try:
+        yield converter
+    finally:
+        _pool.put(converter)
+
+
+def _cache_path(digest):
+    return os.path.join(CONVERSION_CACHE_DIR, digest[:2], f"{digest}.json")
+
+
+def _write_cache(path, text):
+    """
+    Atomically write a cache entry.
+
+    Upload handlers and ingest workers can convert the same file at once, so
+    each writer gets its own temporary file next to the entry.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=os.path.dirname(path), suffix=".tmp", delete=False
+    )
+    try:
+        with f:
+            f.write(text)
+        os.replace(f.name, path)
+    except BaseException:
+        if os.path.exists(f.name):
+            os.unlink(f.name)
+        raise
+
+
+@traced("docling.convert")
+def convert_document(data: bytes, filename: str):
+    """
+    Convert raw PDF/DOCX bytes to a DoclingDocument, using the on-disk cache.
+
+    The bytes are handed to Docling as an in-memory stream, so no temporary
+    copy of the upload is written.
+    """
+    from docling_core.types.doc import DoclingDocument
+
+    digest = hashlib.sha256(data).hexdigest()
+    path = _cache_path(digest)
+    if os.path.exists(path):
+        count_cache("docling", "hit")
+        with open(path, "r", encoding="utf-8") as f:
+            return DoclingDocument.model_validate_json(f.read())
+    count_cache("docling", "miss")
+
+    from docling.datamodel.base_models import DocumentStream
+
+    stream = DocumentStream(name=os.path.basename(filename), stream=io.BytesIO(data))
+    with borrow_converter() as converter:
+        result = converter.convert(stream)
+    document = result.document
+
+    _write_cache(path, document.model_dump_json())
+    return document
@@ -0,0 +1,154 @@
+"""
+Registry of the documents in the knowledge base.
+
+For every source (uploaded filename or corpus path) it records the SHA-256 of
+the file, the IDs of its chunks and the embedding model that produced their
+vectors. Documents are scoped by tenant ("" is the shared base corpus, see
+tools/tenants.py), so two classes can upload files with the same name.
+
+With that, re-uploading a corrected file becomes a diff (only new chunks are
+embedded, chunks that disappeared are deleted), a document can be removed by
+name, and the re-embedding job knows which model is active.
+"""
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Set
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+REGISTRY_PATH = os.path.join(BASE_DIR, "data", "vector_db", "registry.sqlite")
+
+_COLUMNS = "tenant, source, sha256, embedding_model, chunk_count, updated_at"
+
+
+@dataclass
+class DocumentRecord:
+    tenant: str
+    source: str
+    sha256: str
+    embedding_model: str
+    chunk_count: int
+    updated_at: float
+
+
+class DocumentRegistry:
+    """
+    SQLite tables of documents, their chunk IDs and a few settings
+    (such as the active embedding model).
+    """
+
+    def __init__(self, path: str = REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " tenant TEXT NOT NULL, source TEXT NOT NULL, sha256 TEXT NOT NULL, embedding_model TEXT NOT NULL,"
+            " chunk_count INTEGER NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (tenant, source));"
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " tenant TEXT NOT NULL, source TEXT NOT NULL, chunk_id TEXT NOT NULL,"
+            " PRIMARY KEY (tenant, source, chunk_id));"
+            "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        )
+        self._conn.commit()
+
+    def get(self, source: str, tenant: Optional[str] = None) -> Optional[DocumentRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM documents WHERE tenant = ? AND source = ?",
+                (tenant or "", source),
+            ).fetchone()
+        return DocumentRecord(*row) if row else None
+
+    def documents(self, tenant: Optional[str] = None) -> List[DocumentRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM documents WHERE tenant = ? ORDER BY source", (tenant or "",)
+            ).fetchall()
+        return [DocumentRecord(*row) for row in rows]
+
+    def tenants(self) -> List[str]:
+        """
+        Tenants with at least one document (the base corpus excluded).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT tenant FROM documents WHERE tenant != '' ORDER BY tenant"
+            ).fetchall()
+        return [tenant for (tenant,) in rows]
+
+    def has_tenant(self, tenant: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM documents WHERE tenant = ? LIMIT 1", (tenant,)).fetchone()
+        return row is not None
+
+    def chunk_ids(self, source: str, tenant: Optional[str] = None) -> Set[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id FROM chunks WHERE tenant = ? AND source = ?", (tenant or "", source)
+            ).fetchall()
+        return {chunk_id for (chunk_id,) in rows}
+
+    def record(
+        self,
+        source: str,
+        sha256: str,
+        embedding_model: str,
+        chunk_ids: Iterable[str],
+        tenant: Optional[str] = None,
+    ) -> None:
+        """
+        Store (or replace) a document with its current chunk IDs.
+        """
+        chunk_ids = set(chunk_ids)
+        tenant = tenant or ""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE tenant = ? AND source = ?", (tenant, source))
+            self._conn.executemany(
+                "INSERT INTO chunks (tenant, source, chunk_id) VALUES (?, ?, ?)",
+                [(tenant, source, chunk_id) for chunk_id in chunk_ids],
+            )
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO documents ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                (tenant, source, sha256, embedding_model, len(chunk_ids), time.time()),
+            )
+            self._conn.commit()
+
+    def remove(self, source: str, tenant: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE tenant = ? AND source = ?", (tenant or "", source))
+            self._conn.execute("DELETE FROM documents WHERE tenant = ? AND source = ?", (tenant or "", source))
+            self._conn.commit()
+
+    def set_embedding_model(self, embedding_model: str) -> None:
+        """
+        Mark every document as embedded with embedding_model (after a re-embedding).
+        """
+        with self._lock:
+            self._conn.execute("UPDATE documents SET embedding_model = ?", (embedding_model,))
+            self._conn.commit()
+
+    def get_setting(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_setting(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_document_registry() -> DocumentRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DocumentRegistry()
+        return _registry
@@ -0,0 +1,529 @@
+"""
+Hybrid BM25 + dense retrieval over the 'ww2_knowledge' collection.
+
+Dense search alone often misses exact names, dates and unit designations
+("101st Airborne", "Operation Market Garden"). This module keeps an
+incrementally updated BM25 inverted index next to the Chroma collection and
+fuses both rankings with reciprocal rank fusion (RRF). An optional local
+cross-encoder can rerank the fused candidates.
+
+The BM25 index lives in memory (BM25Index) or, for corpora too large for RAM,
+in an SQLite FTS5 file (SqliteBM25Index) that survives restarts.
+
+Writes made by another process (ingest_corpus.py, manage_knowledge_base.py)
+are noticed through the retriever's version_fn, checked at most every
+INDEX_CHECK_SECONDS, and trigger a rebuild of the BM25 index. The on-disk
+index is kept in sync by every writer and only rebuilt when its document
+count stays out of line with the collection (e.g. after a crash between the
+two writes).
+"""
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+RRF_K = 60
+DEFAULT_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")  # e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"
+INDEX_CHECK_SECONDS = float(os.getenv("RETRIEVAL_INDEX_CHECK_SECONDS", "2"))
+# Chunks read from the collection per page while (re)building the BM25 index
+REBUILD_PAGE_SIZE = 1000
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def matches_where(metadata: Optional[dict], where: Optional[dict]) -> bool:
+    """
+    Evaluate a Chroma-style equality filter ({"source": "notes.txt"} or
+    {"$and": [...]}) against a metadata dict.
+    """
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, value in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in value):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in value):
+                return False
+        elif isinstance(value, dict):
+            if "$eq" in value and metadata.get(key) != value["$eq"]:
+                return False
+            if "$ne" in value and metadata.get(key) == value["$ne"]:
+                return False
+            if "$in" in value and metadata.get(key) not in value["$in"]:
+                return False
+        elif metadata.get(key) != value:
+            return False
+    return True
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring.
+
+    Documents can be added, replaced and removed one at a time, so the index
+    follows the Chroma collection without being rebuilt.
+    """
+
+    persistent = False
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_len: Dict[str, int] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.metadata: Dict[str, dict] = {}
+        self.total_len = 0
+        self.version: Optional[str] = None  # collection version the index reflects
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    def rebuild(self, pages: Iterable[List[tuple]], version: Optional[str] = None) -> None:
+        """
+        Replace the contents with (doc_id, text, metadata) items from pages.
+
+        The new index is built on the side and swapped in, so searches running
+        meanwhile see the old contents.
+        """
+        fresh = BM25Index(self.k1, self.b)
+        for page in pages:
+            for doc_id, text, metadata in page:
+                fresh.add(doc_id, text, metadata)
+        with self._lock:
+            self.postings, self.doc_len, self.doc_terms = fresh.postings, fresh.doc_len, fresh.doc_terms
+            self.metadata, self.total_len = fresh.metadata, fresh.total_len
+            self.version = version
+
+    def add(self, doc_id: str, text: str, metadata: Optional[dict] = None) -> None:
+        with self._lock:
+            if doc_id in self.doc_len:
+                self.remove(doc_id)
+
+            counts: Dict[str, int] = defaultdict(int)
+            tokens = tokenize(text)
+            for token in tokens:
+                counts[token] += 1
+            for token, tf in counts.items():
+                self.postings[token][doc_id] = tf
+
+            self.doc_len[doc_id] = len(tokens)
+            self.doc_terms[doc_id] = list(counts)
+            self.metadata[doc_id] = metadata or {}
+            self.total_len += len(tokens)
+
+    def add_many(self, items: Iterable[tuple]) -> None:
+        with self._lock:
+            for doc_id, text, metadata in items:
+                self.add(doc_id, text, metadata)
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            if doc_id not in self.doc_len:
+                return
+            for token in self.doc_terms.pop(doc_id, []):
+                posting = self.postings[token]
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[token]
+            self.total_len -= self.doc_len.pop(doc_id)
+            self.metadata.pop(doc_id, None)
+
+    def search(self, query: str, k: int, where: Optional[dict] = None) -> List[tuple]:
+        """
+        Return up to k (doc_id, score) pairs, best first.
+        """
+        with self._lock:
+            n_docs = len(self.doc_len)
+            if not n_docs:
+                return []
+            avg_len = self.total_len / n_docs
+
+            scores: Dict[str, float] = defaultdict(float)
+            for token in set(tokenize(query)):
+                posting = self.postings.get(token)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            if where:
+                ranked = [(d, s) for d, s in ranked if matches_where(self.metadata.get(d), where)]
+            return ranked[:k]
+
+
+class SqliteBM25Index:
+    """
+    BM25 over an SQLite FTS5 table, with the same interface as BM25Index.
+
+    Postings stay on disk, so memory use does not grow with the corpus, and
+    the index survives restarts instead of being rebuilt from the collection.
+    FTS5 finds and pre-ranks the matching documents; the best of them are
+    re-scored with the same BM25 formula as BM25Index, so scores (and the
+    router's thresholds) mean the same on both.
+    """
+
+    persistent = True
+    total_len = 0  # Nothing resident; used by the tenant memory estimate
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75, rescore_candidates: int = 50):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.rescore_candidates = rescore_candidates
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Several processes write to the file (app, ingest_corpus.py), so wait for locks
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        # WAL: searches keep reading the old index while a rebuild is written
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                rowid INTEGER PRIMARY KEY,
+                doc_id TEXT UNIQUE NOT NULL,
+                length INTEGER NOT NULL,
+                metadata TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5(
+                text, tokenize="unicode61 remove_diacritics 0 tokenchars '_'"
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS terms_vocab USING fts5vocab(terms, row);
+            CREATE TABLE IF NOT EXISTS totals (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                docs INTEGER NOT NULL,
+                tokens INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO totals (id, docs, tokens) VALUES (0, 0, 0);
+            """
+        )
+        return conn
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT docs FROM totals").fetchone()[0]
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, items: Iterable[tuple]) -> None:
+        for doc_id, text, metadata in items:
+            SqliteBM25Index._delete(conn, doc_id)
+            length = len(tokenize(text))
+            rowid = conn.execute(
+                "INSERT INTO docs (doc_id, length, metadata) VALUES (?, ?, ?)",
+                (doc_id, length, json.dumps(metadata) if metadata else None),
+            ).lastrowid
+            conn.execute("INSERT INTO terms (rowid, text) VALUES (?, ?)", (rowid, text))
+            conn.execute("UPDATE totals SET docs = docs + 1, tokens = tokens + ?", (length,))
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, doc_id: str) -> None:
+        row = conn.execute("SELECT rowid, length FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM terms WHERE rowid = ?", (row[0],))
+            conn.execute("DELETE FROM docs WHERE rowid = ?", (row[0],))
+            conn.execute("UPDATE totals SET docs = docs - 1, tokens = tokens - ?", (row[1],))
+
+    def rebuild(self, pages: Iterable[List[tuple]]) -> None:
+        """
+        Replace the contents with (doc_id, text, metadata) items from pages,
+        in one transaction on a separate connection.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM docs")
+            conn.execute("DELETE FROM terms")
+            conn.execute("UPDATE totals SET docs = 0, tokens = 0")
+            for page in pages:
+                self._insert(conn, page)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def add(self, doc_id: str, text: str, metadata: Optional[dict] = None) -> None:
+        self.add_many([(doc_id, text, metadata)])
+
+    def add_many(self, items: Iterable[tuple]) -> None:
+        with self._lock:
+            self._insert(self._conn, items)
+            self._conn.commit()
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            self._delete(self._conn, doc_id)
+            self._conn.commit()
+
+    def search(self, query: str, k: int, where: Optional[dict] = None) -> List[tuple]:
+        """
+        Return up to k (doc_id, score) pairs, best first.
+        """
+        tokens = sorted(set(tokenize(query)))
+        if not tokens:
+            return []
+        match = " OR ".join(f'"{token}"' for token in tokens)
+        with self._lock:
+            n_docs, total_tokens = self._conn.execute("SELECT docs, tokens FROM totals").fetchone()
+            if not n_docs:
+                return []
+            doc_freq = dict(self._conn.execute(
+                f"SELECT term, doc FROM terms_vocab WHERE term IN ({','.join('?' * len(tokens))})", tokens
+            ))
+            candidates = []
+            rows = self._conn.execute(
+                "SELECT docs.doc_id, docs.length, docs.metadata, terms.text FROM terms "
+                "JOIN docs ON docs.rowid = terms.rowid WHERE terms MATCH ? ORDER BY bm25(terms)",
+                (match,),
+            )
+            for doc_id, length, metadata, text in rows:
+                if where and not matches_where(json.loads(metadata) if metadata else {}, where):
+                    continue
+                candidates.append((doc_id, length, text))
+                if len(candidates) >= max(k, self.rescore_candidates):
+                    break
+
+        avg_len = total_tokens / n_docs
+        scored = []
+        for doc_id, length, text in candidates:
+            counts: Dict[str, int] = defaultdict(int)
+            for token in tokenize(text):
+                counts[token] += 1
+            score = 0.0
+            for token in tokens:
+                tf = counts.get(token)
+                if not tf or not doc_freq.get(token):
+                    continue
+                df = doc_freq[token]
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                score += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_len))
+            scored.append((doc_id, score))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:k]
+
+
+class CrossEncoderReranker:
+    """
+    Optional local cross-encoder (requires sentence-transformers).
+    """
+
+    def __init__(self, model_name: str = RERANKER_MODEL):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name)
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        return [float(s) for s in self.model.predict([(query, t) for t in texts])]
+
+
+@dataclass
+class RetrievedChunk:
+    id: str
+    text: str
+    metadata: dict = field(default_factory=dict)
+    score: float = 0.0  # fused RRF score (or reranker score)
+    similarity: Optional[float] = None  # dense cosine similarity, if retrieved densely
+    bm25: Optional[float] = None  # BM25 score, if retrieved lexically
+
+
+class HybridRetriever:
+    """
+    Reciprocal rank fusion of Chroma dense search and BM25.
+
+    version_fn, if given, returns a fingerprint of the collection (e.g. its
+    count and the knowledge-base version stamp). When it differs from the one
+    the BM25 index was built for, the index is rebuilt before the next query.
+    bm25 defaults to an in-memory BM25Index. A persistent SqliteBM25Index is
+    written by every process that writes to the collection (see index_chunks),
+    so it is not rebuilt on version changes; it is built when empty, and
+    rebuilt when its document count differs from the collection's on two
+    checks in a row with the same counts (a write that was lost, not one in
+    progress).
+
+    Incremental writes and rebuilds are serialized, so chunks indexed while a
+    rebuild runs are applied to the new index rather than to the old one.
+    """
+
+    def __init__(
+        self,
+        collection,
+        reranker=None,
+        candidates: int = DEFAULT_CANDIDATES,
+        version_fn: Optional[Callable[[], str]] = None,
+        check_interval: float = INDEX_CHECK_SECONDS,
+        bm25=None,
+    ):
+        self.collection = collection
+        self.reranker = reranker
+        self.candidates = candidates
+        self.version_fn = version_fn
+        self.check_interval = check_interval
+        self.bm25 = bm25 if bm25 is not None else BM25Index()
+        self._built = False
+        self._checked_at = 0.0
+        self._mismatch = None  # (index count, collection count) seen at the last check
+        # Reentrant: index_chunks holds it while the first write builds the index
+        self._build_lock = threading.RLock()
+
+    def ensure_index(self) -> None:
+        """
+        Build the BM25 index on first use, and rebuild it when the collection
+        was changed by another process.
+        """
+        with self._build_lock:
+            now = time.monotonic()
+            if self.bm25.persistent:
+                if not self._built or now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    self._repair_persistent()
+                self._built = True
+                return
+            if self._built and (self.version_fn is None or now - self._checked_at < self.check_interval):
+                return
+            self._checked_at = now
+            version = self.version_fn() if self.version_fn is not None else None
+            if not self._built or version != self.bm25.version:
+                self.bm25.rebuild(self._pages(), version)
+            self._built = True
+
+    def _repair_persistent(self) -> None:
+        counts = (len(self.bm25), self.collection.count())
+        if counts[0] == counts[1]:
+            self._mismatch = None
+        elif counts[0] == 0 or counts == self._mismatch:
+            self.bm25.rebuild(self._pages())
+            self._mismatch = None
+        else:
+            # Possibly another process between its collection and index writes; look again later
+            self._mismatch = counts
+
+    def _pages(self) -> Iterator[List[tuple]]:
+        offset = 0
+        while True:
+            page = self.collection.get(
+                include=["documents", "metadatas"], limit=REBUILD_PAGE_SIZE, offset=offset
+            )
+            if not page["ids"]:
+                return
+            yield [
+                (doc_id, text or "", metadata)
+                for doc_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+            ]
+            offset += len(page["ids"])
+
+    def mark_current(self) -> None:
+        """
+        Record that the BM25 index matches the collection after this process's
+        own writes (already applied through index_chunks/remove_chunks), so
+        they do not trigger a rebuild.
+        """
+        with self._build_lock:
+            if self._built and self.version_fn is not None and not self.bm25.persistent:
+                self.bm25.version = self.version_fn()
+                self._checked_at = time.monotonic()
+
+    def index_chunks(self, ids: List[str], documents: List[str], metadatas: List[dict]) -> None:
+        """
+        Keep the BM25 index in sync after an upsert into the collection.
+        """
+        with self._build_lock:
+            if not self._ready_for_writes():
+                return  # Will be picked up by the lazy build
+            self.bm25.add_many(zip(ids, documents, metadatas))
+
+    def remove_chunks(self, ids: List[str]) -> None:
+        with self._build_lock:
+            if not self._ready_for_writes():
+                return
+            for doc_id in ids:
+                self.bm25.remove(doc_id)
+
+    def _ready_for_writes(self) -> bool:
+        # A persistent index outlives this process, so it is kept in sync even
+        # by processes that never query (e.g. ingest_corpus.py)
+        if not self._built and self.bm25.persistent:
+            self.ensure_index()
+        return self._built
+
+    def _similarity(self, distance: float) -> float:
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "cosine":
+            return 1.0 - distance
+        if space == "ip":
+            return -distance
+        # Squared L2 between unit-length embeddings: d = 2 - 2 * cos
+        return 1.0 - distance / 2.0
+
+    def search(self, query: str, k: int = 3, where: Optional[dict] = None) -> List[RetrievedChunk]:
+        self.ensure_index()
+
+        n_dense = min(self.candidates, self.collection.count())
+        chunks: Dict[str, RetrievedChunk] = {}
+        fused: Dict[str, float] = defaultdict(float)
+
+        if n_dense:
+            dense = self.collection.query(
+                query_texts=[query],
+                n_results=n_dense,
+                where=where or None,
+                include=["documents", "metadatas", "distances"],
+            )
+            for rank, (doc_id, text, metadata, distance) in enumerate(zip(
+                dense["ids"][0], dense["documents"][0], dense["metadatas"][0], dense["distances"][0]
+            )):
+                chunks[doc_id] = RetrievedChunk(doc_id, text, metadata or {}, similarity=self._similarity(distance))
+                fused[doc_id] += 1.0 / (RRF_K + rank + 1)
+
+        sparse = self.bm25.search(query, self.candidates, where=where)
+        missing = [doc_id for doc_id, _ in sparse if doc_id not in chunks]
+        if missing:
+            fetched = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, text, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                chunks[doc_id] = RetrievedChunk(doc_id, text, metadata or {})
+        for rank, (doc_id, score) in enumerate(sparse):
+            if doc_id in chunks:
+                chunks[doc_id].bm25 = score
+                fused[doc_id] += 1.0 / (RRF_K + rank + 1)
+
+        ranked = sorted(fused, key=fused.get, reverse=True)
+        results = []
+        for doc_id in ranked:
+            if doc_id in chunks:
+                chunks[doc_id].score = fused[doc_id]
+                results.append(chunks[doc_id])
+
+        if self.reranker is not None and results:
+            pool = results[:self.candidates]
+            for chunk, score in zip(pool, self.reranker.score(query, [c.text for c in pool])):
+                chunk.score = score
+            results = sorted(pool, key=lambda c: c.score, reverse=True)
+
+        return results[:k]
+
+
+def build_reranker():
+    """
+    Return a CrossEncoderReranker when RERANKER_MODEL is set, else None.
+    """
+    if not RERANKER_MODEL:
+        return None
+    try:
+        return CrossEncoderReranker(RERANKER_MODEL)
+    except ImportError:
+        return None
@@ -0,0 +1,596 @@
+"""
+Bounded, session-scoped storage for the crews' CrewAI memory.
+
+CrewAI's default LanceDB store keeps every extracted memory forever, and every
+task embeds its description and searches all of them. This backend keeps the
+records in SQLite with their embeddings in a NumPy matrix (like the semantic
+cache) and bounds the store:
+
+- records are tagged with the session of the request that produced them
+  (use_memory_session, set by answer_question) and searches only see the
+  current session's records, so one student's chat is never recalled for
+  another
+- saving a near-duplicate of a record in the same session and scope refreshes
+  that record instead of adding a new one
+- every MEMORY_COMPACT_EVERY saves (and on start) the store is compacted:
+  records older than MEMORY_MAX_AGE_DAYS are dropped, near-duplicates are
+  merged into the newest copy, the least recently used records beyond
+  MEMORY_MAX_RECORDS are evicted and the file is vacuumed
+
+SessionMemory adds lookup metrics and can serve a recall that was started
+in the background while the research stage ran (see prefetch_recall).
+
+Usage:
+    python -m tools.memory_store [--compact]
+"""
+import argparse
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from crewai.memory.storage.backend import EmbeddingDimensionMismatchError
+from crewai.memory.types import MemoryRecord, ScopeInfo
+from crewai.memory.unified_memory import Memory
+
+from tools.telemetry import TELEMETRY_ENABLED, count_cache, span, tracer
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+MEMORY_DB_PATH = os.path.join(BASE_DIR, "data", "cache", "crew_memory.sqlite")
+
+MEMORY_MAX_RECORDS = int(os.getenv("MEMORY_MAX_RECORDS", "5000"))
+MEMORY_MAX_AGE_DAYS = float(os.getenv("MEMORY_MAX_AGE_DAYS", "30"))
+MEMORY_DEDUPE_THRESHOLD = float(os.getenv("MEMORY_DEDUPE_THRESHOLD", "0.95"))
+MEMORY_COMPACT_EVERY = int(os.getenv("MEMORY_COMPACT_EVERY", "100"))
+# Look up memories while the research stage runs instead of before each task
+MEMORY_PREFETCH_ENABLED = os.getenv("MEMORY_PREFETCH", "1") != "0"
+# Matches the number of memories CrewAI agents recall per task
+MEMORY_RECALL_LIMIT = 5
+
+# Rows compared at once when looking for duplicates during compaction
+DEDUPE_BLOCK_ROWS = 1024
+
+_current_session: contextvars.ContextVar = contextvars.ContextVar("memory_session", default=None)
+_prefetched_recall: contextvars.ContextVar = contextvars.ContextVar("memory_prefetch", default=None)
+_prefetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="memory-prefetch")
+
+
+def current_memory_session() -> Optional[str]:
+    return _current_session.get()
+
+
+@contextmanager
+def use_memory_session(session_id: Optional[str]) -> Iterator[None]:
+    """
+    Store and recall memories of the enclosed block under session_id.
+
+    Without a session, memories go to (and come from) a shared anonymous session.
+    """
+    token = _current_session.set(session_id or None)
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+
+
+def _utc(value: datetime) -> datetime:
+    # MemoryRecord timestamps are naive UTC (datetime.utcnow)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _in_scope(scope: str, scope_prefix: Optional[str]) -> bool:
+    if scope_prefix is None or not scope_prefix.strip("/"):
+        return True
+    return scope.startswith(scope_prefix.rstrip("/"))
+
+
+def _newer_duplicates(matrix: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    For rows ordered newest first, mark rows with a near-duplicate earlier in the order.
+    """
+    duplicate = np.zeros(len(matrix), dtype=bool)
+    for start in range(0, len(matrix), DEDUPE_BLOCK_ROWS):
+        block = matrix[start:start + DEDUPE_BLOCK_ROWS] @ matrix.T
+        # Only compare against newer rows (lower index)
+        rows = np.arange(start, start + len(block))[:, None]
+        block[np.arange(len(matrix))[None, :] >= rows] = -1.0
+        duplicate[start:start + len(block)] = (block >= threshold).any(axis=1)
+    return duplicate
+
+
+class BoundedMemoryStorage:
+    """
+    CrewAI StorageBackend: SQLite rows plus an in-memory embedding matrix.
+
+    Reads only see records of the current session. Deletes and resets run
+    outside a session (e.g. from the command line) apply to all sessions.
+    """
+
+    def __init__(
+        self,
+        path: str = MEMORY_DB_PATH,
+        max_records: int = MEMORY_MAX_RECORDS,
+        max_age_days: float = MEMORY_MAX_AGE_DAYS,
+        dedupe_threshold: float = MEMORY_DEDUPE_THRESHOLD,
+        compact_every: int = MEMORY_COMPACT_EVERY,
+    ):
+        self.path = path
+        self.max_records = max_records
+        self.max_age_days = max_age_days
+        self.dedupe_threshold = dedupe_threshold
+        self.compact_every = compact_every
+
+        self._records: List[MemoryRecord] = []
+        self._sessions: List[str] = []
+        self._matrix: Optional[np.ndarray] = None  # (n, dim), rows L2-normalized
+        self._positions: Dict[str, int] = {}
+        self._saves_since_compaction = 0
+        self._lock = threading.RLock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memories ("
+            " id TEXT PRIMARY KEY, session TEXT NOT NULL, record TEXT NOT NULL, embedding BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._load()
+        self.compact()
+
+    # ---- Internal state ----
+
+    def _load(self) -> None:
+        rows = self._conn.execute("SELECT session, record, embedding FROM memories").fetchall()
+        vectors = []
+        for session, record, embedding in rows:
+            self._records.append(MemoryRecord.model_validate_json(record))
+            self._sessions.append(session)
+            vectors.append(np.frombuffer(embedding, dtype=np.float32))
+        if vectors and len({len(v) for v in vectors}) == 1:
+            self._matrix = np.vstack(vectors)
+        elif vectors:
+            # Embedder changed between runs: the old vectors cannot be searched
+            self._records, self._sessions = [], []
+            self._conn.execute("DELETE FROM memories")
+            self._conn.commit()
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self._positions = {record.id: i for i, record in enumerate(self._records)}
+
+    def _persist(self, indexes: List[int]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO memories (id, session, record, embedding) VALUES (?, ?, ?, ?)",
+            [
+                (
+                    self._records[i].id,
+                    self._sessions[i],
+                    self._records[i].model_dump_json(),
+                    self._matrix[i].astype(np.float32).tobytes(),
+                )
+                for i in indexes
+            ],
+        )
+        self._conn.commit()
+
+    def _remove(self, indexes) -> None:
+        indexes = set(indexes)
+        if not indexes:
+            return
+        self._conn.executemany(
+            "DELETE FROM memories WHERE id = ?", [(self._records[i].id,) for i in indexes]
+        )
+        self._conn.commit()
+        keep = [i for i in range(len(self._records)) if i not in indexes]
+        self._records = [self._records[i] for i in keep]
+        self._sessions = [self._sessions[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else None
+        self._reindex()
+
+    def _session_indexes(self, scope_prefix: Optional[str] = None) -> List[int]:
+        session = current_memory_session() or ""
+        return [
+            i for i, record in enumerate(self._records)
+            if self._sessions[i] == session and _in_scope(record.scope, scope_prefix)
+        ]
+
+    def _delete_indexes(self, scope_prefix: Optional[str] = None) -> List[int]:
+        session = current_memory_session()
+        return [
+            i for i, record in enumerate(self._records)
+            if (session is None or self._sessions[i] == session) and _in_scope(record.scope, scope_prefix)
+        ]
+
+    def _publish_size(self) -> None:
+        if not TELEMETRY_ENABLED:
+            return
+        tracer.metrics.set_gauge("tutor_memory_records", len(self._records), help="Records in the crew memory store.")
+        size = sum(
+            os.path.getsize(self.path + suffix)
+            for suffix in ("", "-wal", "-journal")
+            if self.path != ":memory:" and os.path.exists(self.path + suffix)
+        )
+        tracer.metrics.set_gauge("tutor_memory_store_bytes", size, help="Size of the crew memory store on disk.")
+
+    # ---- StorageBackend ----
+
+    def save(self, records: List[MemoryRecord]) -> None:
+        session = current_memory_session() or ""
+        now = _utcnow()
+        with self._lock:
+            changed = []
+            for record in records:
+                if not record.embedding:
+                    continue
+                vector = _normalize(record.embedding)
+                if self._matrix is not None and self._matrix.shape[1] != len(vector):
+                    raise EmbeddingDimensionMismatchError(self._matrix.shape[1], len(vector))
+
+                # A near-duplicate in the same session and scope is refreshed instead
+                same = [
+                    i for i in range(len(self._records))
+                    if self._sessions[i] == session and self._records[i].scope == record.scope
+                ]
+                if same:
+                    scores = self._matrix[same] @ vector
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.dedupe_threshold:
+                        existing = self._records[same[best]]
+                        existing.last_accessed = now
+                        existing.importance = max(existing.importance, record.importance)
+                        changed.append(same[best])
+                        self._count_write("deduplicated")
+                        continue
+
+                stored = record.model_copy(update={"embedding": None})
+                self._records.append(stored)
+                self._sessions.append(session)
+                row = vector.reshape(1, -1)
+                self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+                self._positions[stored.id] = len(self._records) - 1
+                changed.append(len(self._records) - 1)
+                self._count_write("stored")
+
+            if changed:
+                self._persist(sorted(set(changed)))
+            self._saves_since_compaction += 1
+            if self._saves_since_compaction >= self.compact_every:
+                self.compact()
+            else:
+                self._publish_size()
+
+    def _count_write(self, outcome: str) -> None:
+        if TELEMETRY_ENABLED:
+            tracer.metrics.inc("tutor_memory_writes_total", help="Memories saved, by outcome.", outcome=outcome)
+
+    def search(
+        self,
+        query_embedding: List[float],
+        scope_prefix: Optional[str] = None,
+        categories: Optional[List[str]] = None,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        limit: int = 10,
+        min_score: float = 0.0,
+    ) -> List[Tuple[MemoryRecord, float]]:
+        """
+        Cosine similarity search over the current session's records.
+        """
+        start = time.perf_counter()
+        query = _normalize(query_embedding)
+        results = []
+        with self._lock:
+            indexes = self._session_indexes(scope_prefix)
+            if indexes:
+                if self._matrix.shape[1] != len(query):
+                    raise EmbeddingDimensionMismatchError(self._matrix.shape[1], len(query))
+                scores = np.clip(self._matrix[indexes] @ query, 0.0, 1.0)
+                for position in np.argsort(-scores, kind="stable"):
+                    score = float(scores[position])
+                    if score < min_score or len(results) >= limit:
+                        break
+                    i = indexes[position]
+                    record = self._records[i]
+                    if categories and not any(c in record.categories for c in categories):
+                        continue
+                    if metadata_filter and not all(record.metadata.get(k) == v for k, v in metadata_filter.items()):
+                        continue
+                    results.append((record.model_copy(update={"embedding": self._matrix[i].tolist()}), score))
+        if TELEMETRY_ENABLED:
+            tracer.metrics.observe(
+                "tutor_memory_search_seconds", time.perf_counter() - start, help="Memory store vector search time."
+            )
+        return results
+
+    def delete(
+        self,
+        scope_prefix: Optional[str] = None,
+        categories: Optional[List[str]] = None,
+        record_ids: Optional[List[str]] = None,
+        older_than: Optional[datetime] = None,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        with self._lock:
+            indexes = self._delete_indexes(scope_prefix)
+            if record_ids is not None:
+                wanted = set(record_ids)
+                indexes = [i for i in indexes if self._records[i].id in wanted]
+            if categories:
+                indexes = [i for i in indexes if any(c in self._records[i].categories for c in categories)]
+            if older_than is not None:
+                cutoff = _utc(older_than)
+                indexes = [i for i in indexes if _utc(self._records[i].created_at) < cutoff]
+            if metadata_filter:
+                indexes = [
+                    i for i in indexes
+                    if all(self._records[i].metadata.get(k) == v for k, v in metadata_filter.items())
+                ]
+            self._remove(indexes)
+            self._publish_size()
+            return len(indexes)
+
+    def update(self, record: MemoryRecord) -> None:
+        with self._lock:
+            i = self._positions.get(record.id)
+            if i is None:
+                self.save([record])
+                return
+            if record.embedding:
+                self._matrix[i] = _normalize(record.embedding)
+            self._records[i] = record.model_copy(update={"embedding": None})
+            self._persist([i])
+
+    def touch_records(self, record_ids: List[str]) -> None:
+        now = _utcnow()
+        with self._lock:
+            indexes = [self._positions[rid] for rid in record_ids if rid in self._positions]
+            for i in indexes:
+                self._records[i].last_accessed = now
+            if indexes:
+                self._persist(indexes)
+
+    def get_record(self, record_id: str) -> Optional[MemoryRecord]:
+        with self._lock:
+            i = self._positions.get(record_id)
+            if i is None or self._sessions[i] != (current_memory_session() or ""):
+                return None
+            return self._records[i].model_copy(update={"embedding": self._matrix[i].tolist()})
+
+    def list_records(self, scope_prefix: Optional[str] = None, limit: int = 200, offset: int = 0) -> List[MemoryRecord]:
+        with self._lock:
+            records = [self._records[i] for i in self._session_indexes(scope_prefix)]
+        records.sort(key=lambda r: _utc(r.created_at), reverse=True)
+        return [r.model_copy() for r in records[offset:offset + limit]]
+
+    def get_scope_info(self, scope: str) -> ScopeInfo:
+        scope = scope.rstrip("/") or "/"
+        with self._lock:
+            records = [self._records[i] for i in self._session_indexes(scope)]
+        child_prefix = scope.rstrip("/") + "/"
+        children = {
+            child_prefix + r.scope[len(child_prefix):].split("/", 1)[0]
+            for r in records
+            if r.scope.startswith(child_prefix) and r.scope[len(child_prefix):]
+        }
+        created = [_utc(r.created_at) for r in records]
+        return ScopeInfo(
+            path=scope,
+            record_count=len(records),
+            categories=sorted({c for r in records for c in r.categories}),
+            oldest_record=min(created) if created else None,
+            newest_record=max(created) if created else None,
+            child_scopes=sorted(children),
+        )
+
+    def list_scopes(self, parent: str = "/") -> List[str]:
+        return self.get_scope_info(parent).child_scopes
+
+    def list_categories(self, scope_prefix: Optional[str] = None) -> Dict[str, int]:
+        counts: Dict[str, int] = defaultdict(int)
+        with self._lock:
+            for i in self._session_indexes(scope_prefix):
+                for category in self._records[i].categories:
+                    counts[category] += 1
+        return dict(counts)
+
+    def count(self, scope_prefix: Optional[str] = None) -> int:
+        with self._lock:
+            return len(self._session_indexes(scope_prefix))
+
+    def reset(self, scope_prefix: Optional[str] = None) -> None:
+        with self._lock:
+            self._remove(self._delete_indexes(scope_prefix))
+            self._publish_size()
+
+    async def asave(self, records: List[MemoryRecord]) -> None:
+        self.save(records)
+
+    async def asearch(self, query_embedding: List[float], **kwargs) -> List[Tuple[MemoryRecord, float]]:
+        return self.search(query_embedding, **kwargs)
+
+    async def adelete(self, **kwargs) -> int:
+        return self.delete(**kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ---- Maintenance ----
+
+    def compact(self) -> Dict[str, int]:
+        """
+        Drop expired records, merge near-duplicates and enforce max_records.
+
+        Returns the number of records removed per reason.
+        """
+        start = time.perf_counter()
+        removed = {"expired": 0, "duplicate": 0, "overflow": 0}
+        with self._lock:
+            self._saves_since_compaction = 0
+            drop = set()
+
+            if self.max_age_days > 0:
+                cutoff = _utcnow() - timedelta(days=self.max_age_days)
+                drop = {i for i, r in enumerate(self._records) if _utc(r.created_at) < cutoff}
+                removed["expired"] = len(drop)
+
+            groups = defaultdict(list)
+            for i, record in enumerate(self._records):
+                if i not in drop:
+                    groups[(self._sessions[i], record.scope)].append(i)
+            for members in groups.values():
+                if len(members) < 2:
+                    continue
+                members.sort(key=lambda i: _utc(self._records[i].created_at), reverse=True)
+                duplicate = _newer_duplicates(self._matrix[members], self.dedupe_threshold)
+                for i in np.asarray(members)[duplicate]:
+                    drop.add(int(i))
+                    removed["duplicate"] += 1
+
+            alive = [i for i in range(len(self._records)) if i not in drop]
+            overflow = len(alive) - self.max_records
+            if overflow > 0:
+                alive.sort(key=lambda i: _utc(self._records[i].last_accessed))
+                drop.update(alive[:overflow])
+                removed["overflow"] = overflow
+
+            if drop:
+                self._remove(drop)
+                self._conn.execute("VACUUM")
+            self._publish_size()
+
+        if TELEMETRY_ENABLED:
+            for reason, count in removed.items():
+                if count:
+                    tracer.metrics.inc(
+                        "tutor_memory_compacted_total", count, help="Memories removed by compaction.", reason=reason
+                    )
+            tracer.metrics.observe(
+                "tutor_memory_compaction_seconds", time.perf_counter() - start, help="Memory compaction time."
+            )
+        return removed
+
+    def stats(self) -> dict:
+        """
+        Store size across all sessions.
+        """
+        with self._lock:
+            created = [_utc(r.created_at) for r in self._records]
+            return {
+                "records": len(self._records),
+                "sessions": len(set(self._sessions)),
+                "oldest": min(created).isoformat() if created else None,
+                "newest": max(created).isoformat() if created else None,
+                "disk_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            }
+
+
+class SessionMemory(Memory):
+    """
+    CrewAI Memory that records lookup latency and serves prefetched recalls.
+
+    When answer_question started a lookup for the question in the background
+    (prefetch_recall), the agents' recalls return its result instead of
+    searching again before every task.
+    """
+
+    def recall(self, query: str, scope=None, categories=None, limit: int = 10, **kwargs):
+        prefetched = _prefetched_recall.get()
+        if prefetched is not None and scope is None and categories is None:
+            start = time.perf_counter()
+            try:
+                matches = prefetched.result()
+                count_cache("memory_prefetch", "hit")
+                return matches[:limit]
+            except Exception:
+                count_cache("memory_prefetch", "failed")  # Fall back to a regular lookup
+            finally:
+                if TELEMETRY_ENABLED:
+                    tracer.metrics.observe(
+                        "tutor_memory_lookup_seconds", time.perf_counter() - start,
+                        help="Time a task waited for its memory lookup.", mode="prefetched",
+                    )
+        start = time.perf_counter()
+        with span("memory.recall", "tool"):
+            matches = super().recall(query, scope=scope, categories=categories, limit=limit, **kwargs)
+        if TELEMETRY_ENABLED:
+            tracer.metrics.observe(
+                "tutor_memory_lookup_seconds", time.perf_counter() - start,
+                help="Time a task waited for its memory lookup.", mode="inline",
+            )
+        return matches
+
+
+def prefetch_recall(memory: SessionMemory, query: str, limit: int = MEMORY_RECALL_LIMIT) -> Future:
+    """
+    Start looking up memories for query on a background thread.
+
+    Runs in a copy of the caller's context, so the session and trace carry over.
+    """
+    def lookup():
+        with span("memory.prefetch", "tool"):
+            return Memory.recall(memory, query, limit=limit)
+    return _prefetch_pool.submit(contextvars.copy_context().run, lookup)
+
+
+@contextmanager
+def use_prefetched_recall(future: Optional[Future]) -> Iterator[None]:
+    """
+    Let SessionMemory.recall inside the block return the result of future.
+    """
+    token = _prefetched_recall.set(future)
+    try:
+        yield
+    finally:
+        _prefetched_recall.reset(token)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_memory_storage() -> BoundedMemoryStorage:
+    """
+    Return the process-wide memory store, compacting it once on first use.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = BoundedMemoryStorage()
+        return _storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or compact the crew memory store.")
+    parser.add_argument("--path", default=MEMORY_DB_PATH)
+    parser.add_argument("--compact", action="store_true", help="Compact now (also happens on every start).")
+    args = parser.parse_args()
+
+    storage = BoundedMemoryStorage(path=args.path)  # Opening the store compacts it
+    if args.compact:
+        print(f"Removed: {storage.compact()}")
+    print(json.dumps(storage.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+"""
+Compact, memory-mapped embedding index for very large knowledge bases.
+
+QuantizedCollection offers the part of the Chroma collection API the tutor
+uses (count, get, query, upsert, delete), so tools/vector_tool.py can use it
+instead of Chroma with VECTOR_BACKEND=quantized.
+
+- Every embedding is stored twice on disk: as quantized codes and as the
+  float32 original. Codes are int8 (1 byte per dimension, 4x smaller) or
+  product-quantized (1 byte per PQ_SUBVECTOR_DIM dimensions, 32x smaller
+  for 384-dim vectors with the default of 8).
+- Both files are memory-mapped, so RAM only holds the pages a query touches:
+  a query scans the codes for the QUANT_RESCORE_CANDIDATES best rows (coarse)
+  and re-scores only those with the full-precision vectors (fine).
+- IDs, documents and metadata live in a SQLite file next to the vectors.
+
+Vectors are L2-normalized and compared by cosine similarity; distances are
+returned as 1 - cosine, like a Chroma collection with hnsw:space=cosine.
+
+Convert the existing Chroma collection with:
+    python -m tools.quantized_index [--quantization int8|pq]
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from tools.hybrid_retriever import matches_where
+
+QUANTIZATION = os.getenv("QUANTIZATION", "int8")
+QUANT_RESCORE_CANDIDATES = int(os.getenv("QUANT_RESCORE_CANDIDATES", "100"))
+PQ_SUBVECTOR_DIM = int(os.getenv("PQ_SUBVECTOR_DIM", "8"))
+PQ_TRAIN_SIZE = int(os.getenv("PQ_TRAIN_SIZE", "10000"))
+
+PQ_CENTROIDS = 256
+# Rows per block in the coarse scan; small blocks keep the float32 temporaries in cache
+SCAN_BLOCK_ROWS = 1024
+ENCODE_BLOCK_ROWS = 65536
+INITIAL_CAPACITY = 1024
+SQLITE_MAX_VARIABLES = 900
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = 15, seed: int = 0) -> np.ndarray:
+    """
+    Plain Lloyd's k-means; returns the (k, dim) centroids.
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        # ||x||^2 is the same for every centroid, so it is left out of the argmin
+        assignment = ((centroids ** 2).sum(1) - 2 * data @ centroids.T).argmin(1)
+        counts = np.bincount(assignment, minlength=k)
+        filled = counts > 0
+        for d in range(data.shape[1]):
+            sums = np.bincount(assignment, weights=data[:, d], minlength=k)
+            centroids[filled, d] = sums[filled] / counts[filled]
+    return centroids
+
+
+def _chunked(items: list, size: int = SQLITE_MAX_VARIABLES):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class QuantizedCollection:
+    """
+    Memory-mapped, quantized vector collection with a Chroma-like interface.
+
+    Rows are slots in the memory-mapped arrays; deleted rows are reused by
+    later inserts.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        embedding_function=None,
+        quantization: str = QUANTIZATION,
+        rescore_candidates: int = QUANT_RESCORE_CANDIDATES,
+    ):
+        if quantization not in ("int8", "pq"):
+            raise ValueError(f"Unknown quantization {quantization!r}, expected 'int8' or 'pq'")
+        self.name = name
+        self.metadata = {"hnsw:space": "cosine"}
+        self.path = os.path.join(path, name)
+        self.embedding_function = embedding_function
+        self.rescore_candidates = rescore_candidates
+        self._lock = threading.RLock()
+        os.makedirs(self.path, exist_ok=True)
+
+        self._conn = sqlite3.connect(os.path.join(self.path, "chunks.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document TEXT, metadata TEXT)"
+        )
+        self._conn.commit()
+
+        # The layout is fixed by the first index built in this directory
+        self._info_path = os.path.join(self.path, "index.json")
+        self.info = {"quantization": quantization, "dim": None, "capacity": 0}
+        if os.path.exists(self._info_path):
+            with open(self._info_path, "r", encoding="utf-8") as f:
+                self.info = json.load(f)
+        self.quantization = self.info["quantization"]
+
+        self._vectors = self._codes = self._scales = None
+        self._codebooks = None
+        codebook_path = os.path.join(self.path, "pq_codebooks.npy")
+        if os.path.exists(codebook_path):
+            self._codebooks = np.load(codebook_path)
+
+        rows = [row for (row,) in self._conn.execute("SELECT row FROM chunks")]
+        self._size = max(rows) + 1 if rows else 0
+        self._live = np.zeros(max(self.info["capacity"], 1), dtype=bool)
+        self._live[rows] = True
+        self._free = sorted(set(range(self._size)) - set(rows), reverse=True)
+        if self.info["dim"] is not None:
+            self._open_arrays()
+
+    # ---- Storage ----
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _open_arrays(self) -> None:
+        dim, capacity = self.info["dim"], self.info["capacity"]
+        self._vectors = self._memmap("vectors.f32", np.float32, (capacity, dim))
+        if self.quantization == "int8":
+            self._codes = self._memmap("codes.i8", np.int8, (capacity, dim))
+            self._scales = self._memmap("scales.f32", np.float32, (capacity,))
+        else:
+            self._codes = self._memmap("codes.pq", np.uint8, (capacity, dim // PQ_SUBVECTOR_DIM))
+
+    def _memmap(self, name: str, dtype, shape) -> np.memmap:
+        path = self._file(name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _ensure_capacity(self, rows_needed: int, dim: int) -> None:
+        if self.info["dim"] is None:
+            if self.quantization == "pq" and dim % PQ_SUBVECTOR_DIM:
+                raise ValueError(f"Embedding size {dim} is not a multiple of PQ_SUBVECTOR_DIM={PQ_SUBVECTOR_DIM}")
+            self.info["dim"] = dim
+        elif dim != self.info["dim"]:
+            raise ValueError(f"Embedding size {dim} does not match the index ({self.info['dim']})")
+
+        capacity = self.info["capacity"]
+        if rows_needed <= capacity and self._vectors is not None:
+            return
+        while capacity < rows_needed:
+            capacity = max(INITIAL_CAPACITY, capacity * 2)
+        self.info["capacity"] = capacity
+        self._flush()
+        self._open_arrays()
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self._live)] = self._live[:capacity]
+        self._live = live
+        self._save_info()
+
+    def _save_info(self) -> None:
+        with open(self._info_path, "w", encoding="utf-8") as f:
+            json.dump(self.info, f)
+
+    def _flush(self) -> None:
+        for array in (self._vectors, self._codes, self._scales):
+            if array is not None:
+                array.flush()
+
+    # ---- Quantization ----
+
+    def _encode(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(1) / 127.0
+            scales[scales == 0] = 1.0
+            self._codes[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales[rows] = scales
+        elif self._codebooks is not None:
+            self._codes[rows] = self._pq_encode(vectors)
+
+    def _pq_encode(self, vectors: np.ndarray) -> np.ndarray:
+        m = self._codebooks.shape[0]
+        subvectors = vectors.reshape(len(vectors), m, PQ_SUBVECTOR_DIM)
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for j in range(m):
+            centroids = self._codebooks[j]
+            distances = -2 * subvectors[:, j] @ centroids.T + (centroids ** 2).sum(1)
+            codes[:, j] = distances.argmin(1)
+        return codes
+
+    def train(self, sample_size: int = PQ_TRAIN_SIZE) -> None:
+        """
+        Train the PQ codebooks on a sample of the stored vectors and encode every row.
+
+        Called automatically once PQ_TRAIN_SIZE vectors are stored; until then
+        queries scan the full-precision vectors.
+        """
+        if self.quantization != "pq":
+            return
+        with self._lock:
+            rows = np.flatnonzero(self._live[:self._size])
+            if not len(rows):
+                return
+            rng = np.random.default_rng(0)
+            sample = self._vectors[np.sort(rng.choice(rows, size=min(sample_size, len(rows)), replace=False))]
+            m = self.info["dim"] // PQ_SUBVECTOR_DIM
+            subvectors = sample.reshape(len(sample), m, PQ_SUBVECTOR_DIM)
+            codebooks = np.zeros((m, PQ_CENTROIDS, PQ_SUBVECTOR_DIM), dtype=np.float32)
+            for j in range(m):
+                centroids = _kmeans(subvectors[:, j], PQ_CENTROIDS, seed=j)
+                codebooks[j, :len(centroids)] = centroids
+            self._codebooks = codebooks
+            np.save(self._file("pq_codebooks.npy"), codebooks)
+            for start in range(0, len(rows), ENCODE_BLOCK_ROWS):
+                block = rows[start:start + ENCODE_BLOCK_ROWS]
+                self._codes[block] = self._pq_encode(np.asarray(self._vectors[block]))
+            self._flush()
+
+    def _coarse_scores(self, query: np.ndarray, size: int, codes, scales, vectors, codebooks) -> np.ndarray:
+        """
+        Approximate cosine similarity of the query to rows [0, size).
+        """
+        scores = np.empty(size, dtype=np.float32)
+        table = None
+        if self.quantization == "pq" and codebooks is not None:
+            m = codebooks.shape[0]
+            # Asymmetric distance: dot products of each query subvector with every centroid
+            table = np.einsum("mcd,md->mc", codebooks, query.reshape(m, PQ_SUBVECTOR_DIM))
+        # PQ lookups loop over subvectors in Python, so they use larger blocks
+        step = SCAN_BLOCK_ROWS * 8 if table is not None else SCAN_BLOCK_ROWS
+        for start in range(0, size, step):
+            end = min(start + step, size)
+            if self.quantization == "int8":
+                scores[start:end] = (codes[start:end].astype(np.float32) @ query) * scales[start:end]
+            elif table is not None:
+                block = codes[start:end]
+                scores[start:end] = 0.0
+                for j in range(table.shape[0]):
+                    scores[start:end] += table[j].take(block[:, j])
+            else:
+                scores[start:end] = vectors[start:end] @ query
+        return scores
+
+    # ---- Chroma-compatible API ----
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._live[:self._size].sum())
+
+    def _embed(self, documents: List[str]) -> np.ndarray:
+        if self.embedding_function is None:
+            raise ValueError("No embedding_function: pass embeddings explicitly")
+        return np.asarray(self.embedding_function(documents), dtype=np.float32)
+
+    def upsert(self, ids: List[str], documents=None, embeddings=None, metadatas=None) -> None:
+        if not ids:
+            return
+        vectors = _normalize(
+            np.asarray(embeddings, dtype=np.float32) if embeddings is not None else self._embed(documents)
+        )
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+
+        with self._lock:
+            existing = self._rows_for_ids(ids)
+            rows = []
+            for doc_id in ids:
+                if doc_id in existing:
+                    rows.append(existing[doc_id])
+                else:
+                    row = self._free.pop() if self._free else self._size
+                    self._size = max(self._size, row + 1)
+                    existing[doc_id] = row
+                    rows.append(row)
+            self._ensure_capacity(self._size, vectors.shape[1])
+
+            rows = np.asarray(rows)
+            self._vectors[rows] = vectors
+            self._encode(rows, vectors)
+            self._live[rows] = True
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (int(row), doc_id, document, json.dumps(metadata) if metadata else None)
+                    for row, doc_id, document, metadata in zip(rows, ids, documents, metadatas)
+                ],
+            )
+            # Memory-mapped writes reach the file through the page cache; no flush needed
+            self._conn.commit()
+
+        if self.quantization == "pq" and self._codebooks is None and self.count() >= PQ_TRAIN_SIZE:
+            self.train()
+
+    add = upsert
+
+    def _rows_for_ids(self, ids: List[str]) -> Dict[str, int]:
+        rows = {}
+        for part in _chunked(list(ids)):
+            placeholders = ",".join("?" * len(part))
+            for doc_id, row in self._conn.execute(
+                f"SELECT id, row FROM chunks WHERE id IN ({placeholders})", part
+            ):
+                rows[doc_id] = row
+        return rows
+
+    def _records(self, rows: List[int]) -> Dict[int, tuple]:
+        records = {}
+        for part in _chunked([int(r) for r in rows]):
+            placeholders = ",".join("?" * len(part))
+            for row, doc_id, document, metadata in self._conn.execute(
+                f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({placeholders})", part
+            ):
+                records[row] = (doc_id, document, json.loads(metadata) if metadata else None)
+        return records
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None) -> dict:
+        with self._lock:
+            if ids is not None:
+                rows = list(self._rows_for_ids(ids).values())
+                records = self._records(rows)
+                items = [(row, records[row]) for row in rows]
+            else:
+                sql, params = "SELECT row, id, document, metadata FROM chunks", []
+                if where and len(where) == 1:
+                    key, value = next(iter(where.items()))
+                    if not key.startswith("$") and isinstance(value, (str, int, float)):
+                        # Plain equality such as {"source": "notes.txt"}: filter in SQLite
+                        sql += " WHERE json_extract(metadata, ?) = ?"
+                        params = [f'$."{key}"', value]
+                        where = None
+                sql += " ORDER BY row"
+                if not where and (limit is not None or offset):
+                    # Page in SQLite, so paging through a large index never loads all of it
+                    sql += " LIMIT ? OFFSET ?"
+                    params += [-1 if limit is None else limit, offset or 0]
+                    limit = offset = None
+                items = [
+                    (row, (doc_id, document, json.loads(metadata) if metadata else None))
+                    for row, doc_id, document, metadata in self._conn.execute(sql, params)
+                ]
+            if where:
+                items = [(row, record) for row, record in items if matches_where(record[2], where)]
+            items = items[offset or 0:]
+            if limit is not None:
+                items = items[:limit]
+
+            result = {"ids": [record[0] for _, record in items]}
+            if "documents" in include:
+                result["documents"] = [record[1] for _, record in items]
+            if "metadatas" in include:
+                result["metadatas"] = [record[2] for _, record in items]
+            if "embeddings" in include:
+                result["embeddings"] = [np.array(self._vectors[row]) for row, _ in items]
+            return result
+
+    def delete(self, ids=None, where=None) -> None:
+        with self._lock:
+            if where:
+                matched = self.get(ids=ids, where=where, include=())["ids"]
+            else:
+                matched = list(ids or [])
+            rows = self._rows_for_ids(matched)
+            if not rows:
+                return
+            for part in _chunked(list(rows)):
+                placeholders = ",".join("?" * len(part))
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", part)
+            self._conn.commit()
+            self._live[list(rows.values())] = False
+            self._free.extend(rows.values())
+            self._free.sort(reverse=True)
+
+    def query(
+        self,
+        query_texts=None,
+        query_embeddings=None,
+        n_results: int = 10,
+        where=None,
+        include=("documents", "metadatas", "distances"),
+    ) -> dict:
+        queries = _normalize(
+            np.asarray(query_embeddings, dtype=np.float32)
+            if query_embeddings is not None else self._embed(query_texts)
+        )
+        result = {"ids": []}
+        for name in ("documents", "metadatas", "distances"):
+            if name in include:
+                result[name] = []
+
+        for query in queries:
+            rows, similarities, records = self._search(query, n_results, where)
+            result["ids"].append([records[row][0] for row in rows])
+            if "documents" in include:
+                result["documents"].append([records[row][1] for row in rows])
+            if "metadatas" in include:
+                result["metadatas"].append([records[row][2] for row in rows])
+            if "distances" in include:
+                result["distances"].append([float(1.0 - s) for s in similarities])
+        return result
+
+    def _search(self, query: np.ndarray, n_results: int, where):
+        with self._lock:
+            # Scan a snapshot without holding the lock; growing the index maps
+            # new arrays and leaves these valid
+            size, live = self._size, self._live[:self._size].copy()
+            arrays = (self._codes, self._scales, self._vectors, self._codebooks)
+        vectors = arrays[2]
+        if vectors is None or not live.any():
+            return [], [], {}
+        scores = self._coarse_scores(query, size, *arrays)
+        scores[~live] = -np.inf
+
+        available = int(live.sum())
+        pool = min(max(n_results, self.rescore_candidates), available)
+        while True:
+            candidates = np.sort(np.argpartition(-scores, pool - 1)[:pool])
+            # Fine: exact cosine for the candidates only
+            exact = vectors[candidates] @ query
+            order = np.argsort(-exact)
+            ranked, similarities = candidates[order], exact[order]
+            with self._lock:
+                records = self._records(ranked.tolist())
+            # Rows deleted since the snapshot have no record any more
+            keep = [
+                i for i, row in enumerate(ranked)
+                if int(row) in records and (not where or matches_where(records[int(row)][2], where))
+            ]
+            ranked, similarities = ranked[keep], similarities[keep]
+            # A filter can reject most candidates: widen the coarse pool until enough match
+            if len(ranked) >= n_results or pool >= available:
+                break
+            pool = min(pool * 4, available)
+
+        rows = [int(row) for row in ranked[:n_results]]
+        return rows, similarities[:n_results], records
+
+
+def import_collection(source, target: QuantizedCollection, batch_size: int = 1000, progress_callback=None) -> int:
+    """
+    Copy a Chroma collection (embeddings, documents, metadata) into target.
+    """
+    copied = 0
+    total = source.count()
+    while copied < total:
+        batch = source.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=copied)
+        if not batch["ids"]:
+            break
+        target.upsert(
+            ids=batch["ids"],
+            documents=batch["documents"],
+            embeddings=batch["embeddings"],
+            metadatas=batch["metadatas"],
+        )
+        copied += len(batch["ids"])
+        if progress_callback is not None:
+            progress_callback(copied, total)
+    return copied
+
+
+def main():
+    import argparse
+
+    from tools.vector_tool import COLLECTION_NAME, QUANTIZED_DB_PATH, get_client, get_embedding_function
+
+    parser = argparse.ArgumentParser(description="Build the quantized index from the Chroma collection.")
+    parser.add_argument("--quantization", choices=["int8", "pq"], default=QUANTIZATION)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    source = get_client().get_collection(COLLECTION_NAME, embedding_function=get_embedding_function())
+    target = QuantizedCollection(
+        COLLECTION_NAME, QUANTIZED_DB_PATH, embedding_function=get_embedding_function(), quantization=args.quantization
+    )
+    copied = import_collection(
+        source, target, args.batch_size, lambda done, total: print(f"\r{done}/{total} chunks", end="", flush=True)
+    )
+    if args.quantization == "pq":
+        target.train()
+    print(f"\nCopied {copied} chunks to {target.path}. Set VECTOR_BACKEND=quantized to use it.")
+
+
+if __name__ == "__main__":
+    main()
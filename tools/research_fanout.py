@@ -0,0 +1,199 @@
+"""
+Concurrent fan-out over the research tools.
+
+Instead of the ResearchAgent calling the vector DB, Wikipedia and SerpAPI one
+after another inside its reasoning loop, the sources are queried concurrently
+on a thread pool. Each source has its own timeout, the stage stops early once
+the evidence is good enough, and the results are merged into one deduplicated
+evidence bundle that is handed to the agent.
+
+Paid sources (the SerpAPI web search) are hedged: they only start when the
+free sources have not produced good-enough evidence after a short delay, or
+have all finished without it. A request that has been sent cannot be called
+back, so not starting it is the only way to save it.
+
+Sources are plain (name, callable) pairs, so they can be replaced with stubs.
+"""
+import contextvars
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+FANOUT_ENABLED = os.getenv("RESEARCH_FANOUT", "1") != "0"
+FANOUT_TIMEOUT = float(os.getenv("RESEARCH_FANOUT_TIMEOUT", "8"))
+FANOUT_MIN_SOURCES = int(os.getenv("RESEARCH_FANOUT_MIN_SOURCES", "2"))
+# Seconds to wait for the local notes and Wikipedia before starting the web search
+FANOUT_WEB_DELAY = float(os.getenv("RESEARCH_FANOUT_WEB_DELAY", "1.5"))
+
+# Tool outputs that mean "nothing useful", not evidence
+_EMPTY_PREFIXES = ("error", "no relevant information", "no results", "no wikipedia results")
+
+
+@dataclass
+class ResearchSource:
+    """
+    timeout counts from the moment the source starts. With hedge set, the
+    source is only started after that many seconds, and only if the evidence
+    is not good enough by then (or every other source finished earlier).
+    """
+    name: str
+    search: Callable[[str], str]
+    timeout: float = FANOUT_TIMEOUT
+    hedge: Optional[float] = None
+
+
+@dataclass
+class Evidence:
+    source: str
+    text: str
+
+
+@dataclass
+class EvidenceBundle:
+    query: str
+    evidence: List[Evidence] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)  # seconds per finished source
+    timed_out: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)  # hedged sources that were never started
+
+    @property
+    def sources(self) -> List[str]:
+        return sorted({e.source for e in self.evidence})
+
+    def to_text(self) -> str:
+        return "\n\n".join(f"[{e.source}] {e.text}" for e in self.evidence)
+
+
+def _is_useful(text: Optional[str]) -> bool:
+    return bool(text) and not text.strip().lower().startswith(_EMPTY_PREFIXES)
+
+
+def _passages(text: str) -> List[str]:
+    return [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+def _fingerprint(passage: str) -> str:
+    normalized = re.sub(r"\W+", " ", passage.lower()).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def enough_sources(min_sources: int = FANOUT_MIN_SOURCES):
+    """
+    Default "good enough" rule: stop once min_sources returned useful evidence.
+    """
+    def check(bundle: EvidenceBundle) -> bool:
+        return len(bundle.sources) >= min_sources
+    return check
+
+
+def fan_out(
+    query: str,
+    sources: List[ResearchSource],
+    good_enough: Optional[Callable[[EvidenceBundle], bool]] = None,
+    max_workers: Optional[int] = None,
+) -> EvidenceBundle:
+    """
+    Query the sources concurrently and merge their results.
+
+    Sources without a hedge start at once; hedged ones start as described on
+    ResearchSource. Sources that are still running when good_enough(bundle)
+    becomes true, or when their timeout expires, are abandoned and listed in
+    bundle.timed_out; hedged sources that were not needed are listed in
+    bundle.skipped.
+    """
+    good_enough = good_enough or enough_sources()
+    bundle = EvidenceBundle(query=query)
+    seen = set()
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(sources) or 1)
+    start = time.perf_counter()
+    futures = {}
+    deadlines = {}
+    waiting = sorted((s for s in sources if s.hedge is not None), key=lambda s: s.hedge)
+
+    def launch(source: ResearchSource):
+        # Each source runs in a copy of the caller's context so its spans join the request trace
+        future = executor.submit(contextvars.copy_context().run, source.search, query)
+        futures[future] = source
+        deadlines[future] = time.perf_counter() - start + source.timeout
+        return future
+
+    pending = {launch(source) for source in sources if source.hedge is None}
+
+    try:
+        while pending or waiting:
+            now = time.perf_counter() - start
+            # Start hedged sources that are due, or right away when nothing else is left
+            while waiting and (now >= waiting[0].hedge or not pending):
+                pending.add(launch(waiting.pop(0)))
+
+            # Drop sources whose own deadline has passed
+            for future in [f for f in pending if now >= deadlines[f]]:
+                pending.discard(future)
+                future.cancel()
+                bundle.timed_out.append(futures[future].name)
+            if not pending:
+                continue
+
+            next_event = min(deadlines[f] for f in pending)
+            if waiting:
+                next_event = min(next_event, waiting[0].hedge)
+            done, pending = wait(pending, timeout=max(next_event - now, 0), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                source = futures[future]
+                bundle.timings[source.name] = time.perf_counter() - start
+                try:
+                    text = future.result()
+                except Exception:
+                    bundle.failed.append(source.name)
+                    continue
+                if not _is_useful(text):
+                    continue
+                for passage in _passages(text):
+                    key = _fingerprint(passage)
+                    if key not in seen:
+                        seen.add(key)
+                        bundle.evidence.append(Evidence(source.name, passage))
+
+            if (pending or waiting) and good_enough(bundle):
+                for future in pending:
+                    future.cancel()
+                    bundle.timed_out.append(futures[future].name)
+                bundle.skipped.extend(source.name for source in waiting)
+                break
+    finally:
+        # Do not block on abandoned sources
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return bundle
+
+
+def default_sources(local_passages: Optional[List] = None) -> List[ResearchSource]:
+    """
+    The three research tools, in priority order; the paid web search is hedged
+    by FANOUT_WEB_DELAY.
+
+    local_passages: chunks the router already retrieved for this question.
+        They are used as the local notes' result instead of searching again.
+    """
+    from tools.serpapi_tool import search_online
+    from tools.vector_tool import search_history_vector
+    from tools.wiki_tool import wikipedia_tool
+
+    if local_passages is None:
+        local = ResearchSource("local_notes", search_history_vector.run, timeout=FANOUT_TIMEOUT / 2)
+    else:
+        text = "\n\n".join(chunk.text for chunk in local_passages) or "No relevant information found in the notes."
+        local = ResearchSource("local_notes", lambda query: text)
+
+    return [
+        local,
+        ResearchSource("wikipedia", wikipedia_tool.run),
+        ResearchSource("web", search_online.run, hedge=FANOUT_WEB_DELAY),
+    ]
@@ -0,0 +1,315 @@
+"""
+Semantic near-duplicate cache for research summaries and final answers.
+
+Incoming questions are embedded with the same DefaultEmbeddingFunction as the
+'ww2_knowledge' collection and compared against a NumPy matrix of past
+questions. Paraphrases such as "when was D-Day" and "what date did the
+Normandy landings happen" can then reuse earlier work instead of running the
+ResearchAgent again. Questions that mention different numbers ("the 82nd" vs
+"the 101st Airborne", "1943" vs "1944") never share an entry, however close
+their embeddings are.
+"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "data", "cache")
+SEMANTIC_CACHE_PATH = os.path.join(CACHE_DIR, "semantic_cache")
+
+# "when did WW2 start" and "when did WW2 end" embed close together, so a reused
+# final answer needs a near-exact paraphrase
+DEFAULT_ANSWER_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_ANSWER_THRESHOLD", "0.97"))
+DEFAULT_RESEARCH_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_RESEARCH_THRESHOLD", "0.85"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+# save() only writes after this many changes or seconds since the last write
+DEFAULT_FLUSH_EVERY = int(os.getenv("SEMANTIC_CACHE_FLUSH_EVERY", "20"))
+DEFAULT_FLUSH_SECONDS = float(os.getenv("SEMANTIC_CACHE_FLUSH_SECONDS", "60"))
+
+_NUMBER_RE = re.compile(r"\w*\d\w*")
+
+
+@dataclass
+class SemanticCacheEntry:
+    question: str
+    mode: str
+    kb_version: str
+    research_summary: Optional[str] = None
+    answer: Optional[str] = None
+    last_access: float = field(default_factory=time.time)
+
+
+@dataclass
+class SemanticCacheHit:
+    entry: SemanticCacheEntry
+    similarity: float
+    answer: Optional[str]
+    research_summary: Optional[str]
+
+
+def number_terms(question: str) -> frozenset:
+    """
+    Tokens containing a digit (years, unit numbers, "WW2"), lowercased.
+    """
+    return frozenset(token.lower() for token in _NUMBER_RE.findall(question))
+
+
+def _default_embed(texts: Sequence[str]) -> List[np.ndarray]:
+    # Imported lazily so the cache can be used with a stub embedder in benchmarks
+    from tools.vector_tool import get_embedding_function
+    return get_embedding_function()(list(texts))
+
+
+class SemanticCache:
+    """
+    Bounded, LRU-evicting cache of past questions and their embeddings.
+
+    A stored final answer is returned when the cosine similarity is above
+    answer_threshold; a stored research summary is returned when it is above
+    research_threshold. Both only apply to entries with the same mode,
+    knowledge-base version and numbers in the question (see number_terms).
+
+    Embeddings live in a preallocated buffer that grows by doubling (up to
+    max_entries rows), and a full cache overwrites its least recently used
+    row, so add() does not copy the matrix.
+
+    save() is cheap to call after every add: it only rewrites the files once
+    flush_every changes or flush_seconds have accumulated (flush() forces it).
+    """
+
+    def __init__(
+        self,
+        embed_fn: Optional[Callable[[Sequence[str]], List[np.ndarray]]] = None,
+        answer_threshold: float = DEFAULT_ANSWER_THRESHOLD,
+        research_threshold: float = DEFAULT_RESEARCH_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        flush_every: int = DEFAULT_FLUSH_EVERY,
+        flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+    ):
+        self.embed_fn = embed_fn or _default_embed
+        self.answer_threshold = answer_threshold
+        self.research_threshold = research_threshold
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: List[SemanticCacheEntry] = []
+        self._matrix: Optional[np.ndarray] = None  # (n, dim) view of _buffer, rows L2-normalized
+        self._buffer: Optional[np.ndarray] = None  # (capacity, dim)
+        self._lock = threading.Lock()
+        self._dirty = 0  # changes since the last write
+        self._last_flush = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embed_fn([question])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(
+        self,
+        question: str,
+        mode: str,
+        kb_version: str,
+        vector: Optional[np.ndarray] = None,
+    ) -> Optional[SemanticCacheHit]:
+        """
+        Find the most similar past question for this mode and knowledge-base version.
+
+        Returns None when nothing clears research_threshold.
+        """
+        if vector is None:
+            vector = self.embed(question)
+
+        with self._lock:
+            if self._matrix is None or not self._entries:
+                self.misses += 1
+                return None
+
+            numbers = number_terms(question)
+            scores = self._matrix @ vector
+            for idx, entry in enumerate(self._entries):
+                if (
+                    entry.mode != mode
+                    or entry.kb_version != kb_version
+                    or number_terms(entry.question) != numbers
+                ):
+                    scores[idx] = -1.0
+
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.research_threshold:
+                self.misses += 1
+                return None
+
+            entry = self._entries[best]
+            entry.last_access = time.time()
+            self.hits += 1
+
+        answer = entry.answer if similarity >= self.answer_threshold else None
+        return SemanticCacheHit(
+            entry=entry,
+            similarity=similarity,
+            answer=answer,
+            research_summary=entry.research_summary,
+        )
+
+    def add(
+        self,
+        question: str,
+        mode: str,
+        kb_version: str,
+        research_summary: Optional[str] = None,
+        answer: Optional[str] = None,
+        vector: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        Store a question with its research summary and/or final answer.
+        """
+        if vector is None:
+            vector = self.embed(question)
+
+        entry = SemanticCacheEntry(
+            question=question,
+            mode=mode,
+            kb_version=kb_version,
+            research_summary=research_summary,
+            answer=answer,
+        )
+        with self._lock:
+            n = len(self._entries)
+            if n >= self.max_entries:
+                # Full: reuse the least recently used slot
+                idx = min(range(n), key=lambda i: self._entries[i].last_access)
+                self._entries[idx] = entry
+                self._buffer[idx] = vector
+            else:
+                if self._buffer is None or n >= len(self._buffer):
+                    capacity = max(n + 1, min(max(16, 2 * n), self.max_entries))
+                    grown = np.empty((capacity, vector.shape[0]), dtype=np.float32)
+                    if n:
+                        grown[:n] = self._matrix
+                    self._buffer = grown
+                self._buffer[n] = vector
+                self._entries.append(entry)
+                self._matrix = self._buffer[:n + 1]
+            self._dirty += 1
+
+    def invalidate(self, current_kb_version: Optional[str] = None, scope: str = "") -> int:
+        """
+        Drop entries built against an older knowledge base (or all entries).
+
+        scope limits the removal to versions starting with it (one tenant's entries).
+        """
+        with self._lock:
+            keep = [
+                i for i, e in enumerate(self._entries)
+                if current_kb_version is not None
+                and (e.kb_version == current_kb_version or not e.kb_version.startswith(scope))
+            ]
+            removed = len(self._entries) - len(keep)
+            self._entries = [self._entries[i] for i in keep]
+            self._set_matrix(self._matrix[keep] if keep else None)
+            if removed:
+                self._dirty += 1
+            return removed
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def save(self, path: str = SEMANTIC_CACHE_PATH) -> None:
+        """
+        Write the cache to disk once enough changes have accumulated.
+        """
+        with self._lock:
+            due = (
+                self._dirty >= self.flush_every
+                or (self._dirty and time.monotonic() - self._last_flush >= self.flush_seconds)
+            )
+        if due:
+            self.flush(path)
+
+    def flush(self, path: str = SEMANTIC_CACHE_PATH) -> None:
+        """
+        Write the cache to <path>.npy (embeddings) and <path>.json (entries).
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self._matrix is None:
+                for suffix in (".npy", ".json"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+            else:
+                # Written to temp files first so a crash never leaves the pair out of sync
+                with open(path + ".tmp.npy", "wb") as f:
+                    np.save(f, self._matrix)
+                with open(path + ".tmp.json", "w", encoding="utf-8") as f:
+                    json.dump([e.__dict__ for e in self._entries], f)
+                os.replace(path + ".tmp.npy", path + ".npy")
+                os.replace(path + ".tmp.json", path + ".json")
+            self._dirty = 0
+            self._last_flush = time.monotonic()
+
+    def load(self, path: str = SEMANTIC_CACHE_PATH) -> None:
+        """
+        Restore a cache written by save(); missing files are ignored.
+        """
+        if not (os.path.exists(path + ".npy") and os.path.exists(path + ".json")):
+            return
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            entries = [SemanticCacheEntry(**e) for e in json.load(f)]
+        with self._lock:
+            self._entries = entries
+            self._set_matrix(np.load(path + ".npy").astype(np.float32, copy=False))
+            self._evict()
+
+    def _evict(self) -> None:
+        overflow = len(self._entries) - self.max_entries
+        if overflow <= 0:
+            return
+        order = sorted(range(len(self._entries)), key=lambda i: self._entries[i].last_access)
+        keep = sorted(order[overflow:])
+        self._entries = [self._entries[i] for i in keep]
+        self._set_matrix(self._matrix[keep])
+
+    def _set_matrix(self, matrix: Optional[np.ndarray]) -> None:
+        # A compacted copy becomes the new buffer; the next add grows it
+        self._buffer = self._matrix = matrix
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    """
+    Return the process-wide semantic cache, restoring it from disk on first use.
+
+    Unsaved changes are flushed when the process exits.
+    """
+    global _semantic_cache
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            _semantic_cache = SemanticCache()
+            _semantic_cache.load()
+            atexit.register(_semantic_cache.flush)
+        return _semantic_cache
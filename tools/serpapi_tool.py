@@ -1,9 +1,198 @@
 from crewai.tools import BaseTool
-from serpapi import GoogleSearch
+import json
 import os
-from typing import Type
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional, Type
 from pydantic import BaseModel, Field
 
+from tools.telemetry import annotate, count_cache, traced
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+SERPAPI_CACHE_PATH = os.path.join(BASE_DIR, "data", "cache", "serpapi.sqlite")
+SERPAPI_CACHE_TTL = int(os.getenv("SERPAPI_CACHE_TTL", str(24 * 3600)))
+SERPAPI_MONTHLY_QUOTA = int(os.getenv("SERPAPI_MONTHLY_QUOTA", "5000"))
+SERPAPI_BURST = int(os.getenv("SERPAPI_BURST", "20"))
+SERPAPI_MAX_WAIT = float(os.getenv("SERPAPI_MAX_WAIT", "2"))
+SERPAPI_COST_PER_SEARCH = float(os.getenv("SERPAPI_COST_PER_SEARCH", "0.015"))
+# HTTP timeout of one search, so abandoned calls do not linger in the background
+SERPAPI_TIMEOUT = float(os.getenv("SERPAPI_TIMEOUT", "10"))
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: `rate` tokens per second, at most `capacity` stored.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """
+        Take one token, waiting up to timeout seconds. Returns False if none came free.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate if self.rate > 0 else timeout
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class SearchResultCache:
+    """
+    SQLite cache of raw SerpAPI responses with a TTL.
+    """
+
+    def __init__(self, path: str = SERPAPI_CACHE_PATH, ttl_seconds: int = SERPAPI_CACHE_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, response TEXT NOT NULL, fetched_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT response, fetched_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row and time.time() - row[1] <= self.ttl_seconds:
+            return json.loads(row[0])
+        return None
+
+    def set(self, key: str, response: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, response, fetched_at) VALUES (?, ?, ?)",
+                (key, json.dumps(response), time.time()),
+            )
+            self._conn.commit()
+
+
+def _google_search(params: dict) -> dict:
+    # Imported on first search so app start does not pay for the SerpAPI client
+    from serpapi import GoogleSearch
+    search = GoogleSearch(params)
+    search.timeout = SERPAPI_TIMEOUT  # The client default is 60000 seconds
+    return search.get_dict()
+
+
+class SerpApiClient:
+    """
+    Cached, rate-limited SerpAPI client.
+
+    - Results are cached per (normalized query, num) for SERPAPI_CACHE_TTL.
+    - Concurrent identical queries are coalesced into one outbound request.
+    - Outbound requests draw from a token bucket sized to the monthly quota.
+
+    search_fn can be replaced with a fake for tests.
+    """
+
+    def __init__(
+        self,
+        search_fn: Callable[[dict], dict] = _google_search,
+        cache: Optional[SearchResultCache] = None,
+        limiter: Optional[TokenBucket] = None,
+        cost_per_search: float = SERPAPI_COST_PER_SEARCH,
+    ):
+        self.search_fn = search_fn
+        self.cache = cache if cache is not None else SearchResultCache()
+        self.limiter = limiter if limiter is not None else TokenBucket(
+            SERPAPI_MONTHLY_QUOTA / (30 * 24 * 3600), SERPAPI_BURST
+        )
+        self.cost_per_search = cost_per_search
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "coalesced": 0, "requests": 0, "throttled": 0, "errors": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.metrics[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.metrics)
+        stats["spend"] = stats["requests"] * self.cost_per_search
+        return stats
+
+    def search(self, query: str, api_key: str, num: int = 3) -> dict:
+        key = f"{' '.join(query.lower().split())}|{num}"
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count("hits")
+            count_cache("serpapi", "hit")
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.metrics["misses"] += 1
+            else:
+                self.metrics["coalesced"] += 1
+
+        count_cache("serpapi", "miss" if leader else "coalesced")
+        if not leader:
+            return future.result()
+
+        try:
+            if not self.limiter.acquire(timeout=SERPAPI_MAX_WAIT):
+                self._count("throttled")
+                raise RuntimeError("SerpAPI quota rate limit reached, try again later")
+
+            self._count("requests")
+            annotate(cost_usd=self.cost_per_search)
+            params = {
+                "q": query,
+                "api_key": api_key,
+                "num": num,
+                "engine": "google"
+            }
+            results = self.search_fn(params)
+            if "error" not in results:
+                self.cache.set(key, results)
+            future.set_result(results)
+            return results
+        except Exception as e:
+            self._count("errors")
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_serpapi_client() -> SerpApiClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SerpApiClient()
+        return _client
+
 
 class SearchOnlineInput(BaseModel):
     """Input schema for SearchOnlineTool."""
@@ -15,47 +204,40 @@ class SearchOnlineTool(BaseTool):
     description: str = "Search the web using SerpAPI (Google Search) and return relevant results about World War II topics."
     args_schema: Type[BaseModel] = SearchOnlineInput
 
+    @traced("serpapi.search")
     def _run(self, query: str) -> str:
         """Execute the search."""
         # Get API key from environment variable
         api_key = os.getenv("SERPAPI_API_KEY")
-        
+
         if not api_key:
             return "Error: SERPAPI_API_KEY not found in environment variables. Please add it to your .env file."
-        
+
         try:
-            # Perform the search
-            params = {
-                "q": query,
-                "api_key": api_key,
-                "num": 3,  # Limit to 3 results for efficiency
-                "engine": "google"
-            }
-            
-            search = GoogleSearch(params)
-            results = search.get_dict()
-            
+            # Perform the search (cached, coalesced and rate limited)
+            results = get_serpapi_client().search(query, api_key, num=3)  # Limit to 3 results for efficiency
+
             # Extract organic results
             organic_results = results.get("organic_results", [])
-            
+
             if not organic_results:
                 return f"No results found for query: {query}"
-            
+
             # Format the results
             formatted_results = []
             for idx, result in enumerate(organic_results[:3], 1):
                 title = result.get("title", "No title")
                 snippet = result.get("snippet", "No description available")
                 link = result.get("link", "No link")
-                
+
                 formatted_results.append(
                     f"{idx}. {title}\n"
                     f"   {snippet}\n"
                     f"   URL: {link}\n"
                 )
-            
+
             return "\n".join(formatted_results)
-            
+
         except Exception as e:
             return f"Error performing search: {str(e)}"
 
@@ -0,0 +1,503 @@
+"""
+Structured tracing and metrics for requests, tasks, LLM calls and tools.
+
+A request is a tree of spans:
+
+    request (answer_question)
+      stage (research fan-out, crew kickoff)
+        task (one per CrewAI task)
+          llm (one per LLM call: agent, model, tokens, cost)
+      tool (vector / Wikipedia / SerpAPI / vision / Docling)
+
+Spans opened with span() nest through a context variable. Task and LLM spans
+are built from CrewAI's event bus: its handlers run on a thread pool with a
+copy of the emitting thread's context, so they still see the request span,
+and their timing comes from the events' own timestamps.
+
+Finished spans are appended to data/cache/traces.jsonl (rotated by size, see
+JsonlLog), kept in memory for the Streamlit debug panel, and folded into
+Prometheus-style counters and histograms (render_prometheus(), served as
+/metrics by server.py).
+Set TELEMETRY=0 to disable everything.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from logging.handlers import RotatingFileHandler
+from typing import Dict, Iterator, List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+TRACE_LOG_PATH = os.path.join(BASE_DIR, "data", "cache", "traces.jsonl")
+
+TELEMETRY_ENABLED = os.getenv("TELEMETRY", "1") != "0"
+TRACE_LOG_ENABLED = os.getenv("TELEMETRY_TRACE_LOG", "1") != "0"
+# USD per million tokens; defaults are gpt-4o-mini list prices
+LLM_PROMPT_PRICE_PER_1M = float(os.getenv("LLM_PROMPT_PRICE_PER_1M", "0.15"))
+LLM_COMPLETION_PRICE_PER_1M = float(os.getenv("LLM_COMPLETION_PRICE_PER_1M", "0.60"))
+
+# Size cap of the JSONL logs (traces, routes): the file is rotated to .1, .2, ...
+# at TELEMETRY_LOG_MAX_MB and only TELEMETRY_LOG_BACKUPS old files are kept
+TELEMETRY_LOG_MAX_MB = float(os.getenv("TELEMETRY_LOG_MAX_MB", "50"))
+TELEMETRY_LOG_BACKUPS = int(os.getenv("TELEMETRY_LOG_BACKUPS", "3"))
+
+RECENT_TRACES = 50
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str  # request, stage, task, llm, tool
+    trace_id: Optional[str]
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    parent_id: Optional[str] = None
+    start: float = field(default_factory=time.time)
+    duration_s: float = 0.0
+    status: str = "ok"
+    attributes: dict = field(default_factory=dict)
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("telemetry_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def annotate(**attributes) -> None:
+    """
+    Add attributes to the innermost open span, if any.
+    """
+    span_ = _current_span.get()
+    if span_ is not None:
+        span_.set(**attributes)
+
+
+def _label_key(labels: dict) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    """
+    Minimal Prometheus-style registry: labelled counters, gauges and histograms.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name: str, value: float = 1.0, help: str = "", **labels) -> None:
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            self._counters[(name, _label_key(labels))] += value
+
+    def set_gauge(self, name: str, value: float, help: str = "", **labels) -> None:
+        with self._lock:
+            self._help.setdefault(name, ("gauge", help))
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name: str, value: float, help: str = "", **labels) -> None:
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            key = (name, _label_key(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["counts"][idx] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0.0)
+
+    def gauge_value(self, name: str, **labels) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get((name, _label_key(labels)))
+
+    def snapshot(self) -> dict:
+        """
+        {name: {label string: value}} of all counters and gauges, for quick summaries.
+        """
+        with self._lock:
+            result = defaultdict(dict)
+            for (name, labels), value in list(self._counters.items()) + list(self._gauges.items()):
+                result[name][",".join(f"{k}={v}" for k, v in labels)] = value
+            return dict(result)
+
+    def render_prometheus(self) -> str:
+        """
+        Text exposition format.
+        """
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        with self._lock:
+            lines = []
+            for name in sorted(self._help):
+                kind, help_text = self._help[name]
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind in ("counter", "gauge"):
+                    values = self._counters if kind == "counter" else self._gauges
+                    for (metric, labels), value in sorted(values.items()):
+                        if metric == name:
+                            lines.append(f"{name}{fmt(labels)} {value:g}")
+                else:
+                    for (metric, labels), histogram in sorted(self._histograms.items()):
+                        if metric != name:
+                            continue
+                        for bound, count in zip(self.buckets, histogram["counts"]):
+                            lines.append(f"{name}_bucket{fmt(labels, [('le', f'{bound:g}')])} {count}")
+                        lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {histogram['count']}")
+                        lines.append(f"{name}_sum{fmt(labels)} {histogram['sum']:g}")
+                        lines.append(f"{name}_count{fmt(labels)} {histogram['count']}")
+            return "\n".join(lines) + "\n"
+
+
+def llm_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    return (prompt_tokens * LLM_PROMPT_PRICE_PER_1M + completion_tokens * LLM_COMPLETION_PRICE_PER_1M) / 1e6
+
+
+class JsonlLog:
+    """
+    Append-only JSONL file with size-based rotation (like a RotatingFileHandler),
+    so a long-running server never fills the disk.
+    """
+
+    def __init__(self, path: str, max_mb: float = TELEMETRY_LOG_MAX_MB, backups: int = TELEMETRY_LOG_BACKUPS):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._handler = RotatingFileHandler(
+            path, maxBytes=int(max_mb * 1024 * 1024), backupCount=backups, encoding="utf-8", delay=True
+        )
+
+    def write(self, record: dict) -> None:
+        # handle() takes the handler's lock and rotates before writing when needed
+        self._handler.handle(logging.makeLogRecord({"msg": json.dumps(record, default=str)}))
+
+    def close(self) -> None:
+        self._handler.close()
+
+
+class Tracer:
+    """
+    Collects finished spans into the trace log, the recent-trace buffer and the metrics.
+    """
+
+    def __init__(self, log_path: Optional[str] = TRACE_LOG_PATH if TRACE_LOG_ENABLED else None):
+        self._log = None
+        self.log_path = log_path
+        self.metrics = Metrics()
+        self._lock = threading.Lock()
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+
+    @property
+    def log_path(self) -> Optional[str]:
+        return self._log.path if self._log is not None else None
+
+    @log_path.setter
+    def log_path(self, path: Optional[str]) -> None:
+        # Assigning None (e.g. in benchmarks) closes the log and stops writing
+        if self._log is not None:
+            self._log.close()
+        self._log = JsonlLog(path) if path else None
+
+    def finish(self, span_: Span) -> None:
+        self._observe(span_)
+        with self._lock:
+            if span_.trace_id is not None:
+                spans = self._traces.get(span_.trace_id)
+                if spans is None:
+                    spans = self._traces[span_.trace_id] = []
+                    while len(self._traces) > RECENT_TRACES:
+                        self._traces.popitem(last=False)
+                spans.append(span_)
+            if self._log is not None:
+                self._log.write(asdict(span_))
+
+    def recent_traces(self, limit: int = 10) -> List[List[Span]]:
+        """
+        Most recent traces first, each as a list of spans sorted by start time.
+        """
+        with self._lock:
+            traces = list(self._traces.values())[-limit:]
+        return [sorted(spans, key=lambda s: s.start) for spans in reversed(traces)]
+
+    def _observe(self, span_: Span) -> None:
+        m, a = self.metrics, span_.attributes
+        if span_.kind == "request":
+            route = a.get("route", "unknown")
+            m.inc("tutor_requests_total", help="Answered questions.", route=route, mode=a.get("mode", ""))
+            m.observe("tutor_request_duration_seconds", span_.duration_s, help="End-to-end latency.", route=route)
+        elif span_.kind == "task":
+            m.observe("tutor_task_duration_seconds", span_.duration_s, help="CrewAI task latency.", agent=a.get("agent", ""))
+        elif span_.kind == "llm":
+            agent = a.get("agent", "")
+            m.inc("tutor_llm_calls_total", help="LLM calls.", agent=agent, model=a.get("model", ""), status=span_.status)
+            m.observe("tutor_llm_call_duration_seconds", span_.duration_s, help="LLM call latency.", agent=agent)
+            m.inc("tutor_llm_tokens_total", a.get("prompt_tokens", 0), help="LLM tokens.", agent=agent, type="prompt")
+            m.inc("tutor_llm_tokens_total", a.get("completion_tokens", 0), help="LLM tokens.", agent=agent, type="completion")
+            m.inc("tutor_llm_cost_usd_total", a.get("cost_usd", 0.0), help="Estimated LLM spend.", agent=agent)
+        elif span_.kind == "tool":
+            m.inc("tutor_tool_calls_total", help="Tool calls.", tool=span_.name, status=span_.status)
+            m.observe("tutor_tool_duration_seconds", span_.duration_s, help="Tool latency.", tool=span_.name)
+            if a.get("cost_usd"):
+                m.inc("tutor_tool_cost_usd_total", a["cost_usd"], help="Estimated paid-API spend.", tool=span_.name)
+        elif span_.kind == "stage":
+            m.observe("tutor_stage_duration_seconds", span_.duration_s, help="Pipeline stage latency.", stage=span_.name)
+
+
+tracer = Tracer()
+
+
+@contextmanager
+def span(name: str, kind: str = "stage", **attributes) -> Iterator[Optional[Span]]:
+    """
+    Open a span as a child of the current one (a new trace for kind="request").
+    """
+    if not TELEMETRY_ENABLED:
+        yield None
+        return
+
+    parent = _current_span.get()
+    trace_id = parent.trace_id if parent is not None else (uuid.uuid4().hex if kind == "request" else None)
+    span_ = Span(name, kind, trace_id, parent_id=parent.span_id if parent else None, attributes=attributes)
+    token = _current_span.set(span_)
+    started = time.perf_counter()
+    try:
+        yield span_
+    except Exception as e:
+        span_.status = "error"
+        span_.set(error=str(e))
+        raise
+    finally:
+        span_.duration_s = time.perf_counter() - started
+        _current_span.reset(token)
+        tracer.finish(span_)
+
+
+def _looks_like_error(result) -> bool:
+    # Tools report failures as strings rather than raising
+    return isinstance(result, str) and result.lstrip().lower().startswith(("error", "could not"))
+
+
+def traced(name: str, kind: str = "tool"):
+    """
+    Decorator recording each call as a span; error-string results mark it failed.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, kind) as span_:
+                result = fn(*args, **kwargs)
+                if span_ is not None and _looks_like_error(result):
+                    span_.status = "error"
+                return result
+        return wrapper
+    return decorator
+
+
+def count_cache(cache: str, outcome: str) -> None:
+    """
+    Count a cache lookup (hit, miss, coalesced, ...) and note it on the current span.
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    tracer.metrics.inc("tutor_cache_events_total", help="Cache lookups by outcome.", cache=cache, outcome=outcome)
+    annotate(**{f"cache.{cache}": outcome})
+
+
+# ---- CrewAI event bus hooks ----
+
+class _CrewAIHooks:
+    """
+    Turns paired CrewAI started/completed events into task and LLM spans.
+    """
+
+    MAX_PENDING = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[Tuple, dict]" = OrderedDict()
+        self._task_spans: "OrderedDict[Tuple, str]" = OrderedDict()
+
+    def _task_span_id(self, trace_id, task_id) -> Optional[str]:
+        if task_id is None:
+            return None
+        key = (trace_id, task_id)
+        with self._lock:
+            span_id = self._task_spans.get(key)
+            if span_id is None:
+                span_id = self._task_spans[key] = uuid.uuid4().hex[:16]
+                while len(self._task_spans) > self.MAX_PENDING:
+                    self._task_spans.popitem(last=False)
+            return span_id
+
+    def _pair(self, key: Tuple, half: str, data: dict) -> Optional[dict]:
+        """
+        Store one half of a started/finished pair; return both once complete.
+        Handlers run on a thread pool, so either half may arrive first.
+        """
+        with self._lock:
+            entry = self._pending.setdefault(key, {})
+            entry[half] = data
+            if "start" in entry and "end" in entry:
+                del self._pending[key]
+                return entry
+            while len(self._pending) > self.MAX_PENDING:
+                self._pending.popitem(last=False)
+            return None
+
+    def _context(self):
+        parent = _current_span.get()
+        if parent is None:
+            return None, None
+        return parent.trace_id, parent.span_id
+
+    def on_task(self, source, event) -> None:
+        trace_id, parent_id = self._context()
+        half = "start" if event.type == "task_started" else "end"
+        task_agent = getattr(getattr(event, "task", None), "agent", None)
+        entry = self._pair(("task", trace_id, event.task_id), half, {
+            "ts": event.timestamp.timestamp(),
+            "parent_id": parent_id,
+            "failed": event.type == "task_failed",
+            "task_name": event.task_name,
+            "agent": event.agent_role or getattr(task_agent, "role", None),
+        })
+        if entry is None:
+            return
+        start, end = entry["start"], entry["end"]
+        tracer.finish(Span(
+            name=(start["task_name"] or "task")[:80],
+            kind="task",
+            trace_id=trace_id,
+            span_id=self._task_span_id(trace_id, event.task_id),
+            parent_id=start["parent_id"],
+            start=start["ts"],
+            duration_s=max(end["ts"] - start["ts"], 0.0),
+            status="error" if end["failed"] else "ok",
+            attributes={"agent": start["agent"] or end["agent"] or ""},
+        ))
+
+    def on_llm(self, source, event) -> None:
+        trace_id, parent_id = self._context()
+        half = "start" if event.type == "llm_call_started" else "end"
+        usage = getattr(event, "usage", None) or {}
+        entry = self._pair(("llm", event.call_id), half, {
+            "ts": event.timestamp.timestamp(),
+            "parent_id": parent_id,
+            "failed": event.type == "llm_call_failed",
+            "agent": event.agent_role,
+            "task_id": event.task_id,
+            "model": event.model,
+            "usage": usage,
+        })
+        if entry is None:
+            return
+        start, end = entry["start"], entry["end"]
+        usage = end["usage"]
+        prompt_tokens = int(usage.get("prompt_tokens") or usage.get("input_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or usage.get("output_tokens") or 0)
+        tracer.finish(Span(
+            name="llm.call",
+            kind="llm",
+            trace_id=trace_id,
+            parent_id=self._task_span_id(trace_id, start["task_id"]) or start["parent_id"],
+            start=start["ts"],
+            duration_s=max(end["ts"] - start["ts"], 0.0),
+            status="error" if end["failed"] else "ok",
+            attributes={
+                # Calls outside any agent come from CrewAI itself, e.g. memory analysis
+                "agent": start["agent"] or "(internal)",
+                "model": start["model"] or "",
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cost_usd": llm_cost(prompt_tokens, completion_tokens),
+            },
+        ))
+
+
+_hooks = _CrewAIHooks()
+_hooks_installed = False
+_hooks_lock = threading.Lock()
+
+
+def install_crewai_hooks() -> None:
+    """
+    Register the task/LLM span handlers on CrewAI's event bus (once per process).
+    """
+    global _hooks_installed
+    if not TELEMETRY_ENABLED:
+        return
+    with _hooks_lock:
+        if _hooks_installed:
+            return
+        from crewai.events import (
+            LLMCallCompletedEvent,
+            LLMCallFailedEvent,
+            LLMCallStartedEvent,
+            TaskCompletedEvent,
+            TaskFailedEvent,
+            TaskStartedEvent,
+            crewai_event_bus,
+        )
+        for event_type in (TaskStartedEvent, TaskCompletedEvent, TaskFailedEvent):
+            crewai_event_bus.register_handler(event_type, _hooks.on_task)
+        for event_type in (LLMCallStartedEvent, LLMCallCompletedEvent, LLMCallFailedEvent):
+            crewai_event_bus.register_handler(event_type, _hooks.on_llm)
+        _hooks_installed = True
+
+
+def format_trace(spans: List[Span]) -> str:
+    """
+    Indented text rendering of one trace, for logs and the debug panel.
+    """
+    children = defaultdict(list)
+    ids = {s.span_id for s in spans}
+    roots = []
+    for s in spans:
+        if s.parent_id in ids:
+            children[s.parent_id].append(s)
+        else:
+            roots.append(s)
+
+    lines = []
+
+    def walk(s: Span, depth: int) -> None:
+        details = []
+        for key in ("route", "agent", "prompt_tokens", "completion_tokens", "cost_usd"):
+            if key in s.attributes and s.attributes[key] not in ("", None):
+                value = s.attributes[key]
+                details.append(f"{key}={value:.5f}" if key == "cost_usd" else f"{key}={value}")
+        details.extend(f"{k}={v}" for k, v in s.attributes.items() if k.startswith("cache."))
+        status = "" if s.status == "ok" else f" [{s.status}]"
+        lines.append(f"{'  ' * depth}{s.kind}:{s.name} {s.duration_s * 1000:.0f} ms{status} {' '.join(details)}".rstrip())
+        for child in sorted(children[s.span_id], key=lambda c: c.start):
+            walk(child, depth + 1)
+
+    for root in sorted(roots, key=lambda r: r.start):
+        walk(root, 0)
+    return "\n".join(lines)
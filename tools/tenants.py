@@ -0,0 +1,148 @@
+"""
+Per-tenant knowledge collections (one per class or teacher).
+
+Documents uploaded for a tenant go into their own collection next to the
+shared base corpus, so searches stay small and classes never see each
+other's reading packs. The tenant of a request is held in a context
+variable (set by answer_question), which the retrieval tools read.
+
+Tenant indexes are opened on first use and kept in an LRU cache; when the
+estimated memory of the loaded indexes exceeds TENANT_MEMORY_MB, the least
+recently used tenants are dropped and reopened from disk when needed again.
+"""
+import contextvars
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+from tools.hybrid_retriever import HybridRetriever
+from tools.telemetry import count_cache
+
+TENANT_MEMORY_MB = float(os.getenv("TENANT_MEMORY_MB", "256"))
+
+# Rough resident sizes for the memory estimate: a 384-d float32 vector plus
+# its HNSW links, and one BM25 posting (measured with tracemalloc)
+VECTOR_BYTES_PER_CHUNK = 2048
+BM25_BYTES_PER_TOKEN = 64
+
+# Lowercase letters, digits, "_" and "-", starting and ending with a letter or
+# digit, so the tenant can be used in collection names and file paths
+_TENANT_RE = re.compile(r"^[a-z0-9](?:[a-z0-9_-]{0,61}[a-z0-9])?$")
+
+_current_tenant: contextvars.ContextVar = contextvars.ContextVar("tenant", default=None)
+
+
+def normalize_tenant(tenant: Optional[str]) -> Optional[str]:
+    """
+    Canonical tenant name, or None for the shared base corpus.
+
+    Raises ValueError for names that cannot be used as a collection name.
+    """
+    if tenant is None:
+        return None
+    tenant = tenant.strip().lower().replace(" ", "-")
+    if not tenant:
+        return None
+    if not _TENANT_RE.match(tenant):
+        raise ValueError(f"Invalid tenant {tenant!r}: use letters, digits, '-' and '_' (max 63 characters).")
+    return tenant
+
+
+def current_tenant() -> Optional[str]:
+    return _current_tenant.get()
+
+
+@contextmanager
+def use_tenant(tenant: Optional[str]) -> Iterator[Optional[str]]:
+    """
+    Run the enclosed block (and the tools it calls) against tenant's documents.
+    """
+    token = _current_tenant.set(normalize_tenant(tenant))
+    try:
+        yield _current_tenant.get()
+    finally:
+        _current_tenant.reset(token)
+
+
+@dataclass
+class TenantIndex:
+    tenant: str
+    collection: object
+    retriever: HybridRetriever
+
+    def memory_bytes(self) -> int:
+        bm25 = self.retriever.bm25
+        chunks = len(bm25) if self.retriever._built else self.collection.count()
+        return chunks * VECTOR_BYTES_PER_CHUNK + bm25.total_len * BM25_BYTES_PER_TOKEN
+
+
+class TenantIndexCache:
+    """
+    LRU cache of opened tenant indexes, bounded by their estimated memory.
+
+    loader(tenant) opens the tenant's collection and returns a TenantIndex.
+    The index that was just requested is never evicted, so a single tenant
+    larger than the cap still works.
+    """
+
+    def __init__(self, loader: Callable[[str], TenantIndex], memory_limit_mb: float = TENANT_MEMORY_MB):
+        self.loader = loader
+        self.memory_limit_bytes = int(memory_limit_mb * 1024 * 1024)
+        self.evictions = 0
+        self._indexes: "OrderedDict[str, TenantIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, tenant: str) -> TenantIndex:
+        with self._lock:
+            index = self._indexes.get(tenant)
+            if index is not None:
+                self._indexes.move_to_end(tenant)
+                count_cache("tenant_index", "hit")
+                return index
+            count_cache("tenant_index", "miss")
+            index = self._indexes[tenant] = self.loader(tenant)
+            self._evict(keep=tenant)
+            return index
+
+    def _evict(self, keep: str) -> None:
+        total = sum(index.memory_bytes() for index in self._indexes.values())
+        for tenant in list(self._indexes):
+            if total <= self.memory_limit_bytes:
+                break
+            if tenant == keep:
+                continue
+            total -= self._indexes.pop(tenant).memory_bytes()
+            self.evictions += 1
+            count_cache("tenant_index", "evicted")
+
+    def trim(self) -> None:
+        """
+        Re-check the cap, e.g. after a tenant's BM25 index was built or grew.
+        """
+        with self._lock:
+            if self._indexes:
+                self._evict(keep=next(reversed(self._indexes)))
+
+    def peek(self, tenant: str) -> Optional[TenantIndex]:
+        """
+        The loaded index of tenant, without loading it or touching the LRU order.
+        """
+        with self._lock:
+            return self._indexes.get(tenant)
+
+    def discard(self, tenant: str) -> None:
+        with self._lock:
+            self._indexes.pop(tenant, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": list(self._indexes),
+                "memory_mb": round(sum(i.memory_bytes() for i in self._indexes.values()) / (1024 * 1024), 1),
+                "memory_limit_mb": round(self.memory_limit_bytes / (1024 * 1024), 1),
+                "evictions": self.evictions,
+            }
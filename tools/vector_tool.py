@@ -1,76 +1,700 @@
+import hashlib
+import io
 import os
-import chromadb
-from chromadb.utils import embedding_functions
+import re
+import shutil
+import threading
+import time
 from crewai.tools import tool
-from docling.document_converter import DocumentConverter
-import tempfile
+import uuid
+
+from tools.answer_cache import get_answer_cache
+from tools.chunker import Chunk, chunk_docling_document, chunk_lines
+from tools.docling_cache import convert_document
+from tools.document_registry import REGISTRY_PATH, get_document_registry
+from tools.hybrid_retriever import HybridRetriever, SqliteBM25Index, build_reranker
+from tools.semantic_cache import get_semantic_cache
+from tools.telemetry import traced
+from tools.tenants import TenantIndex, TenantIndexCache, current_tenant, normalize_tenant
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 DB_PATH = os.path.join(BASE_DIR, "data", "vector_db")
+KB_VERSION_PATH = os.path.join(DB_PATH, "kb_version.txt")
+QUANTIZED_DB_PATH = os.path.join(DB_PATH, "quantized")
+COLLECTION_NAME = "ww2_knowledge"
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "3"))
+
+# "chroma" (default) or "quantized": int8/PQ codes in memory-mapped files with
+# full-precision re-scoring, for corpora too large for Chroma's in-RAM index
+# (see tools/quantized_index.py). The BM25 index then lives on disk as well.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# HNSW tuning for the Chroma backend; unset values keep Chroma's defaults
+# (M=16, ef_construction=100, ef_search=100). M and ef_construction only take
+# effect when the collection is created, ef_search is applied on every start.
+HNSW_M = os.getenv("HNSW_M")
+HNSW_EF_CONSTRUCTION = os.getenv("HNSW_EF_CONSTRUCTION")
+HNSW_EF_SEARCH = os.getenv("HNSW_EF_SEARCH")
+
+# Embedding model for a new knowledge base. An existing one keeps the model it
+# was built with (recorded in the document registry) until it is re-embedded
+# with start_reembedding.
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+# How often the registry is re-read, so a switch made by another process is picked up
+ACTIVE_MODEL_CHECK_SECONDS = 5.0
+# How long the old collection is kept after a switch, for requests still using it
+REEMBED_GRACE_SECONDS = float(os.getenv("REEMBED_GRACE_SECONDS", "30"))
+
+# Cap on the HNSW segments Chroma keeps loaded (LRU over the base corpus and all
+# tenant collections); unset keeps every opened collection in memory
+CHROMA_MEMORY_LIMIT_MB = os.getenv("CHROMA_MEMORY_LIMIT_MB")
+
+# ChromaDB, the ONNX embedder and the retriever are process-wide singletons,
+# created on first use so importing this module (e.g. on app start) stays cheap
+_resources = {}
+_resources_lock = threading.RLock()
+# Held while chunks are written or deleted, and while a re-embedding switches collections
+_write_lock = threading.RLock()
+_active_model = {"model": None, "checked_at": 0.0}
+
+
+def _get_resource(name, factory):
+    with _resources_lock:
+        if name not in _resources:
+            _resources[name] = factory()
+        return _resources[name]
+
+
+def get_client():
+    def create():
+        import chromadb
+        if not CHROMA_MEMORY_LIMIT_MB:
+            return chromadb.PersistentClient(path=DB_PATH)
+        from chromadb.config import Settings
+        return chromadb.PersistentClient(path=DB_PATH, settings=Settings(
+            chroma_segment_cache_policy="LRU",
+            chroma_memory_limit_bytes=int(float(CHROMA_MEMORY_LIMIT_MB) * 1024 * 1024),
+        ))
+    return _get_resource("client", create)
+
+
+def get_active_embedding_model():
+    """
+    Embedding model of the live collection, as recorded in the document registry.
+    """
+    now = time.monotonic()
+    if _active_model["model"] is None or now - _active_model["checked_at"] > ACTIVE_MODEL_CHECK_SECONDS:
+        model = EMBEDDING_MODEL
+        # Do not create the registry just to read it
+        if os.path.exists(REGISTRY_PATH):
+            model = get_document_registry().get_setting("embedding_model", EMBEDDING_MODEL)
+        _active_model.update(model=model, checked_at=now)
+    return _active_model["model"]
+
+
+def _sync_active_model():
+    """
+    Drop the cached embedder, collection and retriever when the active model changed.
+    """
+    model = get_active_embedding_model()
+    with _resources_lock:
+        if _resources.setdefault("model", model) != model:
+            for name in ("ef", "collection", "retriever", "tenants"):
+                _resources.pop(name, None)
+            _resources["model"] = model
+    return model
+
+
+def collection_name(model, tenant=None):
+    """
+    Collection holding the vectors of model (for tenant, or the base corpus);
+    the base corpus of the default model keeps the original name.
+    """
+    name = COLLECTION_NAME
+    if model != DEFAULT_EMBEDDING_MODEL:
+        name = f"{name}__{re.sub(r'[^A-Za-z0-9]+', '-', model).strip('-')}"
+    return f"{name}.{tenant}" if tenant else name
+
+
+def build_embedding_function(model):
+    from chromadb.utils import embedding_functions
+    if model == DEFAULT_EMBEDDING_MODEL:
+        return embedding_functions.DefaultEmbeddingFunction()
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model)
+
+
+def get_embedding_function():
+    model = _sync_active_model()
+    return _get_resource("ef", lambda: build_embedding_function(model))
+
+
+def hnsw_configuration():
+    """
+    Chroma HNSW settings from HNSW_M, HNSW_EF_CONSTRUCTION and HNSW_EF_SEARCH.
+    """
+    settings = {
+        "max_neighbors": HNSW_M,
+        "ef_construction": HNSW_EF_CONSTRUCTION,
+        "ef_search": HNSW_EF_SEARCH,
+    }
+    return {name: int(value) for name, value in settings.items() if value}
+
+
+def open_collection(name, embedding_function):
+    """
+    Open (or create) a collection on the configured VECTOR_BACKEND.
+    """
+    if VECTOR_BACKEND == "quantized":
+        from tools.quantized_index import QuantizedCollection
+        return QuantizedCollection(name, QUANTIZED_DB_PATH, embedding_function=embedding_function)
+
+    hnsw = hnsw_configuration()
+    collection = get_client().get_or_create_collection(
+        name=name,
+        embedding_function=embedding_function,
+        configuration={"hnsw": hnsw} if hnsw else None,
+    )
+    # An existing collection keeps its build settings, but ef_search can change
+    current = (collection.configuration or {}).get("hnsw") or {}
+    if "ef_search" in hnsw and current.get("ef_search") != hnsw["ef_search"]:
+        collection.modify(configuration={"hnsw": {"ef_search": hnsw["ef_search"]}})
+    return collection
+
+
+def drop_collection(name):
+    if VECTOR_BACKEND == "quantized":
+        shutil.rmtree(os.path.join(QUANTIZED_DB_PATH, name), ignore_errors=True)
+    else:
+        get_client().delete_collection(name)
+
+
+def get_reranker():
+    return _get_resource("reranker", build_reranker)
+
+
+def _build_retriever(collection, tenant=None):
+    def version():
+        # Changes when this or another process writes (every write bumps the stamp)
+        return f"{collection.count()}:{_version_stamp(tenant)}"
+
+    bm25 = None
+    if VECTOR_BACKEND == "quantized":
+        # Keep the lexical index on disk too, next to the collection's vectors
+        bm25 = SqliteBM25Index(os.path.join(QUANTIZED_DB_PATH, collection.name, "bm25.sqlite"))
+    return HybridRetriever(collection, reranker=get_reranker(), version_fn=version, bm25=bm25)
+
+
+def _open_tenant_index(tenant):
+    collection = open_collection(collection_name(get_active_embedding_model(), tenant), get_embedding_function())
+    return TenantIndex(tenant, collection, _build_retriever(collection, tenant))
+
+
+def get_tenant_indexes():
+    """
+    Memory-capped LRU cache of the opened tenant collections and retrievers.
+    """
+    _sync_active_model()
+    return _get_resource("tenants", lambda: TenantIndexCache(_open_tenant_index))
+
+
+def has_tenant(tenant):
+    """
+    Whether tenant has uploaded any documents (without creating its collection).
+    """
+    return bool(tenant) and os.path.exists(REGISTRY_PATH) and get_document_registry().has_tenant(tenant)
+
+
+def get_collection(tenant=None):
+    if tenant:
+        return get_tenant_indexes().get(tenant).collection
+    model = _sync_active_model()
+    return _get_resource("collection", lambda: open_collection(collection_name(model), get_embedding_function()))
+
+
+def get_retriever(tenant=None):
+    if tenant:
+        return get_tenant_indexes().get(tenant).retriever
+    _sync_active_model()
+    # BM25 + dense hybrid search; the BM25 index is built lazily on first query
+    return _get_resource("retriever", lambda: _build_retriever(get_collection()))
+
+
+_LAZY_ATTRIBUTES = {
+    "client": get_client,
+    "ef": get_embedding_function,
+    "collection": get_collection,
+    "retriever": get_retriever,
+}
+
+
+def __getattr__(name):
+    # Keep `from tools.vector_tool import collection` (and friends) working
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _loaded_retriever(tenant=None):
+    """
+    The retriever for tenant (or the base corpus) if this process opened it, else None.
+    """
+    with _resources_lock:
+        if not tenant:
+            return _resources.get("retriever")
+        indexes = _resources.get("tenants")
+    index = indexes.peek(tenant) if indexes is not None else None
+    return index.retriever if index is not None else None
+
+
+def _version_path(tenant):
+    if not tenant:
+        return KB_VERSION_PATH
+    return os.path.join(DB_PATH, f"kb_version.{tenant}.txt")
+
+
+def _version_stamp(tenant):
+    stamp = "initial"
+    if os.path.exists(_version_path(tenant)):
+        with open(_version_path(tenant), "r", encoding="utf-8") as f:
+            stamp = f.read().strip() or stamp
+    return stamp
+
+
+def _collection_version(tenant):
+    collection = get_collection(tenant)
+    return f"{collection.name}:{collection.count()}:{_version_stamp(tenant)}"
+
+
+def get_knowledge_base_version(tenant=None):
+    """
+    Fingerprint of the 'ww2_knowledge' collection.
+
+    Combines the chunk count with a stamp that is rewritten on every successful
+    upload, so cached answers can be tied to the exact state of the knowledge base.
+    For a tenant (by default the one of the current request) the tenant's own
+    collection is prepended, so classes never share cached answers.
+    """
+    tenant = normalize_tenant(tenant) or current_tenant()
+    version = _collection_version(None)
+    if has_tenant(tenant):
+        version = f"{tenant}|{_collection_version(tenant)}|{version}"
+    return version
+
+
+def bump_knowledge_base_version(tenant=None):
+    """
+    Record that the knowledge base changed and drop answers built on the old version.
+
+    A change to the base corpus invalidates every tenant's answers; a change to
+    one tenant's documents only that tenant's.
+    """
+    tenant = normalize_tenant(tenant)
+    with open(_version_path(tenant), "w", encoding="utf-8") as f:
+        f.write(uuid.uuid4().hex)
+    # This process's retriever already has the change; others rebuild on their next query
+    retriever = _loaded_retriever(tenant)
+    if retriever is not None:
+        retriever.mark_current()
+    kb_version = get_knowledge_base_version(tenant)
+    scope = f"{tenant}|" if tenant else ""
+    get_answer_cache().invalidate(kb_version, scope=scope)
+    get_semantic_cache().invalidate(kb_version, scope=scope)
+
+
+def _text_file_chunks(file_obj):
+    """
+    Decode a UTF-8 text upload and stream its chunks.
+
+    The whole file is decoded up front, so an encoding error is raised before
+    any chunk is written.
+    """
+    text = file_obj.getvalue().decode("utf-8")
+    return chunk_lines(io.StringIO(text))
+
+
+def _docling_chunks(file_obj, filename):
+    """
+    Convert a PDF/DOCX with Docling (or load the cached conversion) and stream
+    structure-aware chunks.
+
+    Conversion runs here, before the caller takes the write lock, so a slow
+    upload does not block other uploads and deletes.
+    """
+    document = convert_document(file_obj.getvalue(), filename)
+    return chunk_docling_document(document)
+
+
+def chunk_id(filename, text):
+    """
+    Content-addressed chunk ID: the same text from the same file always maps to
+    the same ID, so re-uploading a document is idempotent.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+    return f"{filename}_{digest}"
+
 
-# Setup ChromaDB
-client = chromadb.PersistentClient(path=DB_PATH)
-ef = embedding_functions.DefaultEmbeddingFunction()
-collection = client.get_or_create_collection(name="ww2_knowledge", embedding_function=ef)
+def _batched(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-def add_document_to_knowledge_base(file_obj, filename):
+
+def ingest_chunks(chunks, filename, batch_size=INGEST_BATCH_SIZE, progress_callback=None,
+                  skip_ids=frozenset(), seen_ids=None, tenant=None):
+    """
+    Embed and upsert chunks batch by batch as they are produced, into tenant's
+    collection (or the base corpus).
+
+    chunks may be Chunk objects (with section/page metadata) or plain strings.
+    Only one batch of embeddings is held in memory at a time. Duplicate chunks
+    (same content hash) are skipped, as are chunks in skip_ids (already stored).
+    The IDs of all chunks seen, including skipped ones, are added to seen_ids
+    if given. progress_callback, if given, is called after every batch with
+    (batches_done, chunks_done).
+
+    Returns the number of chunks written.
+    """
+    seen_ids = set() if seen_ids is None else seen_ids
+    batches_done = 0
+    chunks_done = 0
+
+    with _write_lock:
+        ef = get_embedding_function()
+        collection = get_collection(tenant)
+        retriever = get_retriever(tenant)
+
+        for batch in _batched(chunks, batch_size):
+            ids, documents, metadatas = [], [], []
+            for chunk in batch:
+                if isinstance(chunk, str):
+                    chunk = Chunk(chunk)
+                cid = chunk_id(filename, chunk.text)
+                if cid in seen_ids:
+                    continue
+                seen_ids.add(cid)
+                if cid in skip_ids:
+                    continue
+                ids.append(cid)
+                documents.append(chunk.text)
+                metadatas.append(chunk.metadata(filename))
+
+            if not documents:
+                continue
+
+            embeddings = ef(documents)
+            collection.upsert(
+                ids=ids,
+                documents=documents,
+                embeddings=embeddings,
+                metadatas=metadatas,
+            )
+            retriever.index_chunks(ids, documents, metadatas)
+
+            batches_done += 1
+            chunks_done += len(documents)
+            if progress_callback is not None:
+                progress_callback(batches_done, chunks_done)
+
+    return chunks_done
+
+
+def _stored_chunk_ids(source, tenant=None):
+    """
+    Chunk IDs of source: from the registry, or from the collection for
+    documents ingested before the registry existed.
+    """
+    ids = get_document_registry().chunk_ids(source, tenant)
+    if ids or tenant:
+        return ids
+    return set(get_collection().get(where={"source": source}, include=[])["ids"])
+
+
+def _delete_chunks(ids, tenant=None):
+    ids = list(ids)
+    if ids:
+        get_collection(tenant).delete(ids=ids)
+        get_retriever(tenant).remove_chunks(ids)
+
+
+def sync_document(chunks, source, sha256, batch_size=INGEST_BATCH_SIZE, progress_callback=None, tenant=None):
+    """
+    Bring the stored chunks of source (in tenant's collection, or the base
+    corpus) in line with chunks.
+
+    Only chunks whose content changed are embedded; chunks that are no longer
+    produced are deleted, and the registry records the new state. If producing
+    or writing the chunks fails, the chunks already written are removed again.
+
+    Returns (added, unchanged, removed) chunk counts.
+    """
+    tenant = normalize_tenant(tenant)
+    registry = get_document_registry()
+    with _write_lock:
+        model = get_active_embedding_model()
+        previous = _stored_chunk_ids(source, tenant)
+        current = set()
+        try:
+            added = ingest_chunks(
+                chunks, source, batch_size=batch_size, progress_callback=progress_callback,
+                skip_ids=previous, seen_ids=current, tenant=tenant,
+            )
+        except Exception:
+            # Not recorded in the registry, so they would never be cleaned up
+            _delete_chunks(current - previous, tenant)
+            raise
+        removed = previous - current
+        _delete_chunks(removed, tenant)
+
+        if current:
+            registry.record(source, sha256, model, current, tenant)
+        else:
+            registry.remove(source, tenant)
+        if registry.get_setting("embedding_model") is None:
+            registry.set_setting("embedding_model", model)
+    return added, len(current) - added, len(removed)
+
+
+def delete_document(source, tenant=None):
+    """
+    Remove every chunk of source from tenant's collection (or the base corpus).
+    """
+    try:
+        tenant = normalize_tenant(tenant)
+        with _write_lock:
+            ids = _stored_chunk_ids(source, tenant)
+            if not ids:
+                return False, f"{source} is not in the knowledge base."
+            _delete_chunks(ids, tenant)
+            get_document_registry().remove(source, tenant)
+            if tenant and not has_tenant(tenant):
+                # The tenant's last document: free its collection
+                get_tenant_indexes().discard(tenant)
+                drop_collection(collection_name(get_active_embedding_model(), tenant))
+        bump_knowledge_base_version(tenant)
+        return True, f"Removed {len(ids)} chunks of {source}."
+    except Exception as e:
+        return False, f"Error removing document: {str(e)}"
+
+
+def list_documents(tenant=None):
+    """
+    DocumentRecord for every registered document of tenant (or the base corpus),
+    sorted by source.
+    """
+    return get_document_registry().documents(normalize_tenant(tenant))
+
+
+def add_document_to_knowledge_base(file_obj, filename, batch_size=INGEST_BATCH_SIZE, progress_callback=None,
+                                   tenant=None):
     """
     Process an uploaded file (PDF, DOCX, TXT) and add it to the vector database.
+
+    With tenant set the document goes into that class's own collection instead
+    of the shared base corpus. Uploading a file under a name that is already in
+    the knowledge base replaces it: only changed chunks are embedded and stale
+    ones are removed. Chunks are embedded and upserted in batches of
+    batch_size; see ingest_chunks for the progress_callback signature.
     """
     try:
-        chunks = []
+        tenant = normalize_tenant(tenant)
+        sha256 = hashlib.sha256(file_obj.getvalue()).hexdigest()
+        record = get_document_registry().get(filename, tenant)
+        if record and record.sha256 == sha256 and record.embedding_model == get_active_embedding_model():
+            return True, f"{filename} is already in the knowledge base ({record.chunk_count} chunks)."
+
         suffix = os.path.splitext(filename)[1].lower()
 
-        # Simple text files (.txt) - read directly
+        # Simple text files (.txt) - decode and chunk directly
         if suffix == '.txt':
             try:
-                text = file_obj.getvalue().decode("utf-8")
-                chunks = [p.strip() for p in text.split("\n\n") if p.strip()]
-            except Exception as e:
+                chunks = _text_file_chunks(file_obj)
+            except UnicodeDecodeError as e:
                 return False, f"Could not read text file (encoding error?): {str(e)}"
-
         # Complex files (PDF/DOCX) - process with Docling
         else:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-                tmp_file.write(file_obj.getvalue())
-                tmp_path = tmp_file.name
+            chunks = _docling_chunks(file_obj, filename)
 
-            try:
-                converter = DocumentConverter()
-                result = converter.convert(tmp_path)
-                markdown_text = result.document.export_to_markdown()
-                chunks = [p.strip() for p in markdown_text.split("\n\n") if p.strip()]
-            finally:
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
-
-        if not chunks:
-            return False, "No readable text found in document."
+        added, unchanged, removed = sync_document(
+            chunks, filename, sha256, batch_size=batch_size, progress_callback=progress_callback, tenant=tenant
+        )
 
-        # Add to ChromaDB
-        current_count = collection.count()
-        ids = [f"{filename}_{current_count + i}" for i in range(len(chunks))]
-        metadatas = [{"source": filename} for _ in chunks]
+        if not added and not unchanged:
+            if removed:
+                bump_knowledge_base_version(tenant)
+            return False, "No readable text found in document."
 
-        collection.add(documents=chunks, ids=ids, metadatas=metadatas)
+        if added or removed:
+            bump_knowledge_base_version(tenant)
 
-        return True, f"Successfully added {len(chunks)} chunks from {filename}."
+        if record is None:
+            return True, f"Successfully added {added} chunks from {filename}."
+        return True, f"Updated {filename}: {added} new, {unchanged} unchanged and {removed} removed chunks."
 
     except Exception as e:
         return False, f"Error processing document: {str(e)}"
 
+
+class ReembedJob(threading.Thread):
+    """
+    Copy the knowledge base (the base corpus and every tenant's collection)
+    into collections embedded with another model.
+
+    The old collections keep serving queries while the copy runs. Writes made
+    in the meantime are caught up under the write lock, then the registry is
+    pointed at the new model (every process picks it up within
+    ACTIVE_MODEL_CHECK_SECONDS) and the old collections are dropped after
+    REEMBED_GRACE_SECONDS.
+    """
+
+    def __init__(self, model, batch_size=INGEST_BATCH_SIZE):
+        super().__init__(name=f"reembed-{model}", daemon=True)
+        self.model = model
+        self.batch_size = batch_size
+        self.state = "pending"
+        self.copied = 0
+        self.total = 0
+        self.error = None
+
+    def _copy(self, source, target, ef, ids=None):
+        """
+        Embed chunks of source (all of them, or only ids) into target.
+        """
+        offset = 0
+        while True:
+            if ids is None:
+                page = source.get(limit=self.batch_size, offset=offset, include=["documents", "metadatas"])
+                offset += self.batch_size
+            else:
+                batch = ids[offset:offset + self.batch_size]
+                offset += self.batch_size
+                if not batch:
+                    break
+                page = source.get(ids=batch, include=["documents", "metadatas"])
+            if not page["ids"]:
+                break
+            target.upsert(
+                ids=page["ids"],
+                documents=page["documents"],
+                embeddings=ef(page["documents"]),
+                metadatas=page["metadatas"],
+            )
+            self.copied += len(page["ids"])
+
+    def _pair(self, tenant, ef):
+        return tenant, get_collection(tenant), open_collection(collection_name(self.model, tenant), ef)
+
+    def run(self):
+        try:
+            old_model = get_active_embedding_model()
+            ef = build_embedding_function(self.model)
+            registry = get_document_registry()
+            pairs = [self._pair(tenant, ef) for tenant in [None] + registry.tenants()]
+
+            self.state = "copying"
+            self.total = sum(source.count() for _, source, _ in pairs)
+            for _, source, target in pairs:
+                self._copy(source, target, ef)
+
+            self.state = "switching"
+            with _write_lock:
+                # Tenants that uploaded their first document during the copy
+                known = {tenant for tenant, _, _ in pairs}
+                pairs += [self._pair(tenant, ef) for tenant in registry.tenants() if tenant not in known]
+                # Catch up with uploads and deletes made during the copy
+                for _, source, target in pairs:
+                    source_ids = set(source.get(include=[])["ids"])
+                    target_ids = set(target.get(include=[])["ids"])
+                    if target_ids - source_ids:
+                        target.delete(ids=list(target_ids - source_ids))
+                    # IDs are content hashes, so an updated chunk shows up as a new ID
+                    missing = sorted(source_ids - target_ids)
+                    self.total += len(missing)
+                    self._copy(source, target, ef, missing)
+
+                registry.set_embedding_model(self.model)
+                registry.set_setting("embedding_model", self.model)
+                _active_model.update(model=self.model, checked_at=time.monotonic())
+            bump_knowledge_base_version()
+
+            self.state = "cleanup"
+            time.sleep(REEMBED_GRACE_SECONDS)
+            for tenant, _, _ in pairs:
+                drop_collection(collection_name(old_model, tenant))
+            self.state = "done"
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+
+    def status(self):
+        return {
+            "model": self.model,
+            "state": self.state,
+            "copied": self.copied,
+            "total": self.total,
+            "error": self.error,
+        }
+
+
+_reembed_job = None
+
+
+def start_reembedding(model, batch_size=INGEST_BATCH_SIZE):
+    """
+    Start re-embedding the knowledge base with model in the background.
+    """
+    global _reembed_job
+    with _resources_lock:
+        if _reembed_job is not None and _reembed_job.is_alive():
+            raise RuntimeError(f"Re-embedding with {_reembed_job.model} is already running.")
+        if model == get_active_embedding_model():
+            raise RuntimeError(f"The knowledge base is already embedded with {model}.")
+        _reembed_job = ReembedJob(model, batch_size=batch_size)
+        _reembed_job.start()
+        return _reembed_job
+
+
+def get_reembed_status():
+    """
+    Status of the last re-embedding job in this process, or None.
+    """
+    return _reembed_job.status() if _reembed_job is not None else None
+
+
+@traced("vector.search")
+def retrieve(query, k=RETRIEVAL_K, where=None, tenant=None):
+    """
+    Hybrid (BM25 + vector) search returning RetrievedChunk objects.
+
+    where: optional Chroma metadata filter, e.g. {"source": "notes.txt"}.
+    tenant: also search this tenant's documents and merge them with the base
+        corpus by fused score; defaults to the tenant of the current request.
+    """
+    tenant = normalize_tenant(tenant) or current_tenant()
+    results = get_retriever().search(query, k=k, where=where)
+    if not has_tenant(tenant):
+        return results
+    # Tenant chunks go first, so they win ties with the base corpus
+    results = get_retriever(tenant).search(query, k=k, where=where) + results
+    get_tenant_indexes().trim()  # The tenant's BM25 index may just have been built
+    return sorted(results, key=lambda chunk: chunk.score, reverse=True)[:k]
+
+
 @tool("search_history_vector")
 def search_history_vector(query: str) -> str:
     """
     Search the WW2 history notes and uploaded documents using a Vector Database.
     Useful for finding specific facts, events, or explanations in the knowledge base.
     """
-    results = collection.query(
-        query_texts=[query],
-        n_results=3
-    )
+    results = retrieve(query)
 
-    if not results["documents"] or not results["documents"][0]:
+    if not results:
         return "No relevant information found in the notes."
 
-    return "\n\n".join(results["documents"][0])
\ No newline at end of file
+    return "\n\n".join(chunk.text for chunk in results)
@@ -1,35 +1,301 @@
+"""
+Image analysis with GPT-4.1-mini.
+
+Uploads are downscaled and re-encoded with Pillow before they are sent (the
+model does not use more than ~1024 px per side for a description like this),
+with the MIME type matching the encoded bytes. Results are cached by a
+perceptual hash, so the same photo uploaded again, even resized or
+re-compressed, is answered from the cache. All requests share one pooled
+OpenAI client, and the backend can be swapped for a local stub.
+"""
 import base64
-from openai import OpenAI
+import hashlib
+import io
 import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
 
-def analyze_image(uploaded_file):
-    """
-    Send an image to GPT-4.1-mini for analysis.
+from tools.telemetry import count_cache, traced
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+VISION_CACHE_PATH = os.path.join(BASE_DIR, "data", "cache", "vision.sqlite")
+
+VISION_MODEL = os.getenv("VISION_MODEL", "gpt-4.1-mini")
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "1024"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+# dHash neighbours further apart than a couple of bits are often a different
+# vehicle in the same pose, so the similarity match is capped at 2 bits.
+# VISION_HASH_DISTANCE can only lower it (or turn it off with -1), not raise it.
+MAX_HASH_DISTANCE = 2
+VISION_HASH_DISTANCE = min(int(os.getenv("VISION_HASH_DISTANCE", "2")), MAX_HASH_DISTANCE)
+VISION_MAX_CONNECTIONS = int(os.getenv("VISION_MAX_CONNECTIONS", "8"))
+VISION_BATCH_WORKERS = int(os.getenv("VISION_BATCH_WORKERS", "4"))
+
+VISION_PROMPT = (
+    "What is shown in this image? If it is a historical vehicle or object from WW2, "
+    "identify it specifically (e.g., 'Panzer II'). Provide a brief description."
+)
+
+# (image bytes, MIME type, prompt) -> description
+VisionBackend = Callable[[bytes, str, str], str]
+
+_MAGIC_MIME = [
+    (b"\x89PNG", "image/png"),
+    (b"\xff\xd8", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"RIFF", "image/webp"),
+]
+
+
+def sniff_mime(data: bytes) -> str:
+    for magic, mime in _MAGIC_MIME:
+        if data.startswith(magic):
+            return mime
+    return "image/jpeg"
+
+
+def preprocess_image(data: bytes, max_side: int = VISION_MAX_SIDE) -> Tuple[bytes, str, Optional[int]]:
     """
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    Return (bytes to upload, MIME type, perceptual hash).
 
-    bytes_data = uploaded_file.getvalue()
-    base64_image = base64.b64encode(bytes_data).decode("utf-8")
+    Images larger than max_side are downscaled; photos are re-encoded as JPEG,
+    images with transparency as PNG. Small JPEG/PNG files are sent unchanged.
+    If Pillow cannot read the data it is sent as-is without a hash.
+    """
+    from PIL import Image, ImageOps
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "What is shown in this image? If it is a historical vehicle or object from WW2, identify it specifically (e.g., 'Panzer II'). Provide a brief description."},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            },
-                        },
-                    ],
-                }
-            ],
-            max_tokens=300,
+        image = Image.open(io.BytesIO(data))
+        # exif_transpose returns a copy without .format, so read it first
+        fmt = image.format
+        image = ImageOps.exif_transpose(image)
+    except Exception:
+        return data, sniff_mime(data), None
+
+    phash = perceptual_hash(image)
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    if max(image.size) <= max_side and fmt in ("JPEG", "PNG"):
+        return data, Image.MIME[fmt], phash
+
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    out = io.BytesIO()
+    if has_alpha:
+        image.save(out, format="PNG", optimize=True)
+        return out.getvalue(), "image/png", phash
+    image.convert("RGB").save(out, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+    return out.getvalue(), "image/jpeg", phash
+
+
+def perceptual_hash(image) -> int:
+    """
+    64-bit difference hash (dHash): robust to resizing and re-compression.
+    """
+    small = image.convert("L").resize((9, 8))
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class VisionCache:
+    """
+    SQLite cache of descriptions per image and prompt.
+
+    Exact re-uploads are found by the SHA-256 of their bytes without decoding
+    them; other images match the closest stored perceptual hash within
+    max_distance bits (at most MAX_HASH_DISTANCE; a negative value disables
+    similarity matches). Hashes are kept in memory for the lookups.
+    """
+
+    def __init__(self, path: str = VISION_CACHE_PATH, max_distance: int = VISION_HASH_DISTANCE):
+        self.max_distance = min(max_distance, MAX_HASH_DISTANCE)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions ("
+            "digest TEXT NOT NULL, prompt TEXT NOT NULL, phash TEXT, description TEXT NOT NULL, "
+            "created_at REAL NOT NULL, PRIMARY KEY (digest, prompt))"
         )
-        return response.choices[0].message.content
+        self._conn.commit()
+        self._exact = {}
+        self._similar = []
+        for digest, prompt, phash, description in self._conn.execute(
+            "SELECT digest, prompt, phash, description FROM descriptions"
+        ):
+            # SQLite integers are signed, so hashes are stored as hex text
+            self._remember(digest, prompt, int(phash, 16) if phash else None, description)
+
+    def _remember(self, digest: str, prompt: str, phash: Optional[int], description: str) -> None:
+        self._exact[(digest, prompt)] = description
+        if phash is not None:
+            self._similar.append((phash, prompt, description))
+
+    def get_exact(self, digest: str, prompt: str) -> Optional[str]:
+        with self._lock:
+            return self._exact.get((digest, prompt))
+
+    def get_similar(self, phash: int, prompt: str) -> Optional[str]:
+        if self.max_distance < 0:
+            return None
+        with self._lock:
+            best, best_distance = None, self.max_distance + 1
+            for stored_hash, stored_prompt, description in self._similar:
+                if stored_prompt != prompt:
+                    continue
+                distance = hamming_distance(phash, stored_hash)
+                if distance < best_distance:
+                    best, best_distance = description, distance
+            return best
+
+    def set(self, digest: str, prompt: str, phash: Optional[int], description: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO descriptions (digest, prompt, phash, description, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (digest, prompt, f"{phash:016x}" if phash is not None else None, description, time.time()),
+            )
+            self._conn.commit()
+            self._remember(digest, prompt, phash, description)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    """
+    Process-wide OpenAI client with a bounded connection pool, created (and
+    the SDK imported) on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            import httpx
+            from openai import OpenAI
+            _client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=httpx.Client(
+                    limits=httpx.Limits(max_connections=VISION_MAX_CONNECTIONS),
+                    timeout=60.0,
+                ),
+            )
+        return _client
+
+
+def openai_backend(data: bytes, mime: str, prompt: str) -> str:
+    """
+    Default backend: GPT-4.1-mini through the shared client.
+    """
+    base64_image = base64.b64encode(data).decode("utf-8")
+    response = get_openai_client().chat.completions.create(
+        model=VISION_MODEL,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime};base64,{base64_image}"
+                        },
+                    },
+                ],
+            }
+        ],
+        max_tokens=300,
+    )
+    return response.choices[0].message.content
+
+
+class VisionAnalyzer:
+    """
+    Preprocess, look up in the perceptual-hash cache, otherwise call the backend.
+    """
+
+    def __init__(self, backend: VisionBackend = openai_backend, cache: Optional[VisionCache] = None):
+        self.backend = backend
+        self.cache = cache if cache is not None else VisionCache()
+
+    def analyze(self, data: bytes, prompt: str = VISION_PROMPT) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        cached = self.cache.get_exact(digest, prompt)
+        if cached is not None:
+            count_cache("vision", "hit")
+            return cached
+
+        payload, mime, phash = preprocess_image(data)
+        if phash is not None:
+            cached = self.cache.get_similar(phash, prompt)
+            if cached is not None:
+                count_cache("vision", "hit_similar")
+                self.cache.set(digest, prompt, phash, cached)
+                return cached
+        count_cache("vision", "miss")
+
+        description = self.backend(payload, mime, prompt)
+        if description:
+            self.cache.set(digest, prompt, phash, description)
+        return description
+
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_vision_analyzer() -> VisionAnalyzer:
+    global _analyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            _analyzer = VisionAnalyzer()
+        return _analyzer
+
+
+def set_vision_backend(backend: VisionBackend) -> None:
+    """
+    Swap the model behind analyze_image, e.g. for a local stub in benchmarks.
+    """
+    get_vision_analyzer().backend = backend
+
+
+def _read_bytes(image) -> bytes:
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    if hasattr(image, "getvalue"):
+        return image.getvalue()
+    return image.read()
+
+
+@traced("vision.analyze")
+def analyze_image(uploaded_file):
+    """
+    Send an image to GPT-4.1-mini for analysis.
+
+    Accepts an uploaded file (anything with getvalue()/read()) or raw bytes.
+    """
+    try:
+        return get_vision_analyzer().analyze(_read_bytes(uploaded_file))
     except Exception as e:
-        return f"Could not analyze image: {str(e)}"
\ No newline at end of file
+        return f"Could not analyze image: {str(e)}"
+
+
+def analyze_images(images, max_workers: int = VISION_BATCH_WORKERS) -> List[str]:
+    """
+    Analyze several images concurrently; results are in input order.
+    """
+    if not images:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(analyze_image, images))
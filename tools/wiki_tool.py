@@ -1,11 +1,334 @@
 """
 Simplified Wikipedia search tool (no external API key required).
 Use this as a fallback when Serper API is not available.
+
+Pages are kept in a local SQLite store with a TTL, keyed by their resolved
+title (redirects and aliases point to the same entry); once an entry expires
+the page's latest revision ID is checked before refetching, so unchanged pages
+are never downloaded twice. When Wikipedia cannot be reached, stored pages are
+served even if they expired. Instead of the first 1500 characters, the section that
+best matches the query is returned.
+
+Offline mode (WIKIPEDIA_OFFLINE=1) serves everything from a pre-indexed
+extract (JSONL with title/url/content per line), e.g. the WW2 category built
+with `python -m tools.wiki_tool --category "World War II"`.
 """
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
 from crewai.tools import BaseTool
-from typing import Type
+from typing import Callable, List, Optional, Tuple, Type
 from pydantic import BaseModel, Field
 
+from tools.hybrid_retriever import BM25Index, tokenize
+from tools.telemetry import count_cache, traced
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+PAGE_STORE_PATH = os.path.join(BASE_DIR, "data", "cache", "wikipedia.sqlite")
+OFFLINE_EXTRACT_PATH = os.getenv(
+    "WIKIPEDIA_EXTRACT_PATH", os.path.join(BASE_DIR, "data", "wikipedia", "ww2_extract.jsonl")
+)
+WIKIPEDIA_OFFLINE = os.getenv("WIKIPEDIA_OFFLINE", "0") == "1"
+WIKIPEDIA_TTL = int(os.getenv("WIKIPEDIA_TTL", str(7 * 24 * 3600)))
+WIKIPEDIA_API = "https://en.wikipedia.org/w/api.php"
+MAX_SECTION_CHARS = 1500
+
+_SECTION_HEADING = re.compile(r"^\s*(=+)\s*(.+?)\s*\1\s*$", re.MULTILINE)
+
+
+def split_sections(content: str) -> List[Tuple[str, str]]:
+    """
+    Split Wikipedia plain-text content into (heading, text) sections.
+    The lead section has an empty heading.
+    """
+    sections = []
+    last_heading, last_end = "", 0
+    for match in _SECTION_HEADING.finditer(content):
+        sections.append((last_heading, content[last_end:match.start()].strip()))
+        last_heading, last_end = match.group(2), match.end()
+    sections.append((last_heading, content[last_end:].strip()))
+    return [(h, t) for h, t in sections if t]
+
+
+def best_section(content: str, query: str) -> Tuple[str, str]:
+    """
+    Return the (heading, text) section with the most query-term overlap.
+    Falls back to the lead section when nothing matches.
+    """
+    sections = split_sections(content)
+    if not sections:
+        return "", content
+
+    terms = set(tokenize(query))
+    best, best_score = sections[0], 0.0
+    for heading, text in sections:
+        tokens = tokenize(heading + " " + text)
+        if not tokens:
+            continue
+        hits = sum(1 for t in tokens if t in terms)
+        # Weight heading matches and normalize so long sections don't always win
+        score = hits / (len(tokens) ** 0.5) + 2 * len(terms & set(tokenize(heading)))
+        if score > best_score:
+            best, best_score = (heading, text), score
+    return best
+
+
+class WikiPageStore:
+    """
+    SQLite cache of search results and page contents with a TTL.
+    """
+
+    def __init__(self, path: str = PAGE_STORE_PATH, ttl_seconds: int = WIKIPEDIA_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                title TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                content TEXT NOT NULL,
+                revision_id INTEGER,
+                fetched_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS aliases (
+                alias TEXT PRIMARY KEY,
+                title TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS searches (
+                query TEXT PRIMARY KEY,
+                titles TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _fresh(self, fetched_at: float) -> bool:
+        return time.time() - fetched_at <= self.ttl_seconds
+
+    def get_search(self, query: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT titles, fetched_at FROM searches WHERE query = ?", (query.lower(),)
+            ).fetchone()
+        if row and self._fresh(row[1]):
+            return json.loads(row[0])
+        return None
+
+    def put_search(self, query: str, titles: List[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches (query, titles, fetched_at) VALUES (?, ?, ?)",
+                (query.lower(), json.dumps(titles), time.time()),
+            )
+            self._conn.commit()
+
+    def get_page(self, title: str) -> Optional[dict]:
+        """
+        Return the stored page (fresh or not) with a 'fresh' flag, or None.
+
+        title may also be an alias (search title, redirect) of a stored page.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title, url, content, revision_id, fetched_at FROM pages "
+                "WHERE title = COALESCE((SELECT title FROM aliases WHERE alias = ?), ?)",
+                (title, title),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "title": row[0],
+            "url": row[1],
+            "content": row[2],
+            "revision_id": row[3],
+            "fresh": self._fresh(row[4]),
+        }
+
+    def put_page(self, title: str, url: str, content: str, revision_id: Optional[int],
+                 alias: Optional[str] = None) -> None:
+        """
+        Store a page under its resolved title; alias is the title it was requested by.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (title, url, content, revision_id, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (title, url, content, revision_id, time.time()),
+            )
+            if alias and alias != title:
+                self._conn.execute("INSERT OR REPLACE INTO aliases (alias, title) VALUES (?, ?)", (alias, title))
+            self._conn.commit()
+
+    def touch_page(self, title: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE pages SET fetched_at = ? WHERE title = ?", (time.time(), title))
+            self._conn.commit()
+
+
+class OfflineWikipedia:
+    """
+    Search and page lookup over a local JSONL extract, with no network access.
+    """
+
+    def __init__(self, path: str = OFFLINE_EXTRACT_PATH):
+        self.pages = {}
+        self.index = BM25Index()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        page = json.loads(line)
+                        self.pages[page["title"]] = page
+                        # Titles count double so "Battle of Stalingrad" ranks its own page first
+                        self.index.add(page["title"], f"{page['title']} {page['title']} {page['content']}")
+
+    def search(self, query: str, results: int = 3) -> List[str]:
+        return [title for title, _ in self.index.search(query, results)]
+
+    def page(self, title: str) -> Optional[dict]:
+        return self.pages.get(title)
+
+
+def _fetch_page(title: str) -> Optional[dict]:
+    """
+    Plain-text content, URL and revision of a page in one API request,
+    following redirects. None if the page does not exist.
+    """
+    import requests
+
+    response = requests.get(
+        WIKIPEDIA_API,
+        params={
+            "action": "query", "prop": "extracts|info", "explaintext": 1, "inprop": "url",
+            "redirects": 1, "titles": title, "format": "json",
+        },
+        timeout=10,
+    )
+    response.raise_for_status()
+    for page in response.json().get("query", {}).get("pages", {}).values():
+        if "missing" in page or "extract" not in page:
+            return None
+        return {
+            "title": page["title"],
+            "url": page.get("fullurl", ""),
+            "content": page["extract"],
+            "revision_id": page.get("lastrevid"),
+        }
+    return None
+
+
+def _wikipedia_search(query: str) -> List[str]:
+    import wikipedia
+    return wikipedia.search(query, results=3)
+
+
+def _latest_revision_id(title: str) -> Optional[int]:
+    """
+    Cheap metadata request used to revalidate an expired page.
+    """
+    import requests
+
+    response = requests.get(
+        WIKIPEDIA_API,
+        params={"action": "query", "prop": "info", "titles": title, "format": "json"},
+        timeout=5,
+    )
+    pages = response.json().get("query", {}).get("pages", {})
+    for page in pages.values():
+        return page.get("lastrevid")
+    return None
+
+
+class WikipediaClient:
+    """
+    Cached access to Wikipedia, optionally served entirely from the offline extract.
+
+    search_fn, fetch_page and revision_fn do the network requests and can be
+    replaced with stubs for tests.
+    """
+
+    def __init__(
+        self,
+        store: Optional[WikiPageStore] = None,
+        offline: Optional[OfflineWikipedia] = None,
+        search_fn: Callable[[str], List[str]] = _wikipedia_search,
+        fetch_page: Callable[[str], Optional[dict]] = _fetch_page,
+        revision_fn: Callable[[str], Optional[int]] = _latest_revision_id,
+    ):
+        self.store = store
+        self.offline = offline
+        self.search_fn = search_fn
+        self.fetch_page = fetch_page
+        self.revision_fn = revision_fn
+
+    def search(self, query: str) -> List[str]:
+        if self.offline is not None:
+            return self.offline.search(query)
+
+        cached = self.store.get_search(query)
+        count_cache("wikipedia_search", "hit" if cached is not None else "miss")
+        if cached is not None:
+            return cached
+
+        titles = self.search_fn(query)
+        self.store.put_search(query, titles)
+        return titles
+
+    def page(self, title: str) -> Optional[dict]:
+        if self.offline is not None:
+            return self.offline.page(title)
+
+        stored = self.store.get_page(title)
+        if stored is not None and stored["fresh"]:
+            count_cache("wikipedia_page", "hit")
+            return stored
+
+        if stored is not None and stored["revision_id"] is not None:
+            try:
+                if self.revision_fn(stored["title"]) == stored["revision_id"]:
+                    self.store.touch_page(stored["title"])
+                    count_cache("wikipedia_page", "revalidated")
+                    return stored
+            except Exception:
+                count_cache("wikipedia_page", "stale")
+                return stored  # Serve stale content rather than failing
+
+        count_cache("wikipedia_page", "miss")
+
+        try:
+            page = self.fetch_page(title)
+        except Exception:
+            if stored is None:
+                raise
+            count_cache("wikipedia_page", "stale")
+            return stored  # Offline: the expired copy is better than nothing
+        if page is None:
+            return None
+        self.store.put_page(page["title"], page["url"], page["content"], page["revision_id"], alias=title)
+        return page
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_wikipedia_client() -> WikipediaClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            if WIKIPEDIA_OFFLINE:
+                _client = WikipediaClient(offline=OfflineWikipedia())
+            else:
+                _client = WikipediaClient(store=WikiPageStore())
+        return _client
+
 
 class WikipediaSearchInput(BaseModel):
     """Input schema for WikipediaSearchTool."""
@@ -17,19 +340,70 @@ class WikipediaSearchTool(BaseTool):
     description: str = "Search Wikipedia for historical information about World War 2 topics"
     args_schema: Type[BaseModel] = WikipediaSearchInput
 
+    @traced("wikipedia.search")
     def _run(self, query: str) -> str:
         """Search Wikipedia for information."""
         try:
-            import wikipedia
-            results = wikipedia.search(query, results=3)
+            client = get_wikipedia_client()
+            results = client.search(query)
             if not results:
                 return f"No Wikipedia results found for '{query}'"
 
-            page = wikipedia.page(results[0])
-            summary = page.content[:1500] + "..."
-            return f"Wikipedia: {page.title}\n\n{summary}\n\nSource: {page.url}"
+            page = client.page(results[0])
+            if page is None:
+                return f"No Wikipedia results found for '{query}'"
+
+            heading, text = best_section(page["content"], query)
+            summary = text[:MAX_SECTION_CHARS] + ("..." if len(text) > MAX_SECTION_CHARS else "")
+            title = f"{page['title']} ({heading})" if heading else page["title"]
+            return f"Wikipedia: {title}\n\n{summary}\n\nSource: {page['url']}"
         except Exception as e:
             return f"Error searching Wikipedia: {str(e)}"
 
+
+def build_offline_extract(category: str, path: str = OFFLINE_EXTRACT_PATH, limit: int = 500) -> int:
+    """
+    Download the pages of a Wikipedia category into a JSONL extract for offline mode.
+    """
+    import requests
+    import wikipedia
+
+    titles, params = [], {
+        "action": "query",
+        "list": "categorymembers",
+        "cmtitle": f"Category:{category}",
+        "cmtype": "page",
+        "cmlimit": "max",
+        "format": "json",
+    }
+    while len(titles) < limit:
+        data = requests.get(WIKIPEDIA_API, params=params, timeout=10).json()
+        titles.extend(m["title"] for m in data.get("query", {}).get("categorymembers", []))
+        if "continue" not in data:
+            break
+        params.update(data["continue"])
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for title in titles[:limit]:
+            try:
+                page = wikipedia.page(title, auto_suggest=False)
+            except Exception:
+                continue
+            f.write(json.dumps({"title": page.title, "url": page.url, "content": page.content}) + "\n")
+            written += 1
+    return written
+
+
 wikipedia_tool = WikipediaSearchTool()
 search_tool = wikipedia_tool
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the offline Wikipedia extract.")
+    parser.add_argument("--category", default="World War II", help="Wikipedia category to download.")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--output", default=OFFLINE_EXTRACT_PATH)
+    args = parser.parse_args()
+    print(f"Wrote {build_offline_extract(args.category, args.output, args.limit)} pages to {args.output}")
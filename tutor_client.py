@@ -0,0 +1,44 @@
+"""
+Thin HTTP client for server.py, used by the Streamlit app when TUTOR_API_URL is set.
+"""
+import json
+import os
+from typing import Iterator, Optional
+
+import httpx
+
+TUTOR_API_URL = os.getenv("TUTOR_API_URL", "")
+
+
+def remote_stream_answer(
+    question: str,
+    history: Optional[str] = None,
+    mode: str = "Regular answer",
+    user_id: Optional[str] = None,
+    tenant: Optional[str] = None,
+    session_id: Optional[str] = None,
+    api_url: str = TUTOR_API_URL,
+    timeout: float = 180.0,
+) -> Iterator[dict]:
+    """
+    Call POST /ask/stream and yield the same events as agents.stream_answer().
+
+    user_id is the key of the server's per-user fair queue; it defaults to
+    session_id, so separate browser sessions are not lumped together as one user.
+    """
+    payload = {
+        "question": question, "history": history, "mode": mode,
+        "user_id": user_id or session_id or "anonymous", "tenant": tenant,
+        "session_id": session_id,
+    }
+    with httpx.stream("POST", f"{api_url.rstrip('/')}/ask/stream", json=payload, timeout=timeout) as response:
+        if response.status_code == 429:
+            raise RuntimeError("The tutor is busy right now, please try again in a few seconds.")
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "error":
+                raise RuntimeError(event["message"])
+            yield event